@@ -32,6 +32,21 @@ class Config:
         # Behavior settings
         self.delay_seconds: int = int(os.getenv('DELAY_SECONDS', '3'))
         self.messages_per_hour: int = int(os.getenv('MESSAGES_PER_HOUR', '30'))
+        
+        # НОВОЕ: Отдельные бюджеты классов операций (0 - без ограничения)
+        self.rate_text_per_hour: int = int(os.getenv('RATE_TEXT_PER_HOUR', str(self.messages_per_hour)))
+        self.rate_media_per_hour: int = int(os.getenv('RATE_MEDIA_PER_HOUR', str(self.messages_per_hour)))
+        self.rate_history_per_hour: int = int(os.getenv('RATE_HISTORY_PER_HOUR', '1200'))
+        self.rate_download_mb_per_hour: int = int(os.getenv('RATE_DOWNLOAD_MB_PER_HOUR', '0'))
+        
+        # НОВОЕ: Адаптивная скорость (AIMD): рост без FloodWait, снижение вдвое при FloodWait
+        self.adaptive_rate: bool = os.getenv('ADAPTIVE_RATE', 'true').lower() == 'true'
+        self.adaptive_rate_max_factor: float = float(os.getenv('ADAPTIVE_RATE_MAX_FACTOR', '3'))
+        
+        # НОВОЕ: Общий для процессов аккаунта журнал лимитов (копирование, очистка, служебные скрипты)
+        self.rate_ledger_file: str = os.getenv('RATE_LEDGER_FILE', 'rate_ledger.db')
+        self.rate_account_requests_per_hour: int = int(os.getenv('RATE_ACCOUNT_REQUESTS_PER_HOUR', '1500'))
+        
         self.dry_run: bool = os.getenv('DRY_RUN', 'false').lower() == 'true'
         
         # Session and storage
@@ -41,11 +56,63 @@ class Config:
         # Настройки трекинга сообщений
         self.use_message_tracker: bool = os.getenv("USE_MESSAGE_TRACKER", "true").lower() == "true"
         self.tracker_file: str = os.getenv("TRACKER_FILE", "copied_messages.json")
+        # НОВОЕ: Хранилище трекера: sqlite (база рядом с TRACKER_FILE, .db), json или columnar (.trk)
+        self.tracker_backend: str = os.getenv("TRACKER_BACKEND", "sqlite").lower()
+        # НОВОЕ: Докопирование пропусков ниже точки возобновления по манифесту ID источника
+        self.gap_detection: bool = os.getenv("GAP_DETECTION", "true").lower() == "true"
+        self.source_manifest_file: str = os.getenv("SOURCE_MANIFEST_FILE", "source_manifest.json")
+        # НОВОЕ: Очередь повторов неудачных сообщений (пустое значение - без очереди) и размер прохода за запуск
+        self.retry_queue_file: str = os.getenv("RETRY_QUEUE_FILE", "retry_queue.json")
+        self.retry_lane_limit: int = int(os.getenv("RETRY_LANE_LIMIT", "100"))
+        # НОВОЕ: Пакетная запись точки возобновления (раз в N сообщений или T секунд)
+        self.checkpoint_every_messages: int = int(os.getenv("CHECKPOINT_EVERY_MESSAGES", "20"))
+        self.checkpoint_every_seconds: float = float(os.getenv("CHECKPOINT_EVERY_SECONDS", "5"))
+        # НОВОЕ: Единое хранилище состояния (пустое значение - отдельные файлы last_message_id.txt и т.д.)
+        self.state_store_file: str = os.getenv("STATE_STORE_FILE", "copier_state.db")
+        # НОВОЕ: Журнал намерений отправки и сверка с концом целевого канала после сбоя
+        self.send_intent_journal: bool = os.getenv("SEND_INTENT_JOURNAL", "true").lower() == "true"
+        self.reconcile_tail_messages: int = int(os.getenv("RECONCILE_TAIL_MESSAGES", "50"))
+        # НОВОЕ: Дедупликация - емкость фильтров в памяти и срок хранения хешей
+        self.dedup_capacity: int = int(os.getenv("DEDUP_CAPACITY", "1000000"))
+        self.dedup_max_age_days: float = float(os.getenv("DEDUP_MAX_AGE_DAYS", "30"))
         self.add_debug_tags: bool = os.getenv("ADD_DEBUG_TAGS", "false").lower() == "true"
         
         # НОВОЕ: Настройка антивложенности
         self.flatten_structure = os.getenv('FLATTEN_STRUCTURE', 'false').lower() == 'true'
         
+        # НОВОЕ: Параллельная загрузка элементов альбома перед одной отправкой
+        self.album_upload_concurrency: int = int(os.getenv('ALBUM_UPLOAD_CONCURRENCY', '4'))
+        
+        # НОВОЕ: Ретрансляция больших файлов (скачивание частями сразу в загрузку)
+        self.relay_threshold_mb: int = int(os.getenv('RELAY_THRESHOLD_MB', '64'))
+        self.relay_buffer_parts: int = int(os.getenv('RELAY_BUFFER_PARTS', '8'))
+        self.relay_upload_workers: int = int(os.getenv('RELAY_UPLOAD_WORKERS', '4'))
+        
+        # НОВОЕ: Скачивание больших файлов с возобновлением (.part файлы в папке данных)
+        data_dir = '/app/data' if os.path.exists('/app/data') else '.'
+        self.resume_download_threshold_mb: int = int(os.getenv('RESUME_DOWNLOAD_THRESHOLD_MB', '16'))
+        self.resume_download_dir: str = os.getenv('RESUME_DOWNLOAD_DIR', os.path.join(data_dir, 'partial_downloads'))
+        self.resume_download_max_age_hours: int = int(os.getenv('RESUME_DOWNLOAD_MAX_AGE_HOURS', '72'))
+        
+        # НОВОЕ: Сколько часов продолжать незавершенную загрузку (части на сервере хранятся ограниченное время)
+        self.upload_resume_ttl_hours: float = float(os.getenv('UPLOAD_RESUME_TTL_HOURS', '6'))
+        
+        # НОВОЕ: Дисковый LRU кэш скачанных медиа
+        self.media_cache_mb: int = int(os.getenv('MEDIA_CACHE_MB', '512'))
+        self.media_cache_dir: str = os.getenv('MEDIA_CACHE_DIR', os.path.join(data_dir, 'media_cache'))
+        
+        # НОВОЕ: Бюджет памяти под медиа, одновременно находящиеся в процессе
+        self.media_memory_budget_mb: int = int(os.getenv('MEDIA_MEMORY_BUDGET_MB', '256'))
+        
+        # НОВОЕ: Сколько следующих сообщений/альбомов загружать заранее, пока идет отправка текущего
+        self.upload_ahead_window: int = int(os.getenv('UPLOAD_AHEAD_WINDOW', '3'))
+        
+        # НОВОЕ: Во время долгого FloodWait скачивать следующие медиа в дисковый кэш
+        self.flood_wait_read_ahead: bool = os.getenv('FLOOD_WAIT_READ_AHEAD', 'true').lower() == 'true'
+        
+        # НОВОЕ: Сколько идущих подряд текстовых сообщений отправлять одним контейнером (1 - выключено)
+        self.text_batch_size: int = int(os.getenv('TEXT_BATCH_SIZE', '10'))
+        
         # Logging settings
         self.log_level: str = os.getenv('LOG_LEVEL', 'INFO').upper()
         
@@ -53,6 +120,11 @@ class Config:
         self.deletion_batch_size: int = int(os.getenv('DELETION_BATCH_SIZE', '100'))
         self.deletion_messages_per_hour: int = int(os.getenv('DELETION_MESSAGES_PER_HOUR', '6000'))
         self.deletion_delay_seconds: int = int(os.getenv('DELETION_DELAY_SECONDS', '1'))
+        # НОВОЕ: Пакет удаления - один запрос; по умолчанию сохраняется прежний темп в сообщениях
+        self.deletion_requests_per_hour: int = int(os.getenv(
+            'DELETION_REQUESTS_PER_HOUR',
+            str(max(1, self.deletion_messages_per_hour // max(1, self.deletion_batch_size)))
+        ))
         self.deletion_timeout_seconds: int = int(os.getenv('DELETION_TIMEOUT_SECONDS', '30'))
         self.deletion_max_range_warning: int = int(os.getenv('DELETION_MAX_RANGE_WARNING', '50000'))
         self.deletion_default_start_id: int = int(os.getenv('DELETION_DEFAULT_START_ID', '1'))
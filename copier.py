@@ -6,8 +6,9 @@
 import asyncio
 import logging
 import os
-from typing import List, Optional, Union, Dict, Any
+from typing import List, Optional, Union, Dict, Any, Callable, Awaitable
 from telethon import TelegramClient
+from telethon import utils as telethon_utils
 from telethon.tl.types import (
     Message, MessageMediaPhoto, MessageMediaDocument, 
     MessageMediaWebPage, InputMediaPhoto, InputMediaDocument,
@@ -16,17 +17,26 @@ from telethon.tl.types import (
     MessageEntityCode, MessageEntityPre, MessageEntityStrike,
     MessageEntityUnderline, MessageEntitySpoiler, MessageEntityBlockquote,
     ChannelParticipantAdmin, ChannelParticipantCreator, PeerChannel,
-    DocumentAttributeFilename
+    DocumentAttributeFilename, UpdateMessageID, UpdateShortSentMessage
 )
 import io
-from telethon.errors import FloodWaitError, PeerFloodError, MediaInvalidError
+from telethon.errors import FloodWaitError, PeerFloodError, MediaInvalidError, FileReferenceExpiredError, FilePartMissingError, MultiError
+from telethon.helpers import generate_random_long
 from telethon.tl import functions
 # from telethon.tl.functions.channels import GetParticipantRequest - убрано, используем get_permissions
 from telethon.tl.functions.messages import GetHistoryRequest
-from utils import (RateLimiter, handle_flood_wait, handle_media_flood_wait, save_last_message_id, save_flood_wait_state, 
-                   load_flood_wait_state, ProgressTracker, sanitize_filename, format_file_size, MessageDeduplicator, PerformanceMonitor)
+from utils import (RateLimiter, handle_flood_wait, handle_media_flood_wait, CheckpointWriter, save_flood_wait_state, 
+                   load_flood_wait_state, flood_wait_resume_state, set_state_store, ProgressTracker, sanitize_filename, format_file_size, MessageDeduplicator, PerformanceMonitor,
+                   MemoryBudget, add_flood_wait_listener, remove_flood_wait_listener, flood_wait_coordinator)
 from album_handler import AlbumHandler
 from message_tracker import MessageTracker
+from gap_detector import IntervalSet, SourceManifest
+from state_store import StateStore
+from send_journal import SendIntentJournal
+from retry_queue import RetryQueue, classify_failure, EXPIRED_REFERENCE, MEDIA_INVALID, FLOOD, UNKNOWN
+from media_builder import MediaBuilder
+from media_transfer import StreamingRelay, ResumableDownloader, ResumableUploader, BIG_FILE_THRESHOLD
+from media_cache import MediaCache
 
 
 class TelegramCopier:
@@ -34,8 +44,20 @@ class TelegramCopier:
     
     def __init__(self, client: TelegramClient, source_group_id: str, target_group_id: str,
                  rate_limiter: RateLimiter, dry_run: bool = False, resume_file: str = 'last_message_id.txt',
-                 use_message_tracker: bool = True, tracker_file: str = 'copied_messages.json', 
-                 add_debug_tags: bool = False, flatten_structure: bool = False):
+                 use_message_tracker: bool = True, tracker_file: str = 'copied_messages.json', tracker_backend: str = 'sqlite',
+                 add_debug_tags: bool = False, flatten_structure: bool = False,
+                 album_upload_concurrency: int = 4, relay_threshold_mb: int = 64,
+                 relay_buffer_parts: int = 8, relay_upload_workers: int = 4,
+                 resume_download_threshold_mb: int = 16, resume_download_dir: str = 'partial_downloads',
+                 resume_download_max_age_hours: int = 72, upload_resume_ttl_hours: float = 6,
+                 media_cache_mb: int = 512, media_cache_dir: str = 'media_cache',
+                 media_memory_budget_mb: int = 256, upload_ahead_window: int = 3,
+                 flood_wait_read_ahead: bool = True, text_batch_size: int = 10,
+                 gap_detection: bool = True, source_manifest_file: str = 'source_manifest.json',
+                 retry_queue_file: Optional[str] = 'retry_queue.json', retry_lane_limit: int = 100,
+                 checkpoint_every_messages: int = 20, checkpoint_every_seconds: float = 5.0,
+                 state_store_file: Optional[str] = 'copier_state.db', send_intent_journal: bool = True,
+                 reconcile_tail_messages: int = 50, dedup_capacity: int = 1_000_000, dedup_max_age_days: float = 30):
         """
         Инициализация копировщика.
         
@@ -48,8 +70,34 @@ class TelegramCopier:
             resume_file: Файл для сохранения прогресса
             use_message_tracker: Использовать ли детальный трекинг сообщений
             tracker_file: Файл для хранения информации о скопированных сообщениях
+            tracker_backend: Хранилище трекера (sqlite, json или columnar)
             add_debug_tags: Добавлять ли debug теги к сообщениям
             flatten_structure: Превращать ли вложенность в плоскую структуру (антивложенность)
+            album_upload_concurrency: Максимум параллельных загрузок элементов одного альбома
+            relay_threshold_mb: Размер документа (МБ), начиная с которого включается ретрансляция (0 - выключено)
+            relay_buffer_parts: Емкость буфера ретрансляции в частях по 512 КБ
+            relay_upload_workers: Параллельные загрузчики частей при ретрансляции
+            resume_download_threshold_mb: Размер документа (МБ) для скачивания с возобновлением (0 - выключено)
+            resume_download_dir: Папка для .part файлов незавершенных скачиваний
+            resume_download_max_age_hours: Через сколько часов удалять брошенные .part файлы
+            upload_resume_ttl_hours: Сколько часов продолжать незавершенную загрузку (окно хранения частей на сервере)
+            media_cache_mb: Объем дискового кэша скачанных медиа в МБ (0 - выключено)
+            media_cache_dir: Папка дискового кэша медиа
+            media_memory_budget_mb: Максимум МБ медиа в памяти одновременно (0 - без ограничения)
+            upload_ahead_window: Сколько следующих единиц загружать заранее (0 - выключено)
+            flood_wait_read_ahead: Скачивать следующие медиа в кэш во время FloodWait
+            text_batch_size: Сколько идущих подряд текстовых сообщений отправлять одним контейнером (1 - выключено)
+            gap_detection: Докопировать пропущенные сообщения ниже точки возобновления (нужен трекер)
+            source_manifest_file: Файл манифеста ID исходного канала для поиска пропусков
+            retry_queue_file: Файл очереди повторов неудачных сообщений (None - без очереди)
+            retry_lane_limit: Сколько записей очереди повторов обрабатывать за запуск
+            checkpoint_every_messages: Записывать точку возобновления раз в столько сообщений
+            checkpoint_every_seconds: Максимальная задержка записи точки возобновления в секундах
+            state_store_file: База единого хранилища состояния (None - отдельные файлы состояния)
+            send_intent_journal: Записывать намерение перед каждой отправкой (нужно хранилище состояния)
+            reconcile_tail_messages: Сколько последних сообщений цели сверять с намерениями при запуске
+            dedup_capacity: Ожидаемое число хешей дедупликации за поколение (размер фильтров в памяти)
+            dedup_max_age_days: Срок хранения хешей дедупликации в днях
         """
         self.client = client
         self.source_group_id = source_group_id
@@ -68,12 +116,78 @@ class TelegramCopier:
         self.failed_messages = 0
         self.skipped_messages = 0
         
+        # НОВОЕ: Единое хранилище состояния пары источник/цель (точка возобновления, FloodWait, дедупликация)
+        self.state_store: Optional[StateStore] = None
+        if state_store_file:
+            self.state_store = StateStore(state_store_file, f"{source_group_id}:{target_group_id}")
+            self.state_store.import_legacy(resume_file)
+        set_state_store(self.state_store)
+        # НОВОЕ: Намерения отправки - после сбоя отправленное, но не записанное, не отправляется повторно
+        self.send_journal: Optional[SendIntentJournal] = None
+        if send_intent_journal and self.state_store:
+            self.send_journal = SendIntentJournal(self.state_store, reconcile_tail_messages)
+        
         # НОВЫЕ КОМПОНЕНТЫ: Дедупликация и мониторинг
-        self.deduplicator = MessageDeduplicator()
+        # НОВОЕ: Хеши - в хранилище состояния (без него - в отдельной базе), в памяти только фильтры
+        dedup_store = self.state_store or StateStore('processed_messages.db', f"{source_group_id}:{target_group_id}")
+        self.deduplicator = MessageDeduplicator(dedup_store, capacity=dedup_capacity, max_age_days=dedup_max_age_days)
         self.performance_monitor = PerformanceMonitor()
         
         # Обработчик альбомов
         self.album_handler = AlbumHandler(client)
+        
+        # НОВОЕ: Построитель медиа без скачивания (source_entity задается в initialize)
+        self.media_builder = MediaBuilder()
+        
+        # НОВОЕ: Параллельная загрузка элементов альбома
+        self.album_upload_concurrency = max(1, album_upload_concurrency)
+        
+        # НОВОЕ: Загрузка больших файлов с продолжением после FloodWait и перезапуска
+        self.media_uploader = ResumableUploader(
+            client,
+            directory=resume_download_dir,
+            retention_hours=upload_resume_ttl_hours,
+            upload_workers=relay_upload_workers
+        )
+        
+        # НОВОЕ: Ретрансляция больших файлов (скачивание и загрузка идут одновременно)
+        self.media_relay = StreamingRelay(
+            client,
+            self.media_uploader,
+            threshold_bytes=relay_threshold_mb * 1024 * 1024,
+            buffer_parts=relay_buffer_parts
+        )
+        
+        # НОВОЕ: Скачивание больших файлов с возобновлением после перезапуска
+        self.resumable_downloader = ResumableDownloader(
+            client,
+            directory=resume_download_dir,
+            threshold_bytes=resume_download_threshold_mb * 1024 * 1024
+        )
+        self.resumable_downloader.cleanup_stale(resume_download_max_age_hours)
+        
+        # НОВОЕ: Дисковый кэш скачанных медиа (повторы и перезапуски не скачивают файл заново)
+        self.media_cache = MediaCache(media_cache_dir, max_bytes=media_cache_mb * 1024 * 1024)
+        # ИСПРАВЛЕНО: В кэш пишутся только скачанные заранее и повторяемые медиа -
+        # отправленное с первой попытки больше не понадобится
+        self._cache_downloads = False
+        
+        # НОВОЕ: Общий бюджет памяти под скачанные медиа (пиковое потребление задается настройкой)
+        self.memory_budget = MemoryBudget(media_memory_budget_mb * 1024 * 1024)
+        
+        # НОВОЕ: Окно загрузки заранее - медиа следующих единиц готовятся в фоне
+        self.upload_ahead_window = max(0, upload_ahead_window)
+        self._staged: Dict[tuple, asyncio.Task] = {}
+        self._processing_units: List[List[Message]] = []
+        self._unit_position = 0
+        
+        # НОВОЕ: Во время FloodWait отправка стоит, но скачивание из источника продолжается
+        self.flood_wait_read_ahead = flood_wait_read_ahead
+        self._active_flood_waits = 0
+        self._read_ahead_task: Optional[asyncio.Task] = None
+        
+        # НОВОЕ: Серии текстовых сообщений отправляются одним контейнером MTProto
+        self.text_batch_size = max(1, text_batch_size)
 
         # Настройки трекинга
         self.use_message_tracker = use_message_tracker
@@ -86,12 +200,33 @@ class TelegramCopier:
         
         # Инициализация трекера сообщений
         if self.use_message_tracker:
-            self.message_tracker = MessageTracker(tracker_file)
-            self.logger.info(f"✅ Включен детальный трекинг сообщений: {tracker_file}")
+            self.message_tracker = MessageTracker(tracker_file, backend=tracker_backend)
+            self.logger.info(f"✅ Включен детальный трекинг сообщений: {tracker_file} ({tracker_backend})")
         else:
             self.message_tracker = None
             self.logger.info("ℹ️ Используется простой трекинг (last_message_id.txt)")
         
+        # НОВОЕ: Манифест ID источника - по нему и трекеру находятся пропуски ниже точки возобновления
+        self.source_manifest: Optional[SourceManifest] = None
+        if gap_detection and self.message_tracker:
+            self.source_manifest = SourceManifest(source_manifest_file, str(source_group_id))
+            # ИСПРАВЛЕНО: В режиме антивложенности трекер хранит и ID комментариев из группы
+            # обсуждения - манифест источника из него не заполняется, ID придут при сканировании
+            if self.source_manifest.is_new and not self.flatten_structure:
+                # Первый запуск с манифестом: известные трекеру сообщения (в том числе неудачные)
+                self.source_manifest.add_many(self.message_tracker.get_tracked_ids())
+        
+        # НОВОЕ: Неудачные сообщения повторяются после основного прохода с задержкой по классу ошибки
+        self.retry_queue = RetryQueue(retry_queue_file) if retry_queue_file else None
+        self.retry_lane_limit = max(0, retry_lane_limit)
+        # Класс и текст последней ошибки копирования (для очереди повторов)
+        self._last_failure: Optional[tuple] = None
+        # Точка возобновления в файле прогресса (пропуски и повторы ниже нее ее не сдвигают)
+        self._progress_id = 0
+        # НОВОЕ: Точка возобновления пишется пакетами в пуле потоков, а не fsync на каждое сообщение
+        self.checkpoint = CheckpointWriter(resume_file, checkpoint_every_messages, checkpoint_every_seconds,
+                                           store=self.state_store)
+        
         # Очистка старых хешей при инициализации
         self.deduplicator.cleanup_old_hashes()
     
@@ -121,6 +256,8 @@ class TelegramCopier:
                 else:
                     raise e
             
+            self.media_builder.source_entity = self.source_entity
+            
             # Проверяем доступ к исходной группе/каналу
             try:
                 # Пытаемся получить хотя бы одно сообщение для проверки доступа
@@ -234,6 +371,7 @@ class TelegramCopier:
                 return 0
             
             # Получаем информацию об истории с максимальным ID
+            await flood_wait_coordinator.wait('history')
             history = await self.client(GetHistoryRequest(
                 peer=self.source_entity,
                 offset_id=0,
@@ -460,48 +598,46 @@ class TelegramCopier:
             self.logger.info("🔗 Режим с вложенностью: комментарии сохранят связь с основными постами")
         
         # НОВОЕ: Проверяем состояние FloodWait при запуске
-        flood_state = load_flood_wait_state()
-        if flood_state:
-            # Было прерывание из-за FloodWait, проверяем можно ли возобновить
-            flood_resume_id = flood_state.get('message_id')
-            if flood_resume_id and not resume_from_id:
-                # ИСПРАВЛЕНИЕ: Обрабатываем как альбомы так и одиночные сообщения
-                if isinstance(flood_resume_id, str) and flood_resume_id.startswith('Album '):
-                    # Это альбом, извлекаем последний ID из диапазона "Album 12111-12112"
-                    try:
-                        album_range = flood_resume_id.replace('Album ', '')
-                        if '-' in album_range:
-                            start_id, end_id = album_range.split('-')
-                            resume_from_id = int(end_id)  # Возобновляем с последнего ID альбома
-                            self.logger.warning(f"🔄 Возобновление после FloodWait альбома {flood_resume_id}, начинаем с ID:{resume_from_id}")
-                        else:
-                            resume_from_id = int(album_range)
-                            self.logger.warning(f"🔄 Возобновление после FloodWait альбома {flood_resume_id}, начинаем с ID:{resume_from_id}")
-                    except (ValueError, IndexError) as e:
-                        self.logger.error(f"❌ Ошибка парсинга ID альбома из FloodWait состояния '{flood_resume_id}': {e}")
-                        self.logger.warning("⚠️ Игнорируем некорректное состояние FloodWait, начинаем сначала")
-                        flood_resume_id = None
-                elif isinstance(flood_resume_id, (int, str)):
-                    # Это одиночное сообщение
-                    try:
-                        resume_from_id = int(flood_resume_id)
-                        self.logger.warning(f"🔄 Возобновление после FloodWait с сообщения ID:{resume_from_id}")
-                    except ValueError as e:
-                        self.logger.error(f"❌ Ошибка парсинга ID сообщения из FloodWait состояния '{flood_resume_id}': {e}")
-                        self.logger.warning("⚠️ Игнорируем некорректное состояние FloodWait, начинаем сначала")
-                        flood_resume_id = None
+        if self.state_store:
+            # Точка возобновления и состояние FloodWait - одно согласованное чтение хранилища
+            resume_state = self.state_store.load_resume_state()
+            if not resume_from_id:
+                resume_from_id = resume_state['checkpoint']
+            flood_state = flood_wait_resume_state(resume_state['flood_wait'])
+            if flood_state:
+                self.state_store.commit(delete=['flood_wait'])
+        else:
+            flood_state = load_flood_wait_state()
+        if flood_state and not resume_from_id:
+            # Было прерывание из-за FloodWait: возобновляем с сообщения перед прерванным (альбом - целиком)
+            resume_from_id = flood_state['resume_id']
+            self.logger.warning(f"🔄 Возобновление после FloodWait сообщений {flood_state['message_ids']}, начинаем после ID:{resume_from_id}")
 
-        # Определяем начальную позицию
-        if self.message_tracker and not resume_from_id:
-            # Используем трекер для определения последнего ID
-            last_copied_id = self.message_tracker.get_last_copied_id()
-            if last_copied_id:
-                resume_from_id = last_copied_id
-                self.logger.info(f"📊 Трекер: последний скопированный ID {last_copied_id}")
-        
-        min_id = resume_from_id if resume_from_id else 0
-        
         try:
+            # ИСПРАВЛЕНО: Сверка внутри try - ошибка чтения цели не обходит сохранение состояния в finally
+            # НОВОЕ: Отправленные перед сбоем, но не записанные единицы находятся в конце целевого канала
+            reconciled_id = await self._reconcile_send_intents()
+            if reconciled_id > (resume_from_id or 0):
+                resume_from_id = reconciled_id
+                self.checkpoint.update(reconciled_id)
+            
+            # Определяем начальную позицию
+            # ИСПРАВЛЕНО: С хранилищем состояния точка возобновления читается только из него -
+            # трекер живет в отдельной базе и не согласован с его транзакциями
+            if self.message_tracker and not self.state_store:
+                # Используем трекер для определения последнего ID
+                # ИСПРАВЛЕНО: файл прогресса пишется пакетами и после сбоя может отставать от трекера
+                last_copied_id = self.message_tracker.get_last_copied_id()
+                if last_copied_id and last_copied_id > (resume_from_id or 0):
+                    resume_from_id = last_copied_id
+                    self.logger.info(f"📊 Трекер: последний скопированный ID {last_copied_id}")
+            
+            min_id = resume_from_id if resume_from_id else 0
+            self._progress_id = min_id
+            
+            # НОВОЕ: Пропуски ниже точки возобновления (неудачные и недокопированные сообщения)
+            gap_messages = await self._collect_gap_messages(min_id) if min_id else []
+            
             # НОВАЯ АРХИТЕКТУРА: Правильная группировка альбомов
             # Сначала собираем ВСЕ сообщения, затем группируем по альбомам
             self.logger.info("🔄 Начинаем сбор сообщений для правильной группировки альбомов")
@@ -525,10 +661,11 @@ class TelegramCopier:
                     has_new_messages = True
                     break
                 
-                if not has_new_messages:
+                if not has_new_messages and not gap_messages:
                     self.logger.info(f"🎯 Новых сообщений после ID {min_id} не найдено. Копирование актуально.")
+                    await self._run_retry_lane()
                     return {
-                        'total_messages': total_messages,
+                        'total_messages': total_messages_in_channel,
                         'copied_messages': 0,
                         'failed_messages': 0,
                         'skipped_messages': 0,
@@ -539,25 +676,38 @@ class TelegramCopier:
                 iter_params['min_id'] = min_id  # Исключает сообщения с ID <= min_id
             
             # ЭТАП 1: Собираем все сообщения для правильной группировки
-            all_messages = []
+            # НОВОЕ: Сначала пропуски (по возрастанию ID), затем новые сообщения
+            all_messages = list(gap_messages)
             message_count = 0
             
             async for message in self.client.iter_messages(**iter_params):
                 message_count += 1
                 
+                # НОВОЕ: Telethon читает историю пакетами по 100 сообщений - один запрос на пакет
+                if message_count % 100 == 1:
+                    await self.rate_limiter.wait_if_needed('history')
+                    self.rate_limiter.record_message_sent('history')
+                
                 # Проверка дедупликации
                 if self.deduplicator.is_message_processed(message):
                     self.logger.info(f"⏭️ Пропускаем сообщение {message.id} (уже обработано ранее)")
                     self.skipped_messages += 1
+                    # ИСПРАВЛЕНО: Пропущенное дедупликацией не копируется - и не считается пропуском
+                    if self.source_manifest:
+                        self.source_manifest.discard(message.id)
                     continue
                 
                 all_messages.append(message)
+                if self.source_manifest and (message.message or message.media):
+                    self.source_manifest.add(message.id)
                 
                 # Логируем прогресс каждые 1000 сообщений
                 if len(all_messages) % 1000 == 0:
                     self.logger.info(f"Собрано {len(all_messages)} сообщений для обработки...")
             
             self.logger.info(f"Всего собрано {len(all_messages)} основных сообщений")
+            if self.source_manifest:
+                self.source_manifest.save()
             
             # Инициализируем переменную comments_collected для использования в последующих блоках
             comments_collected = 0
@@ -680,8 +830,30 @@ class TelegramCopier:
             progress_tracker = ProgressTracker(len(all_messages))
             self.logger.info(f"🔄 Инициализирован прогресс для {len(all_messages)} сообщений (включая сообщения в альбомах)")
             
+            # НОВОЕ: Единицы обработки в порядке отправки - для загрузки медиа заранее
+            self._processing_units = []
+            seen_albums = set()
+            for message in all_messages:
+                if hasattr(message, 'grouped_id') and message.grouped_id:
+                    if message.grouped_id not in seen_albums:
+                        seen_albums.add(message.grouped_id)
+                        self._processing_units.append(sorted(grouped_messages[message.grouped_id], key=lambda x: x.id))
+                else:
+                    self._processing_units.append([message])
+            self._unit_position = 0
+            
+            # НОВОЕ: Узнаем о начале и конце FloodWait, чтобы скачивать медиа во время паузы
+            add_flood_wait_listener(self._on_flood_wait)
+            
+            # НОВОЕ: Сообщения, уже отправленные в составе серии текстовых сообщений
+            batched_message_ids = set()
+            
             # ЭТАП 3: Обрабатываем сообщения в ИСХОДНОМ ПОРЯДКЕ
             for message in all_messages:
+                if message.id in batched_message_ids:
+                    self._unit_position += 1
+                    continue
+                
                 try:
                     # НОВОЕ: Определяем тип сообщения (основное или комментарий)
                     # Комментарии могут быть либо обычными reply, либо из discussion group
@@ -696,6 +868,10 @@ class TelegramCopier:
                         if grouped_id in processed_albums:
                             continue
                         
+                        # НОВОЕ: Пока копируется альбом, следующие единицы загружаются в фоне
+                        self._unit_position += 1
+                        self._stage_ahead(self._processing_units[self._unit_position:])
+                        
                         # Обрабатываем весь альбом целиком
                         album_messages = grouped_messages[grouped_id]
                         album_messages.sort(key=lambda x: x.id)  # Сортируем по ID для правильного порядка
@@ -730,25 +906,30 @@ class TelegramCopier:
                             
                             # Записываем ID последнего сообщения альбома
                             last_album_message_id = max(msg.id for msg in album_messages)
-                            save_last_message_id(last_album_message_id, self.resume_file)
+                            self._save_progress(last_album_message_id)
                             self.logger.debug(f"💾 Записан последний ID: {last_album_message_id} после успешного копирования альбома")
                         else:
                             self.failed_messages += len(album_messages)
                             album_status = "❌ не удалось скопировать" if not is_comment else "❌ не удалось скопировать (комментарий)"
                             album_ids = [msg.id for msg in album_messages]
                             self.logger.warning(f"{album_status}: альбом {grouped_id} (ID: {album_ids[0]}-{album_ids[-1]})")
+                            self._record_failure(album_messages)
                         
                         # Помечаем альбом как обработанный
                         processed_albums.add(grouped_id)
                         
-                        # Соблюдаем лимиты скорости
+                        # Соблюдаем лимиты скорости (альбом - один запрос отправки медиа)
                         if not self.dry_run:
-                            await self.rate_limiter.wait_if_needed()
+                            await self.rate_limiter.wait_if_needed('media')
                             if success:
-                                self.rate_limiter.record_message_sent()
+                                self.rate_limiter.record_message_sent('media')
                     
                     else:
                         # Обычное одиночное сообщение (основное или комментарий)
+                        # НОВОЕ: Пока копируется сообщение, следующие единицы загружаются в фоне
+                        self._unit_position += 1
+                        self._stage_ahead(self._processing_units[self._unit_position:])
+                        
                         # Вычисляем размер сообщения для мониторинга
                         message_size = 0
                         if message.media and hasattr(message.media, 'document') and message.media.document:
@@ -764,6 +945,24 @@ class TelegramCopier:
                         else:
                             self.logger.info(f"📝 Обрабатываем {message_type} ID:{message.id}")
                         
+                        # НОВОЕ: Серия текстовых сообщений уходит одним контейнером, неотправленные копируются по одному
+                        text_run = self._collect_text_run(message)
+                        if len(text_run) > 1:
+                            sent_ids = await self._send_text_run(text_run)
+                            for run_message, sent_id in zip(text_run, sent_ids):
+                                if sent_id is None:
+                                    continue
+                                batched_message_ids.add(run_message.id)
+                                progress_tracker.update(True)
+                                self.performance_monitor.record_message_processed(True, len(run_message.message.encode('utf-8')))
+                                self.copied_messages += 1
+                                self._save_progress(run_message.id)
+                                self.rate_limiter.record_message_sent('text')
+                            if message.id in batched_message_ids:
+                                self.logger.info(f"📦 Серия текстовых сообщений: отправлено {sum(1 for sent_id in sent_ids if sent_id is not None)} из {len(text_run)} одним контейнером (ID: {text_run[0].id}-{text_run[-1].id})")
+                                await self.rate_limiter.wait_if_needed('text')
+                                continue
+                        
                         # Копируем сообщение
                         success = await self.copy_single_message(message)
                         progress_tracker.update(success)
@@ -775,20 +974,24 @@ class TelegramCopier:
                             self.copied_messages += 1
                             success_status = "✅ успешно скопировано" if not is_comment else "✅ успешно скопировано (комментарий)"
                             self.logger.info(f"{success_status}: сообщение ID:{message.id}")
-                            save_last_message_id(message.id, self.resume_file)
+                            self._save_progress(message.id)
                             self.logger.debug(f"💾 Записан последний ID: {message.id} после успешного копирования")
                         else:
                             self.failed_messages += 1
                             fail_status = "❌ не удалось скопировать" if not is_comment else "❌ не удалось скопировать (комментарий)"
                             self.logger.warning(f"{fail_status}: сообщение ID:{message.id}")
+                            self._record_failure([message])
                         
                         # Соблюдаем лимиты скорости
                         if not self.dry_run:
-                            await self.rate_limiter.wait_if_needed()
+                            send_class = self._send_class(message)
+                            await self.rate_limiter.wait_if_needed(send_class)
                             if success:
-                                self.rate_limiter.record_message_sent()
+                                self.rate_limiter.record_message_sent(send_class)
                 
                 except FloodWaitError as e:
+                    # НОВОЕ: FloodWait снижает выученный бюджет класса операции
+                    self.rate_limiter.record_flood_wait('media' if getattr(message, 'grouped_id', None) else self._send_class(message), e.seconds)
                     await handle_flood_wait(e, self.logger)
                     # Повторяем попытку для текущего сообщения
                     if hasattr(message, 'grouped_id') and message.grouped_id and message.grouped_id not in processed_albums:
@@ -805,13 +1008,14 @@ class TelegramCopier:
                             self.copied_messages += len(album_messages)
                             self.logger.info(f"✅ Альбом {grouped_id} успешно скопирован после FloodWait")
                             last_album_message_id = max(msg.id for msg in album_messages)
-                            save_last_message_id(last_album_message_id, self.resume_file)
+                            self._save_progress(last_album_message_id)
                             self.logger.debug(f"Записан ID {last_album_message_id} после успешного копирования альбома (FloodWait)")
                             if not self.dry_run:
-                                self.rate_limiter.record_message_sent()
+                                self.rate_limiter.record_message_sent('media')
                         else:
                             self.failed_messages += len(album_messages)
                             self.logger.warning(f"❌ Не удалось скопировать альбом {grouped_id} даже после FloodWait")
+                            self._record_failure(album_messages)
                         
                         processed_albums.add(grouped_id)
                         
@@ -823,13 +1027,14 @@ class TelegramCopier:
                         if success:
                             self.copied_messages += 1
                             self.logger.debug(f"✅ Сообщение {message.id} успешно скопировано после FloodWait")
-                            save_last_message_id(message.id, self.resume_file)
+                            self._save_progress(message.id)
                             self.logger.debug(f"Записан ID {message.id} после успешного копирования (FloodWait)")
                             if not self.dry_run:
-                                self.rate_limiter.record_message_sent()
+                                self.rate_limiter.record_message_sent(self._send_class(message))
                         else:
                             self.failed_messages += 1
                             self.logger.warning(f"❌ Не удалось скопировать сообщение {message.id} даже после FloodWait")
+                            self._record_failure([message])
                 
                 except (PeerFloodError, MediaInvalidError) as e:
                     if hasattr(message, 'grouped_id') and message.grouped_id:
@@ -838,12 +1043,14 @@ class TelegramCopier:
                             album_messages = grouped_messages[grouped_id]
                             self.logger.warning(f"Telegram API ошибка для альбома {grouped_id}: {e}")
                             self.failed_messages += len(album_messages)
+                            self._record_failure(album_messages, classify_failure(e), str(e))
                             for msg in album_messages:
                                 progress_tracker.update(False)
                             processed_albums.add(grouped_id)
                     else:
                         self.logger.warning(f"Telegram API ошибка для сообщения {message.id}: {e}")
                         self.failed_messages += 1
+                        self._record_failure([message], classify_failure(e), str(e))
                         progress_tracker.update(False)
                 
                 except Exception as e:
@@ -853,20 +1060,41 @@ class TelegramCopier:
                             album_messages = grouped_messages[grouped_id]
                             self.logger.error(f"Неожиданная ошибка копирования альбома {grouped_id}: {type(e).__name__}: {e}")
                             self.failed_messages += len(album_messages)
+                            self._record_failure(album_messages, classify_failure(e), str(e))
                             for msg in album_messages:
                                 progress_tracker.update(False)
                             processed_albums.add(grouped_id)
                     else:
                         self.logger.error(f"Неожиданная ошибка копирования сообщения {message.id}: {type(e).__name__}: {e}")
                         self.failed_messages += 1
+                        self._record_failure([message], classify_failure(e), str(e))
                         progress_tracker.update(False)
             
             self.logger.info(f"✅ Обработано {len(all_messages)} сообщений в исходном порядке")
+            
+            # НОВОЕ: Повторы неудачных сообщений - после основного прохода, чтобы не задерживать его
+            await self._run_retry_lane()
         
         except Exception as e:
             self.logger.error(f"Критическая ошибка при копировании: {e}")
             return {'error': str(e)}
         
+        finally:
+            remove_flood_wait_listener(self._on_flood_wait)
+            self.rate_limiter.save_state()
+            if self.retry_queue:
+                self.retry_queue.save()
+            if self.message_tracker:
+                self.message_tracker.flush()
+            # НОВОЕ: Незаписанная точка возобновления сохраняется при любом завершении
+            self.checkpoint.close()
+            if self.send_journal:
+                # Трекер и точка возобновления записаны - намерения отправленных единиц больше не нужны
+                self.send_journal.clear_settled()
+            self.deduplicator.save_processed_messages()
+            self._stop_read_ahead()
+            self._cancel_staged()
+        
         # Получаем финальную статистику
         final_stats = progress_tracker.get_final_stats()
         final_stats.update({
@@ -908,6 +1136,7 @@ class TelegramCopier:
         """
         try:
             # Получаем информацию об истории целевого канала
+            await flood_wait_coordinator.wait('history')
             history = await self.client(GetHistoryRequest(
                 peer=self.target_entity,
                 offset_id=0,
@@ -1014,6 +1243,7 @@ class TelegramCopier:
             self.logger.debug(f"   Обновляемые ID: {message_ids}")
             
             # Получаем свежие копии сообщений из источника
+            await flood_wait_coordinator.wait('history')
             fresh_messages = await self.client.get_messages(self.source_entity, ids=message_ids)
             
             # Проверяем что получили все сообщения
@@ -1035,7 +1265,727 @@ class TelegramCopier:
             self.logger.warning("⚠️ Используем оригинальные сообщения (file reference могут быть устаревшими)")
             return messages
     
+    async def _upload_album_item(self, media_info: Dict[str, Any], semaphore: asyncio.Semaphore):
+        """
+        Загрузка одного элемента альбома с повторами, не затрагивающими остальные элементы.
+        
+        Args:
+            media_info: Информация о скачанном файле
+            semaphore: Ограничитель параллельных загрузок альбома
+        
+        Returns:
+            InputMediaPhoto/InputMediaDocument, сохраненное на сервере, или None
+        """
+        max_retries = 3
+        message_id = media_info['message_id']
+        
+        for attempt in range(1, max_retries + 1):
+            try:
+                async with semaphore:
+                    input_media = await self._upload_media(media_info['original_media'], media_info['bytes'], media_info['filename'])
+                    # Альбомам нужны медиа, уже сохраненные на сервере
+                    uploaded = await self.client(functions.messages.UploadMediaRequest(
+                        peer=self.target_entity,
+                        media=input_media
+                    ))
+                
+                album_item = telethon_utils.get_input_media(uploaded)
+                if getattr(media_info['original_media'], 'spoiler', None):
+                    album_item.spoiler = True
+                self.logger.debug(f"✅ Элемент альбома ID:{message_id} загружен")
+                return album_item
+                
+            except FloodWaitError as flood_error:
+                # НОВОЕ: Остальные загрузки аккаунта тоже ждут окончания FloodWait
+                flood_wait_coordinator.pause('upload', flood_error.seconds)
+                # Ждем вне семафора, остальные элементы продолжают загрузку
+                await handle_media_flood_wait(flood_error, self.logger, message_id)
+                
+            except Exception as upload_error:
+                self.logger.warning(f"⚠️ Ошибка загрузки элемента альбома ID:{message_id} ({attempt}/{max_retries}): {upload_error}")
+                if attempt < max_retries:
+                    await asyncio.sleep(attempt * 2)
+        
+        self.logger.error(f"❌ Не удалось загрузить элемент альбома ID:{message_id} после {max_retries} попыток")
+        return None
+    
+    async def _upload_album_media(self, downloaded_files: List[Dict[str, Any]]) -> List[Any]:
+        """
+        НОВОЕ: Параллельная загрузка всех элементов альбома перед одной отправкой.
+        
+        Args:
+            downloaded_files: Скачанные файлы альбома в исходном порядке
+        
+        Returns:
+            Список загруженных InputMedia в исходном порядке (без неудачных элементов)
+        """
+        semaphore = asyncio.Semaphore(self.album_upload_concurrency)
+        results = await asyncio.gather(*(
+            self._upload_album_item(media_info, semaphore) for media_info in downloaded_files
+        ))
+        return [album_item for album_item in results if album_item is not None]
+    
+    def _send_class(self, message: Message) -> str:
+        """НОВОЕ: Класс операции отправки для ограничителя скорости (текст или медиа)."""
+        if message.media and not isinstance(message.media, MessageMediaWebPage):
+            return 'media'
+        return 'text'
+    
+    async def _collect_gap_messages(self, resume_id: int) -> List[Message]:
+        """
+        НОВОЕ: Сообщения не выше точки возобновления, которые есть в манифесте
+        источника, но не отмечены в трекере как скопированные.
+        
+        Скопированное не перечитывается: запрашиваются только ID пропусков,
+        по 100 в одном запросе GetMessages.
+        
+        Args:
+            resume_id: Точка возобновления (более новые сообщения будут прочитаны и так)
+        
+        Returns:
+            Сообщения пропусков по возрастанию ID
+        """
+        if not self.source_manifest or not self.message_tracker:
+            return []
+        
+        copied = IntervalSet.from_sorted_ids(self.message_tracker.get_tracked_ids('copied'))
+        gaps = self.source_manifest.gaps(copied, resume_id)
+        if self.retry_queue:
+            # Неудачные сообщения повторяет очередь повторов - со своими задержками
+            gaps = gaps.difference(IntervalSet.from_sorted_ids(self.retry_queue.tracked_ids()))
+        if not gaps:
+            return []
+        self.logger.info(f"🕳️ Найдено {len(gaps)} пропущенных сообщений до ID {resume_id}: {gaps.describe()}")
+        
+        gap_ids = list(gaps)
+        messages = []
+        for start in range(0, len(gap_ids), 100):
+            batch = gap_ids[start:start + 100]
+            while True:
+                await self.rate_limiter.wait_if_needed('history')
+                await flood_wait_coordinator.wait('history')
+                try:
+                    fetched = await self.client.get_messages(self.source_entity, ids=batch)
+                    break
+                except FloodWaitError as e:
+                    self.rate_limiter.record_flood_wait('history', e.seconds)
+                    await handle_flood_wait(e, self.logger)
+            self.rate_limiter.record_message_sent('history')
+            
+            for message_id, message in zip(batch, fetched):
+                if message is None or (not message.message and not message.media):
+                    # Сообщение удалено в источнике - это больше не пропуск
+                    self.source_manifest.discard(message_id)
+                elif self.deduplicator.is_message_processed(message):
+                    # ИСПРАВЛЕНО: Уже отправленное с другим ID (дубликат) - тоже не пропуск
+                    self.logger.info(f"⏭️ Пропускаем сообщение {message_id} (уже обработано ранее)")
+                    self.skipped_messages += 1
+                    self.source_manifest.discard(message_id)
+                else:
+                    messages.append(message)
+        
+        self.source_manifest.save()
+        if messages:
+            self.logger.info(f"🕳️ Будет докопировано {len(messages)} пропущенных сообщений")
+        return messages
+    
+    async def _with_send_intent(self, messages: List[Message], copy_factory: Callable[[], Awaitable[bool]]) -> bool:
+        """
+        НОВОЕ: Копирование единицы с намерением отправки, записанным до отправки,
+        и отметкой скопированных сообщений в дедупликации.
+        
+        Args:
+            messages: Сообщения единицы (одиночное или альбом)
+            copy_factory: Функция без аргументов, создающая корутину копирования единицы
+                (ИСПРАВЛЕНО: корутина создается только после записи намерения)
+        
+        Returns:
+            Результат копирования
+        """
+        if self.dry_run or not any(msg.message or msg.media for msg in messages):
+            return await copy_factory()
+        
+        if self.send_journal:
+            await self.send_journal.record([messages])
+        try:
+            success = await copy_factory()
+        except FloodWaitError:
+            # Отправка не выполнена - единица будет повторена
+            if self.send_journal:
+                await self.send_journal.resolve([messages], False)
+            raise
+        # При других исключениях намерение остается - исход проверится при запуске
+        if self.send_journal:
+            await self.send_journal.resolve([messages], success)
+        if success:
+            # НОВОЕ: Скопированные сообщения попадают в дедупликацию
+            for msg in messages:
+                self.deduplicator.mark_message_processed(msg)
+        return success
+    
+    async def _reconcile_send_intents(self) -> int:
+        """
+        НОВОЕ: Сверка незавершенных намерений отправки с концом целевого канала.
+        Единицы, отправленные перед сбоем, но не записанные в трекер и точку
+        возобновления, отмечаются скопированными без повторной отправки.
+        
+        Returns:
+            Наибольший ID источника среди найденных в цели (0 - нет)
+        """
+        if not self.send_journal or self.dry_run:
+            return 0
+        intents = self.send_journal.pending()
+        if not intents:
+            return 0
+        
+        # Исход, уже записанный в трекер, проверять не нужно
+        unresolved = [
+            intent for intent in intents
+            if not (self.message_tracker and all(self.message_tracker.is_message_copied(source_id) for source_id in intent['ids']))
+        ]
+        if not unresolved:
+            self.send_journal.remove(intents)
+            return 0
+        
+        self.logger.info(f"🧾 Незавершенных отправок: {len(unresolved)} - сверяем с последними {self.send_journal.tail_limit} сообщениями цели")
+        while True:
+            await self.rate_limiter.wait_if_needed('history')
+            await flood_wait_coordinator.wait('history')
+            try:
+                target_messages = await self.client.get_messages(self.target_entity, limit=self.send_journal.tail_limit)
+                break
+            except FloodWaitError as e:
+                # ИСПРАВЛЕНО: Повтор после FloodWait тем же порядком ожидания, что и любой запрос истории
+                self.rate_limiter.record_flood_wait('history', e.seconds)
+                await handle_flood_wait(e, self.logger, "сверка намерений отправки")
+            except Exception as e:
+                # Намерения остаются до следующего запуска, единицы будут скопированы обычным порядком
+                self.logger.warning(f"⚠️ Не удалось прочитать конец целевого канала для сверки: {e}")
+                return 0
+        self.rate_limiter.record_message_sent('history')
+        
+        matches = self.send_journal.match(unresolved, list(target_messages or []))
+        reconciled_id = 0
+        for intent in unresolved:
+            target_ids = matches.get((intent['peer'], intent['source_id']))
+            if not target_ids:
+                self.logger.info(f"🧾 Сообщения {intent['ids']} не найдены в цели - будут отправлены")
+                continue
+            if self.message_tracker:
+                if len(intent['ids']) > 1:
+                    self.message_tracker.mark_album_copied(intent['ids'], target_ids, intent.get('grouped_id'))
+                else:
+                    self.message_tracker.mark_message_copied(intent['ids'][0], target_ids[0])
+            # ИСПРАВЛЕНО: ID комментариев из группы обсуждения не относятся к очереди повторов
+            # и не двигают точку возобновления канала-источника
+            if intent['peer']:
+                self.logger.info(f"🧾 Комментарии {intent['ids']} уже отправлены как {target_ids} - повторная отправка не нужна")
+                continue
+            if self.retry_queue:
+                self.retry_queue.record_success(intent['ids'])
+            reconciled_id = max(reconciled_id, max(intent['ids']))
+            self.logger.info(f"🧾 Сообщения {intent['ids']} уже отправлены как {target_ids} - повторная отправка не нужна")
+        
+        if self.message_tracker:
+            self.message_tracker.flush()
+        if self.retry_queue:
+            self.retry_queue.save()
+        self.send_journal.remove(intents)
+        return reconciled_id
+    
+    def _save_progress(self, message_id: int) -> None:
+        """НОВОЕ: Сохранение точки возобновления только вперед (докопированные пропуски ее не откатывают)."""
+        if message_id > self._progress_id:
+            self._progress_id = message_id
+            self.checkpoint.update(message_id)
+    
+    def _note_failure(self, kind: str, error: Any) -> None:
+        """НОВОЕ: Запоминание класса и текста ошибки копирования (читает _record_failure)."""
+        self._last_failure = (kind, str(error))
+    
+    def _record_failure(self, messages: List[Message], kind: Optional[str] = None, error: str = '',
+                        entry_ids: Optional[List[int]] = None) -> None:
+        """
+        НОВОЕ: Запись неудачи в трекер и очередь повторов.
+        
+        Args:
+            messages: Сообщение или все сообщения альбома
+            kind: Класс ошибки (None - из последней ошибки копирования)
+            error: Текст ошибки (если класс указан явно)
+            entry_ids: ID записи очереди повторов, которая повторялась
+        """
+        if kind is None:
+            kind, error = self._last_failure or (UNKNOWN, '')
+        self._last_failure = None
+        if self.dry_run:
+            return
+        
+        if self.message_tracker:
+            for message in messages:
+                self.message_tracker.mark_message_failed(message.id, f"{kind}: {error}")
+        # ИСПРАВЛЕНО: Комментарии из discussion group не ставятся в очередь - их ID относятся
+        # к другому чату, и очередь перечитала бы по ним посты исходного канала
+        if self.retry_queue and not any(getattr(message, '_is_from_discussion_group', False) for message in messages):
+            self.retry_queue.record_failure([message.id for message in messages], kind, error, entry_ids)
+    
+    async def _run_retry_lane(self) -> None:
+        """
+        НОВОЕ: Низкоприоритетный проход по очереди повторов.
+        
+        Выполняется после основного прохода, поэтому неудачные сообщения не
+        задерживают остальные. Сообщения перечитываются из источника (свежие
+        file reference), удаленные в источнике убираются из очереди. FloodWait
+        на чтении завершает проход - оставшиеся записи подождут следующего запуска.
+        """
+        if not self.retry_queue or self.dry_run or not self.retry_lane_limit:
+            return
+        due = self.retry_queue.due()[:self.retry_lane_limit]
+        if not due:
+            return
+        self.logger.info(f"🔁 Очередь повторов: повторяем {len(due)} из {len(self.retry_queue)} записей")
+        
+        # Повторяемые медиа кэшируются - следующий повтор не скачает их заново
+        self._cache_downloads = True
+        try:
+            await self._retry_due(due)
+        finally:
+            self._cache_downloads = False
+    
+    async def _retry_due(self, due: List[Dict[str, Any]]) -> None:
+        """
+        Повтор записей очереди, чье время наступило.
+        
+        Args:
+            due: Записи очереди повторов по возрастанию ID
+        """
+        retried = 0
+        for entry in due:
+            try:
+                await self.rate_limiter.wait_if_needed('history')
+                await flood_wait_coordinator.wait('history')
+                fetched = await self.client.get_messages(self.source_entity, ids=entry['ids'])
+                self.rate_limiter.record_message_sent('history')
+            except FloodWaitError as e:
+                self.rate_limiter.record_flood_wait('history', e.seconds)
+                self.logger.warning(f"⏳ FloodWait {e.seconds} сек при чтении очереди повторов - продолжим в следующий запуск")
+                break
+            
+            messages = [message for message in fetched if message is not None and (message.message or message.media)]
+            if not messages:
+                self.logger.info(f"🗑️ Сообщения {entry['ids']} удалены в источнике - убираем из очереди повторов")
+                self.retry_queue.remove(entry['ids'])
+                continue
+            
+            is_album = len(entry['ids']) > 1
+            try:
+                success = await (self.copy_album(messages) if is_album else self.copy_single_message(messages[0]))
+            except FloodWaitError as e:
+                self.rate_limiter.record_flood_wait('media' if is_album else self._send_class(messages[0]), e.seconds)
+                self._note_failure(FLOOD, e)
+                success = False
+            
+            if success:
+                retried += len(messages)
+                self.copied_messages += len(messages)
+                self.retry_queue.record_success(entry['ids'])
+                self.logger.info(f"✅ Повтор успешен: сообщения {entry['ids']}")
+            else:
+                self._record_failure(messages, entry_ids=entry['ids'])
+            
+            send_class = 'media' if is_album else self._send_class(messages[0])
+            await self.rate_limiter.wait_if_needed(send_class)
+            if success:
+                self.rate_limiter.record_message_sent(send_class)
+        
+        self.retry_queue.save()
+        self.logger.info(f"🔁 Очередь повторов: скопировано {retried}, ожидают {len(self.retry_queue)}, dead-letter {len(self.retry_queue.dead_letters)}")
+    
+    def _is_batchable_text(self, message: Message) -> bool:
+        """НОВОЕ: Текстовое сообщение без медиа, которое можно отправить в общем контейнере."""
+        if getattr(message, 'grouped_id', None) or not message.message:
+            return False
+        return self._send_class(message) == 'text'
+    
+    def _collect_text_run(self, message: Message) -> List[Message]:
+        """
+        НОВОЕ: Серия идущих подряд текстовых сообщений, начиная с текущего.
+        Размер серии ограничен настройкой и доступным бюджетом текстовых отправок.
+        
+        Args:
+            message: Текущее сообщение (его единица обработки уже пройдена)
+        
+        Returns:
+            Сообщения серии по порядку (одно сообщение - отправка без контейнера)
+        """
+        if self.dry_run or self.text_batch_size < 2 or not self._is_batchable_text(message):
+            return [message]
+        
+        limit = min(self.text_batch_size, int(self.rate_limiter.available_tokens('text')))
+        run = [message]
+        for unit in self._processing_units[self._unit_position:]:
+            if len(run) >= limit or len(unit) != 1 or not self._is_batchable_text(unit[0]):
+                break
+            run.append(unit[0])
+        return run
+    
+    def _sent_message_id(self, result, random_id: int) -> Optional[int]:
+        """НОВОЕ: ID отправленного сообщения из ответа на SendMessageRequest."""
+        if isinstance(result, UpdateShortSentMessage):
+            return result.id
+        for update in getattr(result, 'updates', None) or []:
+            if isinstance(update, UpdateMessageID) and update.random_id == random_id:
+                return update.id
+        return None
+    
+    async def _send_text_run(self, messages: List[Message]) -> List[Optional[int]]:
+        """
+        НОВОЕ: Отправка серии текстовых сообщений одним контейнером MTProto.
+        
+        Сервер выполняет запросы по порядку (invokeAfterMsg), а результаты
+        сопоставляются с исходными сообщениями по random_id.
+        
+        Args:
+            messages: Текстовые сообщения серии по порядку
+        
+        Returns:
+            ID отправленных сообщений по порядку: None - не отправлено, 0 - отправлено, ID неизвестен
+        """
+        requests = [
+            functions.messages.SendMessageRequest(
+                peer=self.target_entity,
+                message=message.message,
+                no_webpage=True,
+                entities=message.entities or None,
+                random_id=generate_random_long()
+            )
+            for message in messages
+        ]
+        
+        if self.send_journal:
+            # Намерения всей серии - одной транзакцией
+            await self.send_journal.record([[message] for message in messages])
+        
+        await flood_wait_coordinator.wait('text')
+        try:
+            results = await self.client(requests, ordered=True)
+        except MultiError as multi_error:
+            # Часть запросов выполнена - отправленные сообщения не повторяем
+            results = multi_error.results
+            errors = [error for error in multi_error.exceptions if error is not None]
+            flood_error = next((error for error in errors if isinstance(error, FloodWaitError)), None)
+            if flood_error:
+                self.rate_limiter.record_flood_wait('text', flood_error.seconds)
+                await handle_flood_wait(flood_error, self.logger, f"серия из {len(messages)} текстовых сообщений")
+            else:
+                self.logger.warning(f"⚠️ Не все сообщения серии отправлены: {errors[0]}")
+        except FloodWaitError as flood_error:
+            self.rate_limiter.record_flood_wait('text', flood_error.seconds)
+            await handle_flood_wait(flood_error, self.logger, f"серия из {len(messages)} текстовых сообщений")
+            results = [None] * len(messages)
+        except Exception as e:
+            self.logger.warning(f"⚠️ Не удалось отправить серию текстовых сообщений: {e}")
+            results = [None] * len(messages)
+        
+        if self.send_journal:
+            await self.send_journal.resolve([[message] for message, result in zip(messages, results) if result is not None], True)
+            await self.send_journal.resolve([[message] for message, result in zip(messages, results) if result is None], False)
+        
+        sent_ids = []
+        for message, request, result in zip(messages, requests, results):
+            if result is None:
+                sent_ids.append(None)
+                continue
+            self.deduplicator.mark_message_processed(message)
+            sent_id = self._sent_message_id(result, request.random_id) or 0
+            # ИСПРАВЛЕНО: Отправленное сообщение отмечается и без известного ID копии -
+            # иначе поиск пропусков отправит его повторно
+            if self.message_tracker:
+                self.message_tracker.mark_message_copied(message.id, sent_id or None)
+            sent_ids.append(sent_id)
+        return sent_ids
+    
+    def _unit_key(self, unit_messages: List[Message]) -> tuple:
+        """НОВОЕ: Ключ единицы обработки (альбом или одиночное сообщение)."""
+        first_message = unit_messages[0]
+        if getattr(first_message, 'grouped_id', None):
+            return ('album', first_message.grouped_id)
+        return ('message', first_message.id)
+    
+    def _needs_upload(self, message: Message) -> bool:
+        """НОВОЕ: Проверка, что медиа сообщения скачивается в память и загружается заново."""
+        media = message.media
+        if not isinstance(media, (MessageMediaPhoto, MessageMediaDocument)):
+            return False
+        if self.media_relay.should_relay(media) or self.resumable_downloader.should_resume(media):
+            return False
+        return self.media_builder.build_reference_media(message) is None
+    
+    def _stage_ahead(self, upcoming_units: List[List[Message]]) -> None:
+        """
+        НОВОЕ: Фоновая подготовка (скачивание и загрузка) следующих единиц обработки.
+        Отправка остается строго последовательной, а загрузка прячется за паузами RateLimiter.
+        
+        Args:
+            upcoming_units: Следующие единицы обработки в порядке отправки
+        """
+        if not self.upload_ahead_window or self.dry_run:
+            return
+        
+        for unit_messages in upcoming_units[:self.upload_ahead_window]:
+            key = self._unit_key(unit_messages)
+            if key in self._staged:
+                continue
+            
+            if key[0] == 'album':
+                media_messages = [msg for msg in unit_messages if msg.media]
+                if not media_messages or not all(self._needs_upload(msg) for msg in media_messages):
+                    continue
+                self._staged[key] = asyncio.create_task(self._stage_album(unit_messages))
+            elif self._needs_upload(unit_messages[0]):
+                self._staged[key] = asyncio.create_task(self._stage_single(unit_messages[0]))
+    
+    async def _take_staged(self, key: tuple):
+        """
+        НОВОЕ: Получение результата фоновой подготовки.
+        
+        Args:
+            key: Ключ единицы обработки
+        
+        Returns:
+            Загруженные InputMedia (одно или список для альбома) или None
+        """
+        task = self._staged.pop(key, None)
+        if task is None:
+            return None
+        try:
+            return await task
+        except Exception as e:
+            self.logger.debug(f"Фоновая подготовка {key} не удалась: {e}")
+            return None
+    
+    def _cancel_staged(self) -> None:
+        """НОВОЕ: Отмена фоновой подготовки, которая уже не понадобится."""
+        for task in self._staged.values():
+            task.cancel()
+        self._staged.clear()
+    
+    def _on_flood_wait(self, started: bool, wait_seconds: int) -> None:
+        """
+        НОВОЕ: Подписчик на FloodWait - запускает чтение вперед на время ожидания.
+        
+        Args:
+            started: True в начале ожидания, False в конце
+            wait_seconds: Длительность ожидания в секундах
+        """
+        if started:
+            self._active_flood_waits += 1
+            # Короткие паузы не стоят запуска чтения вперед
+            if (self.flood_wait_read_ahead and wait_seconds >= 30 and self.media_cache.enabled and
+                    (self._read_ahead_task is None or self._read_ahead_task.done())):
+                self._read_ahead_task = asyncio.create_task(self._read_ahead_during_flood_wait(wait_seconds))
+        else:
+            self._active_flood_waits = max(0, self._active_flood_waits - 1)
+            if not self._active_flood_waits:
+                self._stop_read_ahead()
+    
+    def _stop_read_ahead(self) -> None:
+        """НОВОЕ: Остановка чтения вперед (FloodWait закончился)."""
+        if self._read_ahead_task and not self._read_ahead_task.done():
+            self._read_ahead_task.cancel()
+        self._read_ahead_task = None
+    
+    async def _read_ahead_during_flood_wait(self, wait_seconds: int) -> None:
+        """
+        НОВОЕ: Скачивание медиа следующих единиц в дисковый кэш, пока отправка ждет FloodWait.
+        Объем чтения вперед ограничен бюджетом памяти и объемом кэша.
+        
+        Args:
+            wait_seconds: Длительность ожидания в секундах
+        """
+        limit_bytes = self.media_cache.max_bytes
+        if self.memory_budget.max_bytes:
+            limit_bytes = min(limit_bytes, self.memory_budget.max_bytes)
+        
+        self.logger.info(f"📥 FloodWait {wait_seconds}с: скачиваем следующие медиа заранее (до {format_file_size(limit_bytes)})")
+        spooled_bytes = 0
+        spooled_files = 0
+        
+        try:
+            for unit_messages in self._processing_units[self._unit_position:]:
+                if self._unit_key(unit_messages) in self._staged:
+                    continue
+                
+                for message in unit_messages:
+                    if (not self._needs_upload(message) or not self._cacheable(message.media) or
+                            self.media_cache.contains(message.media)):
+                        continue
+                    
+                    size = self.media_builder.estimate_size(message.media)
+                    if spooled_bytes + size > limit_bytes:
+                        return
+                    
+                    reserved_bytes = await self.memory_budget.acquire(size)
+                    try:
+                        await self._download_media_bytes(message.media, cache=True)
+                        spooled_bytes += size
+                        spooled_files += 1
+                    except Exception as e:
+                        # Основной проход повторит скачивание со всей обработкой ошибок
+                        self.logger.debug(f"Не удалось скачать заранее медиа ID:{message.id}: {e}")
+                    finally:
+                        self.memory_budget.release(reserved_bytes)
+        finally:
+            if spooled_files:
+                self.logger.info(f"📦 Во время FloodWait скачано заранее {spooled_files} файлов ({format_file_size(spooled_bytes)})")
+    
+    async def _stage_single(self, message: Message):
+        """
+        НОВОЕ: Скачивание и загрузка медиа одиночного сообщения заранее.
+        
+        Returns:
+            InputMedia, готовое к отправке, или None
+        """
+        reserved_bytes = await self.memory_budget.acquire(self.media_builder.estimate_size(message.media))
+        try:
+            file_bytes = await self._download_media_bytes(message.media)
+            if not file_bytes:
+                return None
+            file_name = self._get_media_filename(message.media, 0)
+            input_media = await self._upload_media(message.media, file_bytes, file_name)
+            self.logger.debug(f"📦 Медиа сообщения ID:{message.id} загружено заранее")
+            return input_media
+        except Exception as e:
+            # Основной проход повторит скачивание со всей обработкой ошибок
+            self.logger.debug(f"Заранее загрузить медиа ID:{message.id} не удалось: {e}")
+            return None
+        finally:
+            self.memory_budget.release(reserved_bytes)
+    
+    async def _stage_album(self, album_messages: List[Message]) -> Optional[List[Any]]:
+        """
+        НОВОЕ: Скачивание и загрузка всех элементов альбома заранее.
+        
+        Returns:
+            Список InputMedia альбома или None, если хотя бы один элемент не подготовлен
+        """
+        reserved_bytes = await self.memory_budget.acquire(
+            sum(self.media_builder.estimate_size(msg.media) for msg in album_messages if msg.media)
+        )
+        try:
+            downloaded_files = []
+            for i, message in enumerate(album_messages):
+                if not message.media:
+                    continue
+                file_bytes = await self._download_media_bytes(message.media)
+                if not file_bytes:
+                    return None
+                downloaded_files.append({
+                    'bytes': file_bytes,
+                    'filename': self._get_media_filename(message.media, i),
+                    'media_type': type(message.media).__name__,
+                    'is_photo': isinstance(message.media, MessageMediaPhoto),
+                    'original_media': message.media,
+                    'message_id': message.id
+                })
+            
+            album_media = await self._upload_album_media(downloaded_files)
+            if len(album_media) != len(downloaded_files):
+                return None
+            self.logger.debug(f"📦 Альбом {album_messages[0].grouped_id} загружен заранее")
+            return album_media
+        except Exception as e:
+            self.logger.debug(f"Заранее загрузить альбом {album_messages[0].grouped_id} не удалось: {e}")
+            return None
+        finally:
+            self.memory_budget.release(reserved_bytes)
+    
+    async def _send_album(self, album_messages: List[Message], album_media: List[Any]) -> bool:
+        """
+        НОВОЕ: Отправка альбома из уже загруженных на сервер элементов.
+        
+        Args:
+            album_messages: Список сообщений альбома (отсортированный по ID)
+            album_media: Загруженные InputMedia элементов альбома
+        
+        Returns:
+            True если отправка успешна, False иначе
+        """
+        # ИСПРАВЛЕНО: Получаем текст из любого сообщения альбома
+        caption, entities = self.extract_album_text(album_messages)
+        
+        # Подготавливаем параметры для отправки альбома одним запросом
+        send_kwargs = {
+            'entity': self.target_entity,
+            'file': album_media,  # Уже загруженные на сервер InputMedia
+            'caption': caption,
+        }
+        
+        # Сохраняем форматирование текста из сообщения с текстом
+        if entities:
+            send_kwargs['formatting_entities'] = entities
+        
+        # Отправляем альбом одним запросом с умной обработкой FloodWait
+        max_retries = 3
+        retry_count = 0
+        
+        while retry_count < max_retries:
+            try:
+                await flood_wait_coordinator.wait('media')
+                sent_messages = await self.client.send_file(**send_kwargs)
+                
+                # Анализируем результат
+                if isinstance(sent_messages, list):
+                    self.logger.info(f"✅ Альбом успешно отправлен как {len(sent_messages)} сообщений (ID: {[msg.id for msg in album_messages]})")
+                    
+                    # Обновляем трекер
+                    if self.message_tracker and sent_messages:
+                        source_ids = [msg.id for msg in album_messages]
+                        target_ids = [msg.id for msg in sent_messages]
+                        self.message_tracker.mark_album_copied(source_ids, target_ids, album_messages[0].grouped_id)
+                else:
+                    self.logger.warning(f"⚠️ Альбом отправлен как одно сообщение {sent_messages.id} (ID: {[msg.id for msg in album_messages]})")
+                    
+                    if self.message_tracker:
+                        source_ids = [msg.id for msg in album_messages]
+                        target_ids = [sent_messages.id]
+                        self.message_tracker.mark_album_copied(source_ids, target_ids, album_messages[0].grouped_id)
+                
+                return True
+                
+            except FloodWaitError as flood_error:
+                self.rate_limiter.record_flood_wait('media', flood_error.seconds)
+                retry_count += 1
+                album_ids = [msg.id for msg in album_messages]
+                await handle_media_flood_wait(flood_error, self.logger, album_ids)
+                # Все элементы уже загружены на сервер - повторяем только отправку альбома
+                
+                if retry_count >= max_retries:
+                    self.logger.error(f"❌ Исчерпаны попытки отправки альбома {album_ids} после {max_retries} попыток FloodWait")
+                    self._note_failure(FLOOD, flood_error)
+                    return False
+                    
+                self.logger.info(f"🔄 Повторная попытка отправки альбома {album_ids} ({retry_count}/{max_retries})")
+                
+            except Exception as send_error:
+                self.logger.error(f"❌ Неожиданная ошибка отправки альбома: {send_error}")
+                self._note_failure(classify_failure(send_error), send_error)
+                return False
+        
+        return False
+    
     async def copy_album(self, album_messages: List[Message]) -> bool:
+        """
+        Копирование альбома с записью намерения отправки.
+        
+        Args:
+            album_messages: Список сообщений альбома (отсортированный по ID)
+        
+        Returns:
+            True если копирование успешно, False иначе
+        """
+        return await self._with_send_intent(album_messages, lambda: self._copy_album(album_messages))
+    
+    async def _copy_album(self, album_messages: List[Message]) -> bool:
         """
         Копирование альбома сообщений как единого целое.
         КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: Теперь скачивает медиа для избежания ошибки "protected chat".
@@ -1046,6 +1996,8 @@ class TelegramCopier:
         Returns:
             True если копирование успешно, False иначе
         """
+        reserved_bytes = 0
+        self._last_failure = None
         try:
             if not album_messages:
                 return False
@@ -1062,6 +2014,17 @@ class TelegramCopier:
                 self.logger.info(f"[DRY RUN] Альбом из {len(album_messages)} сообщений: {display_text}")
                 return True
             
+            # НОВОЕ: Альбом загружен заранее (upload-ahead) - остается только отправка
+            staged_media = await self._take_staged(self._unit_key(album_messages))
+            if staged_media:
+                return await self._send_album(album_messages, staged_media)
+            
+            # НОВОЕ: Резервируем бюджет памяти сразу под весь альбом
+            # (резервирование по одному файлу могло бы зависнуть на середине альбома)
+            reserved_bytes = await self.memory_budget.acquire(
+                sum(self.media_builder.estimate_size(msg.media) for msg in album_messages if msg.media)
+            )
+            
             # УПРОЩЕНИЕ: Определяем есть ли сообщения из discussion группы
             has_discussion_messages = any(
                 hasattr(msg, '_is_from_discussion_group') and msg._is_from_discussion_group 
@@ -1085,8 +2048,8 @@ class TelegramCopier:
                         # ИСПРАВЛЕНИЕ: Получаем оригинальное имя файла и расширение
                         file_name = self._get_media_filename(message.media, i)
                         
-                        # Используем download_media для получения байтов файла
-                        file_bytes = await self.client.download_media(message.media, file=bytes)
+                        # Используем download_media для получения байтов файла (сначала проверяем кэш)
+                        file_bytes = await self._download_media_bytes(message.media)
                         
                         if file_bytes:
                             # КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: Создаем объект с сохранением типа медиа
@@ -1129,7 +2092,7 @@ class TelegramCopier:
                                 self.logger.debug(f"🔄 Повторно скачиваем медиа файл {i+1}/{len(refreshed_messages)} из обновленного сообщения ID:{message.id}")
                                 
                                 file_name = self._get_media_filename(message.media, i)
-                                file_bytes = await self.client.download_media(message.media, file=bytes)
+                                file_bytes = await self._download_media_bytes(message.media)
                                 
                                 if file_bytes:
                                     media_info = {
@@ -1169,113 +2132,53 @@ class TelegramCopier:
                     # Создаем временное сообщение с найденным текстом для отправки
                     message_with_text = next((msg for msg in album_messages if msg.message and msg.message.strip()), None)
                     if message_with_text:
-                        return await self.copy_single_message(message_with_text)
+                        self.memory_budget.release(reserved_bytes)
+                        reserved_bytes = 0
+                        success = await self._copy_single_message(message_with_text)
+                        # ИСПРАВЛЕНО: Отмечаем весь альбом, а не только сообщение с текстом
+                        if success and self.message_tracker:
+                            entry = self.message_tracker.get_entry(message_with_text.id) or {}
+                            self.message_tracker.mark_album_copied(
+                                [msg.id for msg in album_messages], [entry.get('target_id')],
+                                album_messages[0].grouped_id
+                            )
+                        return success
                 else:
                     self.logger.warning("Альбом не содержит ни медиа, ни текста - пропускаем")
+                    self._note_failure(EXPIRED_REFERENCE if expired_messages_detected else MEDIA_INVALID, "медиа альбома недоступно")
                     return False
             
-            # ИСПРАВЛЕНО: Получаем текст из любого сообщения альбома
-            caption, entities = self.extract_album_text(album_messages)
-            
-            # КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: Подготавливаем файлы как BytesIO объекты с атрибутами
-            files_to_send = []
-            for media_info in downloaded_files:
-                # Создаем BytesIO объект из скачанных байтов
-                file_obj = io.BytesIO(media_info['bytes'])
-                file_obj.name = media_info['filename']  # Устанавливаем имя файла
-                file_obj.seek(0)  # ИСПРАВЛЕНИЕ: Убеждаемся что указатель в начале файла
-                files_to_send.append(file_obj)
-            
-            # Подготавливаем параметры для отправки альбома с правильными файлами
-            send_kwargs = {
-                'entity': self.target_entity,
-                'file': files_to_send,  # Используем BytesIO объекты
-                'caption': caption,
-            }
-            
-            # Для альбомов фотографий НЕ используем force_document
-            has_only_photos = all(media_info['is_photo'] for media_info in downloaded_files)
-            if not has_only_photos:
-                # Если есть документы/видео, то отправляем как документы
-                send_kwargs['force_document'] = True
-            
-            # Сохраняем форматирование текста из сообщения с текстом
-            if entities:
-                send_kwargs['formatting_entities'] = entities
-            
             # ОТЛАДКА: Информация о файлах в альбоме
-            self.logger.info(f"Отправляем альбом из {len(downloaded_files)} медиа файлов (только фото: {has_only_photos})")
+            self.logger.info(f"Загружаем альбом из {len(downloaded_files)} медиа файлов (параллельно до {self.album_upload_concurrency})")
             for i, media_info in enumerate(downloaded_files):
                 self.logger.debug(f"  Файл {i+1}: {len(media_info['bytes'])} байт, имя: {media_info['filename']}, тип: {media_info['media_type']}")
             
-            # КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: Отправляем скачанные файлы как BytesIO объекты с умной обработкой FloodWait
-            max_retries = 3
-            retry_count = 0
+            # НОВОЕ: Загружаем все элементы альбома параллельно, каждый со своими повторами
+            album_media = await self._upload_album_media(downloaded_files)
+            expected_items = len(downloaded_files)
             
-            while retry_count < max_retries:
-                try:
-                    sent_messages = await self.client.send_file(**send_kwargs)
-                    
-                    # Анализируем результат
-                    if isinstance(sent_messages, list):
-                        self.logger.info(f"✅ Альбом успешно отправлен как {len(sent_messages)} сообщений (ID: {[msg.id for msg in album_messages]})")
-                        
-                        # Обновляем трекер
-                        if self.message_tracker and sent_messages:
-                            source_ids = [msg.id for msg in album_messages]
-                            target_ids = [msg.id for msg in sent_messages]
-                            self.message_tracker.mark_album_copied(source_ids, target_ids)
-                    else:
-                        self.logger.warning(f"⚠️ Альбом отправлен как одно сообщение {sent_messages.id} (ID: {[msg.id for msg in album_messages]})")
-                        
-                        if self.message_tracker:
-                            source_ids = [msg.id for msg in album_messages]
-                            target_ids = [sent_messages.id]
-                            self.message_tracker.mark_album_copied(source_ids, target_ids)
-                    
-                    return True
-                    
-                except FloodWaitError as flood_error:
-                    retry_count += 1
-                    album_ids = [msg.id for msg in album_messages]
-                    await handle_media_flood_wait(
-                        flood_error, 
-                        self.logger, 
-                        f"Album {album_ids[0]}-{album_ids[-1]}"
-                    )
-                    # КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: Пересоздаем BytesIO объекты после FloodWait
-                    # Длительное ожидание может повредить файловые объекты
-                    self.logger.info(f"🔄 Пересоздаем BytesIO объекты после FloodWait для альбома {album_ids}")
-                    
-                    files_to_send = []
-                    for media_info in downloaded_files:
-                        # Создаем НОВЫЙ BytesIO объект из сохраненных байтов
-                        file_obj = io.BytesIO(media_info['bytes'])
-                        file_obj.name = media_info['filename']
-                        # Убеждаемся что указатель в начале файла
-                        file_obj.seek(0)
-                        files_to_send.append(file_obj)
-                    
-                    # Обновляем параметры отправки с новыми файловыми объектами
-                    send_kwargs['file'] = files_to_send
-                    self.logger.debug(f"✅ Пересозданы {len(files_to_send)} BytesIO объектов для повторной отправки")
-                    
-                    # Продолжаем попытку - FloodWait завершен
-                    
-                    if retry_count >= max_retries:
-                        self.logger.error(f"❌ Исчерпаны попытки отправки альбома {album_ids} после {max_retries} попыток FloodWait")
-                        return False
-                        
-                    self.logger.info(f"🔄 Повторная попытка отправки альбома {album_ids} ({retry_count}/{max_retries})")
-                    
-                except Exception as send_error:
-                    self.logger.error(f"❌ Неожиданная ошибка отправки альбома: {send_error}")
-                    return False
+            # Файлы уже на сервере - байты больше не нужны, освобождаем бюджет памяти
+            downloaded_files.clear()
+            self.memory_budget.release(reserved_bytes)
+            reserved_bytes = 0
             
-            return False
+            if not album_media:
+                self.logger.error("❌ Не удалось загрузить ни одного элемента альбома")
+                self._note_failure(UNKNOWN, "не удалось загрузить элементы альбома")
+                return False
+            
+            # ИСПРАВЛЕНО: Неполный альбом не отправляется - иначе незагруженные элементы
+            # были бы отмечены скопированными и потеряны; альбом уйдет в очередь повторов
+            if len(album_media) != expected_items:
+                self.logger.error(f"❌ Загружено {len(album_media)} из {expected_items} элементов альбома - альбом не отправляется")
+                self._note_failure(UNKNOWN, f"загружено {len(album_media)} из {expected_items} элементов альбома")
+                return False
+            
+            return await self._send_album(album_messages, album_media)
             
         except MediaInvalidError as e:
             self.logger.warning(f"Медиа альбома недоступно: {e}")
+            self._note_failure(MEDIA_INVALID, e)
             # ИСПРАВЛЕНО: Пытаемся отправить текст из любого сообщения альбома
             caption, entities = self.extract_album_text(album_messages)
             if caption:
@@ -1287,7 +2190,14 @@ class TelegramCopier:
                     }
                     if entities:
                         text_kwargs['formatting_entities'] = entities
-                    await self.client.send_message(**text_kwargs)
+                    await flood_wait_coordinator.wait('text')
+                    sent_message = await self.client.send_message(**text_kwargs)
+                    # ИСПРАВЛЕНО: Все сообщения альбома отмечаются в трекере - иначе поиск пропусков отправит их повторно
+                    if self.message_tracker:
+                        self.message_tracker.mark_album_copied(
+                            [msg.id for msg in album_messages], [getattr(sent_message, 'id', None)],
+                            album_messages[0].grouped_id
+                        )
                     self.logger.info(f"Отправлен только текст альбома (медиа недоступно)")
                     return True
                 except Exception as text_error:
@@ -1296,9 +2206,263 @@ class TelegramCopier:
             
         except Exception as e:
             self.logger.error(f"Ошибка копирования альбома: {e}")
+            self._note_failure(classify_failure(e), e)
             return False
+        
+        finally:
+            self.memory_budget.release(reserved_bytes)
+    
+    async def _send_reference_media(self, message: Message, text: str) -> Optional[Message]:
+        """
+        НОВОЕ: Отправка медиа, которому не нужны байты файла.
+        Геоточки, места, контакты, опросы и кубики копируются по значению,
+        стикеры и GIF - по ссылке на исходный документ.
+        
+        Args:
+            message: Исходное сообщение с медиа
+            text: Подпись к медиа
+        
+        Returns:
+            Отправленное сообщение или None, если медиа нужно скачивать
+        """
+        input_media = self.media_builder.build_reference_media(message)
+        if input_media is None:
+            return None
+        return await self._send_input_media(message, text, input_media, "без скачивания")
+    
+    async def _send_input_media(self, message: Message, text: str, input_media, source: str) -> Optional[Message]:
+        """
+        НОВОЕ: Отправка готового InputMedia с повторами при FloodWait.
+        
+        Args:
+            message: Исходное сообщение
+            text: Подпись к медиа
+            input_media: Готовое к отправке InputMedia
+            source: Откуда взято медиа (для логов)
+        
+        Returns:
+            Отправленное сообщение или None, если медиа нужно скачивать заново
+            (сервер отклонил медиа по ссылке)
+        
+        Raises:
+            FloodWaitError: Исчерпаны попытки после FloodWait (последняя ошибка)
+        """
+        file_kwargs = {
+            'entity': self.target_entity,
+            'file': input_media,
+            'caption': text,
+        }
+        if message.entities:
+            file_kwargs['formatting_entities'] = message.entities
+        
+        max_retries = 3
+        retry_count = 0
+        last_flood_error = None
+        
+        while retry_count < max_retries:
+            try:
+                await flood_wait_coordinator.wait('media')
+                sent_message = await self.client.send_file(**file_kwargs)
+                self.logger.debug(f"✅ Медиа сообщения ID:{message.id} отправлено {source} ({type(input_media).__name__})")
+                return sent_message
+            
+            except FloodWaitError as flood_error:
+                retry_count += 1
+                last_flood_error = flood_error
+                self.rate_limiter.record_flood_wait('media', flood_error.seconds)
+                await handle_media_flood_wait(flood_error, self.logger, message.id)
+                
+            except Exception as send_error:
+                # Например, документ по ссылке отклонен - переходим к скачиванию
+                self.logger.info(f"ℹ️ Не удалось отправить медиа ID:{message.id} {source} ({send_error}), скачиваем файл")
+                return None
+        
+        self.logger.error(f"❌ Исчерпаны попытки отправки медиа ID:{message.id} {source} после {max_retries} попыток FloodWait")
+        # ИСПРАВЛЕНО: None означает "скачать заново" - исчерпанные FloodWait сообщаются ошибкой
+        raise last_flood_error
+    
+    async def _upload_original_thumb(self, media):
+        """
+        Загрузка оригинальной миниатюры документа.
+        
+        Args:
+            media: Исходное медиа
+        
+        Returns:
+            Загруженная миниатюра (InputFile) или None
+        """
+        if not self.media_builder.has_thumb(media):
+            return None
+        
+        try:
+            thumb_bytes = await self.client.download_media(media, file=bytes, thumb=-1)
+            if not thumb_bytes:
+                return None
+            return await self.client.upload_file(thumb_bytes, file_name='thumb.jpg')
+        except FloodWaitError:
+            raise
+        except Exception as e:
+            self.logger.debug(f"Не удалось перенести миниатюру: {e}")
+            return None
+    
+    def _cacheable(self, media) -> bool:
+        """ИСПРАВЛЕНО: Кэшируются только медиа ниже порогов ретрансляции и скачивания с возобновлением."""
+        return not self.media_relay.should_relay(media) and not self.resumable_downloader.should_resume(media)
+    
+    async def _download_media_bytes(self, media, cache: bool = False) -> Optional[bytes]:
+        """
+        НОВОЕ: Скачивание медиа в память с проверкой дискового кэша.
+        
+        Args:
+            media: Медиа объект Telegram
+            cache: Сохранить скачанное в кэш (чтение вперед; при повторах кэшируется всегда)
+        
+        Returns:
+            Байты файла или None
+        """
+        file_bytes = await self.media_cache.get(media)
+        if file_bytes is not None:
+            return file_bytes
+        
+        # НОВОЕ: Бюджет скачивания считается в мегабайтах
+        download_cost = max(1.0, self.media_builder.estimate_size(media) / (1024 * 1024))
+        await self.rate_limiter.wait_if_needed('download', download_cost)
+        file_bytes = await self.client.download_media(media, file=bytes)
+        self.rate_limiter.record_message_sent('download', download_cost)
+        if file_bytes and (cache or self._cache_downloads) and self._cacheable(media):
+            await self.media_cache.put(media, file_bytes)
+        return file_bytes
+    
+    async def _upload_media(self, media, file_bytes: Union[bytes, str], file_name: str):
+        """
+        НОВОЕ: Загрузка скачанного файла с сохранением оригинальных атрибутов.
+        
+        Args:
+            media: Исходное медиа (фото или документ)
+            file_bytes: Байты файла или путь к скачанному .part файлу
+            file_name: Имя файла
+        
+        Returns:
+            InputMedia, готовое к отправке
+        """
+        await flood_wait_coordinator.wait('upload')
+        if isinstance(file_bytes, str) and os.path.getsize(file_bytes) > BIG_FILE_THRESHOLD:
+            # Большой файл с диска загружаем с сохранением подтвержденных частей
+            input_file = await self.media_uploader.upload_path(str(media.document.id), file_bytes, file_name)
+        else:
+            input_file = await self.client.upload_file(file_bytes, file_name=file_name)
+        thumb = await self._upload_original_thumb(media)
+        return self.media_builder.build_uploaded_media(media, input_file, thumb)
+    
+    async def _refresh_document(self, message: Message):
+        """
+        НОВОЕ: Получение документа со свежей file reference для продолжения скачивания.
+        
+        Args:
+            message: Исходное сообщение с документом
+        
+        Returns:
+            Обновленный Document или None
+        """
+        refreshed_messages = await self.refresh_expired_messages([message])
+        if refreshed_messages and refreshed_messages[0] and isinstance(refreshed_messages[0].media, MessageMediaDocument):
+            return refreshed_messages[0].media.document
+        return None
+    
+    async def _send_relayed_media(self, message: Message, text: str) -> Message:
+        """
+        НОВОЕ: Отправка большого документа через ретрансляцию частей.
+        Файл не накапливается ни в памяти, ни на диске, а при повторе
+        загружаются только недостающие части.
+        
+        Args:
+            message: Исходное сообщение с документом
+            text: Подпись к медиа
+        
+        Returns:
+            Отправленное сообщение
+        
+        Raises:
+            FloodWaitError: Исчерпаны попытки после FloodWait (последняя ошибка)
+            Exception: Ошибка ретрансляции или отправки, после которой повтор не поможет сейчас
+        """
+        file_name = self._get_media_filename(message.media, 0)
+        file_kwargs = {
+            'entity': self.target_entity,
+            'caption': text,
+        }
+        if message.entities:
+            file_kwargs['formatting_entities'] = message.entities
+        
+        max_retries = 3
+        retry_count = 0
+        reference_refreshed = False
+        input_media = None
+        last_flood_error = None
+        
+        while retry_count < max_retries:
+            try:
+                if input_media is None:
+                    input_file = await self.media_relay.relay(message.media.document, file_name)
+                    thumb = await self._upload_original_thumb(message.media)
+                    input_media = self.media_builder.build_uploaded_media(message.media, input_file, thumb)
+                    file_kwargs['file'] = input_media
+                
+                await flood_wait_coordinator.wait('media')
+                sent_message = await self.client.send_file(**file_kwargs)
+                self.logger.debug(f"✅ Большой файл сообщения ID:{message.id} отправлен через ретрансляцию")
+                self.media_uploader.finish(str(message.media.document.id))
+                return sent_message
+                
+            except FloodWaitError as flood_error:
+                retry_count += 1
+                last_flood_error = flood_error
+                self.rate_limiter.record_flood_wait('media', flood_error.seconds)
+                await handle_media_flood_wait(flood_error, self.logger, message.id)
+                
+            except FilePartMissingError:
+                # Сервер уже удалил части - загружаем файл с нуля
+                retry_count += 1
+                self.logger.warning(f"🧩 Части файла ID:{message.id} не найдены на сервере - загружаем заново")
+                self.media_uploader.finish(str(message.media.document.id))
+                input_media = None
+                
+            except FileReferenceExpiredError:
+                if reference_refreshed:
+                    raise
+                reference_refreshed = True
+                self.logger.warning(f"📅 Файл ссылка истекла при ретрансляции ID:{message.id} - обновляем сообщение")
+                refreshed_messages = await self.refresh_expired_messages([message])
+                if not refreshed_messages or not refreshed_messages[0] or not refreshed_messages[0].media:
+                    raise
+                message = refreshed_messages[0]
+                
+            except Exception as relay_error:
+                # Подтвержденные части сохранены - повтор загрузит только недостающие
+                retry_count += 1
+                if input_media is not None or retry_count >= max_retries:
+                    raise
+                self.logger.warning(f"⚠️ Ошибка ретрансляции ID:{message.id}: {relay_error}, повтор {retry_count}/{max_retries}")
+                await asyncio.sleep(retry_count * 2)
+        
+        self.logger.error(f"❌ Исчерпаны попытки отправки большого файла ID:{message.id} после {max_retries} попыток")
+        if last_flood_error is not None:
+            raise last_flood_error
+        raise RuntimeError(f"Исчерпаны попытки отправки большого файла ID:{message.id} после {max_retries} попыток")
     
     async def copy_single_message(self, message: Message) -> bool:
+        """
+        Копирование одного сообщения с записью намерения отправки.
+        
+        Args:
+            message: Сообщение для копирования
+        
+        Returns:
+            True если копирование успешно, False иначе
+        """
+        return await self._with_send_intent([message], lambda: self._copy_single_message(message))
+    
+    async def _copy_single_message(self, message: Message) -> bool:
         """
         Копирование одного сообщения.
         
@@ -1308,6 +2472,8 @@ class TelegramCopier:
         Returns:
             True если копирование успешно, False иначе
         """
+        reserved_bytes = 0
+        self._last_failure = None
         try:
             # Пропускаем служебные сообщения
             if not message.message and not message.media:
@@ -1346,17 +2512,51 @@ class TelegramCopier:
                 try:
                     if isinstance(message.media, MessageMediaWebPage):
                         # Для веб-страниц отправляем только текст с entities
+                        await flood_wait_coordinator.wait('text')
                         sent_message = await self.client.send_message(**send_kwargs)
                     else:
+                        # НОВОЕ: Медиа без байтов (геоточки, опросы, контакты, стикеры, GIF) отправляем без скачивания
+                        sent_message = await self._send_reference_media(message, text)
+                    
+                    if sent_message is None and self._staged:
+                        # НОВОЕ: Медиа загружено заранее (upload-ahead) - остается только отправка
+                        staged_media = await self._take_staged(self._unit_key([message]))
+                        if staged_media is not None:
+                            sent_message = await self._send_input_media(message, text, staged_media, "после загрузки заранее")
+                    
+                    if sent_message is None and self.media_relay.should_relay(message.media):
+                        # НОВОЕ: Большие файлы ретранслируем частями без полного скачивания
+                        reserved_bytes = await self.memory_budget.acquire(self.media_relay.buffer_bytes)
+                        try:
+                            sent_message = await self._send_relayed_media(message, text)
+                        except Exception as relay_error:
+                            # ИСПРАВЛЕНО: Неудача ретрансляции - не повод отправлять только подпись:
+                            # сообщение уходит в очередь повторов, подтвержденные части сохраняются
+                            self.logger.error(f"❌ Не удалось отправить большой файл ID:{message.id}: {relay_error}")
+                            self._note_failure(classify_failure(relay_error), relay_error)
+                            return False
+                    
+                    if sent_message is None:
                         # Для всех других типов медиа - скачиваем и загружаем заново
                         self.logger.debug(f"📥 Скачиваем медиа из сообщения ID:{message.id}")
                         
                         # ИСПРАВЛЕНИЕ: Получаем имя файла и тип медиа
                         file_name = self._get_media_filename(message.media, 0)
                         
+                        # НОВОЕ: Резервируем бюджет памяти (файлы в .part на диске память не занимают)
+                        if not self.resumable_downloader.should_resume(message.media):
+                            reserved_bytes = await self.memory_budget.acquire(self.media_builder.estimate_size(message.media))
+                        
                         # Скачиваем медиа файл в память
                         try:
-                            file_bytes = await self.client.download_media(message.media, file=bytes)
+                            if self.resumable_downloader.should_resume(message.media):
+                                # НОВОЕ: Большие файлы скачиваем в .part файл, чтобы перезапуск не терял прогресс
+                                file_bytes = await self.resumable_downloader.download(
+                                    message.media.document, file_name,
+                                    refresh_document=lambda: self._refresh_document(message)
+                                )
+                            else:
+                                file_bytes = await self._download_media_bytes(message.media)
                         except Exception as download_error:
                             if "file reference has expired" in str(download_error):
                                 self.logger.warning(f"📅 Файл ссылка истекла для сообщения ID:{message.id} - пытаемся обновить")
@@ -1370,7 +2570,7 @@ class TelegramCopier:
                                         refreshed_message = refreshed_messages[0]
                                         if refreshed_message.media:
                                             self.logger.debug(f"🔄 Повторно скачиваем медиа из обновленного сообщения ID:{refreshed_message.id}")
-                                            file_bytes = await self.client.download_media(refreshed_message.media, file=bytes)
+                                            file_bytes = await self._download_media_bytes(refreshed_message.media)
                                             
                                             if file_bytes:
                                                 self.logger.info(f"✅ Успешно скачан медиа после обновления file reference для ID:{message.id}")
@@ -1378,102 +2578,119 @@ class TelegramCopier:
                                                 message = refreshed_message
                                             else:
                                                 self.logger.warning(f"❌ Не удалось скачать медиа даже после обновления для ID:{message.id}")
+                                                self._note_failure(EXPIRED_REFERENCE, download_error)
                                                 return False
                                         else:
                                             self.logger.warning(f"❌ Обновленное сообщение ID:{message.id} не содержит медиа")
+                                            self._note_failure(EXPIRED_REFERENCE, download_error)
                                             return False
                                     else:
                                         self.logger.error(f"❌ Не удалось получить обновленное сообщение ID:{message.id}")
+                                        self._note_failure(EXPIRED_REFERENCE, download_error)
                                         return False
                                         
                                 except Exception as refresh_error:
                                     self.logger.error(f"❌ Ошибка обновления сообщения ID:{message.id}: {refresh_error}")
                                     self.logger.warning(f"📅 Пропускаем сообщение ID:{message.id} - file reference истек и не удалось обновить")
+                                    self._note_failure(EXPIRED_REFERENCE, refresh_error)
                                     return False
                                     
                             elif "self-destructing media" in str(download_error):
                                 self.logger.warning(f"💥 Самоуничтожающееся медиа в сообщении ID:{message.id} - пропускаем")
+                                self._note_failure(MEDIA_INVALID, download_error)
+                                return False
+                            elif self.resumable_downloader.should_resume(message.media):
+                                # ИСПРАВЛЕНО: Прерванное скачивание (FloodWait, обрыв соединения) не заменяется
+                                # отправкой текста - очередь повторов продолжит .part файл с подтвержденного смещения
+                                self.logger.error(f"❌ Скачивание большого файла ID:{message.id} прервано: {download_error}")
+                                self._note_failure(classify_failure(download_error), download_error)
                                 return False
                             else:
                                 raise download_error
                         
                         if file_bytes:
-                            self.logger.debug(f"✅ Успешно скачан файл: {len(file_bytes)} байт, имя: {file_name} (ID:{message.id})")
-                            
-                            # КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: Создаем BytesIO объект с именем файла
-                            file_obj = io.BytesIO(file_bytes)
-                            file_obj.name = file_name
-                            file_obj.seek(0)  # ИСПРАВЛЕНИЕ: Убеждаемся что указатель в начале файла
+                            downloaded_size = len(file_bytes) if isinstance(file_bytes, bytes) else os.path.getsize(file_bytes)
+                            self.logger.debug(f"✅ Успешно скачан файл: {downloaded_size} байт, имя: {file_name} (ID:{message.id})")
                             
+                            # НОВОЕ: Загружаем файл сами и передаем оригинальные атрибуты и миниатюру,
+                            # чтобы Telethon не анализировал байты, а Telegram не перекодировал файл
                             file_kwargs = {
                                 'entity': self.target_entity,
-                                'file': file_obj,  # Передаем BytesIO объект
                                 'caption': text,
                             }
                             
-                            # Для документов сохраняем принудительный режим документа, для фото - нет
-                            if isinstance(message.media, MessageMediaDocument):
-                                file_kwargs['force_document'] = True
-                            elif isinstance(message.media, MessageMediaPhoto):
-                                file_kwargs['force_document'] = False
-                            
                             if message.entities:
                                 file_kwargs['formatting_entities'] = message.entities
                             
                             # Отправляем с умной обработкой FloodWait
                             max_retries = 3
                             retry_count = 0
+                            input_media = None
                             
                             while retry_count < max_retries:
                                 try:
+                                    if input_media is None:
+                                        input_media = await self._upload_media(message.media, file_bytes, file_name)
+                                        file_kwargs['file'] = input_media
+                                    
+                                    await flood_wait_coordinator.wait('media')
                                     sent_message = await self.client.send_file(**file_kwargs)
                                     self.logger.debug(f"✅ Медиа сообщение ID:{message.id} успешно отправлено")
+                                    if isinstance(file_bytes, str):
+                                        self.resumable_downloader.discard(message.media.document.id)
+                                        self.media_uploader.finish(str(message.media.document.id))
                                     break
                                     
                                 except FloodWaitError as flood_error:
+                                    self.rate_limiter.record_flood_wait('media', flood_error.seconds)
                                     retry_count += 1
                                     await handle_media_flood_wait(flood_error, self.logger, message.id)
                                     
-                                    # КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: Пересоздаем BytesIO объект после FloodWait
-                                    # Длительное ожидание может повредить файловый объект
-                                    self.logger.info(f"🔄 Пересоздаем BytesIO объект после FloodWait для сообщения ID:{message.id}")
-                                    
-                                    # Создаем НОВЫЙ BytesIO объект из сохраненных байтов
-                                    file_obj = io.BytesIO(file_bytes)
-                                    file_obj.name = file_name
-                                    # Убеждаемся что указатель в начале файла
-                                    file_obj.seek(0)
-                                    
-                                    # Обновляем параметры отправки с новым файловым объектом
-                                    file_kwargs['file'] = file_obj
-                                    self.logger.debug(f"✅ Пересоздан BytesIO объект для повторной отправки сообщения ID:{message.id}")
-                                    
-                                    # Продолжаем попытку - FloodWait завершен
-                                    
+                                    # Загруженный файл уже на сервере - после FloodWait повторяем только отправку
                                     if retry_count >= max_retries:
                                         self.logger.error(f"❌ Исчерпаны попытки отправки сообщения ID:{message.id} после {max_retries} попыток FloodWait")
+                                        self._note_failure(FLOOD, flood_error)
                                         return False
                                         
                                     self.logger.info(f"🔄 Повторная попытка отправки сообщения ID:{message.id} ({retry_count}/{max_retries})")
                                     
+                                except FilePartMissingError:
+                                    # НОВОЕ: Части устарели на сервере - загружаем файл заново
+                                    retry_count += 1
+                                    self.logger.warning(f"🧩 Части файла ID:{message.id} не найдены на сервере - загружаем заново")
+                                    if isinstance(file_bytes, str):
+                                        self.media_uploader.finish(str(message.media.document.id))
+                                    input_media = None
+                                    
                                 except Exception as send_error:
                                     self.logger.error(f"❌ Неожиданная ошибка отправки сообщения ID:{message.id}: {send_error}")
+                                    self._note_failure(classify_failure(send_error), send_error)
                                     return False
                         else:
                             # Если не удалось скачать медиа, отправляем только текст
                             self.logger.warning(f"Не удалось скачать медиа из сообщения {message.id}, отправляем только текст")
+                            await flood_wait_coordinator.wait('text')
                             sent_message = await self.client.send_message(**send_kwargs)
                             
+                except FloodWaitError as flood_error:
+                    # ИСПРАВЛЕНО: Исчерпанные FloodWait - неудача для очереди повторов, а не отправка только текста
+                    self.logger.error(f"❌ Медиа сообщения ID:{message.id} не отправлено из-за FloodWait: {flood_error}")
+                    self._note_failure(FLOOD, flood_error)
+                    return False
+                    
                 except Exception as media_error:
                     self.logger.warning(f"Ошибка обработки медиа из сообщения {message.id}: {media_error}")
                     # Отправляем только текст в случае ошибки
                     try:
+                        await flood_wait_coordinator.wait('text')
                         sent_message = await self.client.send_message(**send_kwargs)
                     except Exception as text_error:
                         self.logger.error(f"Ошибка отправки текста сообщения {message.id}: {text_error}")
+                        self._note_failure(classify_failure(text_error), text_error)
                         return False
             else:
                 # Отправляем текстовое сообщение с сохранением форматирования
+                await flood_wait_coordinator.wait('text')
                 sent_message = await self.client.send_message(**send_kwargs)
             
             # ИСПРАВЛЕНИЕ: Обновляем трекер с реальным ID отправленного сообщения
@@ -1485,6 +2702,7 @@ class TelegramCopier:
             
         except MediaInvalidError as e:
             self.logger.warning(f"Медиа сообщения {message.id} недоступно: {e}")
+            self._note_failure(MEDIA_INVALID, e)
             # Пытаемся отправить только текст с сохранением форматирования
             if message.message:
                 try:
@@ -1495,7 +2713,11 @@ class TelegramCopier:
                     }
                     if message.entities:
                         text_kwargs['formatting_entities'] = message.entities
-                    await self.client.send_message(**text_kwargs)
+                    await flood_wait_coordinator.wait('text')
+                    sent_message = await self.client.send_message(**text_kwargs)
+                    # ИСПРАВЛЕНО: Отправленный текст отмечается в трекере - иначе поиск пропусков отправит его повторно
+                    if self.message_tracker:
+                        self.message_tracker.mark_message_copied(message.id, getattr(sent_message, 'id', None))
                     self.logger.info(f"Отправлен только текст сообщения {message.id} (медиа недоступно)")
                     return True
                 except Exception as text_error:
@@ -1504,7 +2726,11 @@ class TelegramCopier:
             
         except Exception as e:
             self.logger.error(f"Ошибка копирования сообщения {message.id}: {e}")
+            self._note_failure(classify_failure(e), e)
             return False
+        
+        finally:
+            self.memory_budget.release(reserved_bytes)
     
     def cleanup_temp_files(self) -> None:
         """Очистка временных файлов."""
@@ -1554,7 +2780,10 @@ class TelegramCopier:
                         failed += 1
                     
                     if not self.dry_run:
-                        await self.rate_limiter.wait_if_needed()
+                        send_class = self._send_class(message)
+                        await self.rate_limiter.wait_if_needed(send_class)
+                        if success:
+                            self.rate_limiter.record_message_sent(send_class)
         
         except Exception as e:
             self.logger.error(f"Ошибка копирования диапазона: {e}")
@@ -0,0 +1,225 @@
+"""
+Модуль поиска пропущенных сообщений (дыр) ниже точки возобновления.
+Возобновление по последнему скопированному ID не возвращается к сообщениям,
+которые не удалось скопировать или которые были пропущены. Манифест хранит
+ID исходного канала, которые копировщик собирался скопировать; разница
+манифеста и скопированных ID из трекера - список дыр.
+"""
+
+import bisect
+import json
+import logging
+import os
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+
+class IntervalSet:
+    """Множество целых чисел в виде отсортированных непересекающихся интервалов [start, end]."""
+
+    def __init__(self, intervals: Optional[Iterable[Tuple[int, int]]] = None):
+        """
+        Инициализация множества.
+
+        Args:
+            intervals: Интервалы [start, end] (включительно) в любом порядке
+        """
+        self._starts: List[int] = []
+        self._ends: List[int] = []
+        for start, end in intervals or ():
+            self.add_range(start, end)
+
+    @classmethod
+    def from_sorted_ids(cls, ids: Iterable[int]) -> 'IntervalSet':
+        """
+        Множество из ID по возрастанию (один проход, без поиска).
+
+        Args:
+            ids: ID по возрастанию (повторы допускаются)
+
+        Returns:
+            Множество
+        """
+        result = cls()
+        for value in ids:
+            if result._ends and value <= result._ends[-1] + 1:
+                result._ends[-1] = max(result._ends[-1], value)
+            else:
+                result._starts.append(value)
+                result._ends.append(value)
+        return result
+
+    def add(self, value: int) -> None:
+        """Добавление числа."""
+        # Быстрый путь: ID приходят по возрастанию
+        if self._ends and self._ends[-1] + 1 == value:
+            self._ends[-1] = value
+            return
+        self.add_range(value, value)
+
+    def add_range(self, start: int, end: int) -> None:
+        """Добавление интервала [start, end] со слиянием соседних и пересекающихся."""
+        if start > end:
+            return
+        # Интервалы [i, j) пересекаются с новым или примыкают к нему
+        i = bisect.bisect_left(self._ends, start - 1)
+        j = bisect.bisect_right(self._starts, end + 1)
+        if i < j:
+            start = min(start, self._starts[i])
+            end = max(end, self._ends[j - 1])
+        self._starts[i:j] = [start]
+        self._ends[i:j] = [end]
+
+    def discard(self, value: int) -> None:
+        """Удаление числа (интервал при необходимости делится на два)."""
+        k = bisect.bisect_right(self._starts, value) - 1
+        if k < 0 or self._ends[k] < value:
+            return
+        start, end = self._starts[k], self._ends[k]
+        pieces = [(s, e) for s, e in ((start, value - 1), (value + 1, end)) if s <= e]
+        self._starts[k:k + 1] = [s for s, _ in pieces]
+        self._ends[k:k + 1] = [e for _, e in pieces]
+
+    def difference(self, other: 'IntervalSet') -> 'IntervalSet':
+        """
+        Разность множеств за один проход по интервалам обоих.
+
+        Args:
+            other: Вычитаемое множество
+
+        Returns:
+            Новое множество self - other
+        """
+        result = IntervalSet()
+        j = 0
+        for start, end in self.intervals():
+            while j < len(other._starts) and other._ends[j] < start:
+                j += 1
+            current = start
+            k = j
+            while k < len(other._starts) and other._starts[k] <= end:
+                if other._starts[k] > current:
+                    result._starts.append(current)
+                    result._ends.append(other._starts[k] - 1)
+                current = max(current, other._ends[k] + 1)
+                k += 1
+            if current <= end:
+                result._starts.append(current)
+                result._ends.append(end)
+        return result
+
+    def up_to(self, max_value: int) -> 'IntervalSet':
+        """Числа не больше max_value."""
+        k = bisect.bisect_right(self._starts, max_value)
+        result = IntervalSet()
+        result._starts = self._starts[:k]
+        result._ends = self._ends[:k]
+        if result._ends and result._ends[-1] > max_value:
+            result._ends[-1] = max_value
+        return result
+
+    def intervals(self) -> List[Tuple[int, int]]:
+        """Интервалы [start, end] по возрастанию."""
+        return list(zip(self._starts, self._ends))
+
+    def describe(self, limit: int = 5) -> str:
+        """Краткая запись для лога: 10-15, 20, 31-40, ..."""
+        parts = [f"{start}-{end}" if start != end else str(start) for start, end in self.intervals()[:limit]]
+        if len(self._starts) > limit:
+            parts.append(f"... еще {len(self._starts) - limit} интервалов")
+        return ", ".join(parts)
+
+    def __contains__(self, value: int) -> bool:
+        k = bisect.bisect_right(self._starts, value) - 1
+        return k >= 0 and self._ends[k] >= value
+
+    def __iter__(self) -> Iterator[int]:
+        for start, end in zip(self._starts, self._ends):
+            yield from range(start, end + 1)
+
+    def __len__(self) -> int:
+        return sum(end - start + 1 for start, end in zip(self._starts, self._ends))
+
+    def __bool__(self) -> bool:
+        return bool(self._starts)
+
+
+class SourceManifest:
+    """Класс манифеста ID исходного канала, которые копировщик собирался скопировать."""
+
+    def __init__(self, path: str, source_key: Optional[str] = None):
+        """
+        Инициализация манифеста.
+
+        Args:
+            path: Путь к файлу манифеста (JSON со списком интервалов)
+            source_key: Идентификатор исходного канала (манифест другого канала не используется)
+        """
+        self.path = path
+        self.source_key = source_key
+        self.logger = logging.getLogger('telegram_copier.gap_detector')
+        self.ids = IntervalSet()
+        self.is_new = True
+        self._dirty = False
+        self._load()
+
+    def _load(self) -> None:
+        """Загрузка манифеста с диска."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            self.logger.warning(f"Не удалось загрузить манифест {self.path}: {e}")
+            return
+
+        if self.source_key and data.get('source') not in (None, self.source_key):
+            self.logger.warning(f"Манифест {self.path} относится к другому источнику ({data.get('source')}) - начинаем новый")
+            self._dirty = True
+            return
+        self.ids = IntervalSet(tuple(interval) for interval in data.get('intervals', []))
+        self.is_new = False
+
+    def add(self, message_id: int) -> None:
+        """Добавление ID сообщения источника."""
+        if message_id not in self.ids:
+            self.ids.add(message_id)
+            self._dirty = True
+
+    def add_many(self, message_ids: Iterable[int]) -> None:
+        """Добавление ID по возрастанию (перенос из трекера)."""
+        for message_id in message_ids:
+            self.add(message_id)
+
+    def discard(self, message_id: int) -> None:
+        """Удаление ID (сообщение удалено в источнике)."""
+        if message_id in self.ids:
+            self.ids.discard(message_id)
+            self._dirty = True
+
+    def gaps(self, copied: IntervalSet, up_to: int) -> IntervalSet:
+        """
+        Дыры: ID манифеста не больше up_to, которых нет среди скопированных.
+
+        Args:
+            copied: Скопированные ID (по трекеру)
+            up_to: Точка возобновления (сообщения выше нее и так будут прочитаны)
+
+        Returns:
+            Множество пропущенных ID
+        """
+        return self.ids.up_to(up_to).difference(copied)
+
+    def save(self) -> None:
+        """Атомарное сохранение манифеста (только при изменениях)."""
+        if not self._dirty:
+            return
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'source': self.source_key, 'intervals': self.ids.intervals()}, f)
+            os.replace(temp_path, self.path)
+            self._dirty = False
+            self.is_new = False
+        except OSError as e:
+            self.logger.warning(f"Не удалось сохранить манифест {self.path}: {e}")
@@ -11,7 +11,7 @@ from telethon import TelegramClient
 from telethon.tl.types import Channel, Chat, User
 
 from config import Config
-from utils import setup_logging
+from utils import setup_logging, RateLimiter
 
 
 async def get_group_info():
@@ -24,6 +24,15 @@ async def get_group_info():
 
     logger = setup_logging(config.log_level)
     
+    # Share the account's request budget with a copy or cleanup that may be running
+    rate_limiter = RateLimiter(
+        messages_per_hour=0,
+        class_limits={'history': config.rate_history_per_hour},
+        account_key=config.phone or config.session_name,
+        account_limit=config.rate_account_requests_per_hour,
+        ledger_file=config.rate_ledger_file or None
+    )
+    
     # Create client
     data_dir = '/app/data' if os.path.exists('/app/data') else '.'
     session_path = os.path.join(data_dir, config.session_name)
@@ -69,7 +78,9 @@ async def get_group_info():
                 
                 # Check permissions
                 try:
+                    await rate_limiter.wait_if_needed('history')
                     permissions = await client.get_permissions(entity)
+                    rate_limiter.record_message_sent('history')
                     if permissions.is_admin:
                         print("   ✅ Admin permissions - can delete any messages")
                     elif permissions.delete_messages:
@@ -89,7 +100,9 @@ async def get_group_info():
             print("-" * 40)
             
             try:
+                await rate_limiter.wait_if_needed('history')
                 entity = await client.get_entity(test_id)
+                rate_limiter.record_message_sent('history')
                 print(f"✅ Successfully found: {entity.title}")
                 print(f"   Type: {'Channel' if isinstance(entity, Channel) and entity.broadcast else 'Group'}")
                 print(f"   ID: {entity.id}")
@@ -97,7 +110,9 @@ async def get_group_info():
                 
                 # Check permissions
                 try:
+                    await rate_limiter.wait_if_needed('history')
                     permissions = await client.get_permissions(entity)
+                    rate_limiter.record_message_sent('history')
                     if permissions.is_admin:
                         print("   ✅ Admin permissions - can delete any messages")
                     elif permissions.delete_messages:
@@ -349,7 +349,18 @@ class TelegramCopierApp:
             # Создаем ограничитель скорости
             rate_limiter = RateLimiter(
                 messages_per_hour=self.config.messages_per_hour,
-                delay_seconds=self.config.delay_seconds
+                delay_seconds=self.config.delay_seconds,
+                class_limits={
+                    'text': getattr(self.config, 'rate_text_per_hour', self.config.messages_per_hour),
+                    'media': getattr(self.config, 'rate_media_per_hour', self.config.messages_per_hour),
+                    'history': getattr(self.config, 'rate_history_per_hour', 1200),
+                    'download': getattr(self.config, 'rate_download_mb_per_hour', 0)
+                },
+                adaptive=getattr(self.config, 'adaptive_rate', True),
+                account_key=self.config.phone or self.config.session_name,
+                max_factor=getattr(self.config, 'adaptive_rate_max_factor', 3.0),
+                account_limit=getattr(self.config, 'rate_account_requests_per_hour', 0),
+                ledger_file=getattr(self.config, 'rate_ledger_file', None) or None
             )
             
             # Создаем копировщик
@@ -362,12 +373,42 @@ class TelegramCopierApp:
                 resume_file=self.config.resume_file,
                 use_message_tracker=getattr(self.config, 'use_message_tracker', True),
                 tracker_file=getattr(self.config, 'tracker_file', 'copied_messages.json'),
+                tracker_backend=getattr(self.config, 'tracker_backend', 'sqlite'),
                 add_debug_tags=getattr(self.config, 'add_debug_tags', False),
-                flatten_structure=getattr(self.config, 'flatten_structure', False)
+                flatten_structure=getattr(self.config, 'flatten_structure', False),
+                album_upload_concurrency=getattr(self.config, 'album_upload_concurrency', 4),
+                relay_threshold_mb=getattr(self.config, 'relay_threshold_mb', 64),
+                relay_buffer_parts=getattr(self.config, 'relay_buffer_parts', 8),
+                relay_upload_workers=getattr(self.config, 'relay_upload_workers', 4),
+                resume_download_threshold_mb=getattr(self.config, 'resume_download_threshold_mb', 16),
+                resume_download_dir=getattr(self.config, 'resume_download_dir', 'partial_downloads'),
+                resume_download_max_age_hours=getattr(self.config, 'resume_download_max_age_hours', 72),
+                upload_resume_ttl_hours=getattr(self.config, 'upload_resume_ttl_hours', 6),
+                media_cache_mb=getattr(self.config, 'media_cache_mb', 512),
+                media_cache_dir=getattr(self.config, 'media_cache_dir', 'media_cache'),
+                media_memory_budget_mb=getattr(self.config, 'media_memory_budget_mb', 256),
+                upload_ahead_window=getattr(self.config, 'upload_ahead_window', 3),
+                flood_wait_read_ahead=getattr(self.config, 'flood_wait_read_ahead', True),
+                text_batch_size=getattr(self.config, 'text_batch_size', 10),
+                gap_detection=getattr(self.config, 'gap_detection', True),
+                source_manifest_file=getattr(self.config, 'source_manifest_file', 'source_manifest.json'),
+                retry_queue_file=getattr(self.config, 'retry_queue_file', 'retry_queue.json') or None,
+                retry_lane_limit=getattr(self.config, 'retry_lane_limit', 100),
+                checkpoint_every_messages=getattr(self.config, 'checkpoint_every_messages', 20),
+                checkpoint_every_seconds=getattr(self.config, 'checkpoint_every_seconds', 5.0),
+                state_store_file=getattr(self.config, 'state_store_file', 'copier_state.db') or None,
+                send_intent_journal=getattr(self.config, 'send_intent_journal', True),
+                reconcile_tail_messages=getattr(self.config, 'reconcile_tail_messages', 50),
+                dedup_capacity=getattr(self.config, 'dedup_capacity', 1000000),
+                dedup_max_age_days=getattr(self.config, 'dedup_max_age_days', 30)
             )
             
             # Проверяем, нужно ли возобновить с определенного места
-            resume_from_id = load_last_message_id(self.config.resume_file)
+            # НОВОЕ: С хранилищем состояния точка возобновления читается из него
+            if self.copier.state_store:
+                resume_from_id = self.copier.state_store.get('checkpoint')
+            else:
+                resume_from_id = load_last_message_id(self.config.resume_file)
             if resume_from_id:
                 content_lines = [
                     f"📍 С сообщения ID: {resume_from_id}",
@@ -591,7 +632,17 @@ if __name__ == '__main__':
         elif sys.argv[1] == 'reset':
             # Сброс прогресса копирования
             print("=== Сброс прогресса копирования ===")
-            files_to_remove = ['last_message_id.txt', 'message_hashes.json', 'copied_messages.json']
+            files_to_remove = ['last_message_id.txt', 'message_hashes.json', 'copied_messages.json',
+                               'copied_messages.json.journal', 'copied_messages.json.journal.compacting',
+                               'copied_messages.db', 'copied_messages.db-wal', 'copied_messages.db-shm',
+                               'copied_messages.trk', 'copied_messages.trk.journal', 'source_manifest.json',
+                               'retry_queue.json', 'copier_state.db', 'copier_state.db-wal', 'copier_state.db-shm',
+                               'processed_messages.db', 'processed_messages.db-wal', 'processed_messages.db-shm']
+            
+            # Файлы состояния лежат в папке данных, прежние версии писали их в текущую папку
+            data_dir = '/app/data' if os.path.exists('/app/data') else '.'
+            if data_dir != '.':
+                files_to_remove += [os.path.join(data_dir, file_name) for file_name in files_to_remove]
             
             removed_files = []
             for file_path in files_to_remove:
@@ -615,7 +666,8 @@ if __name__ == '__main__':
             print("=== Статистика копирования ===")
             try:
                 from message_tracker import MessageTracker
-                tracker = MessageTracker()
+                status_config = Config()
+                tracker = MessageTracker(status_config.tracker_file, backend=status_config.tracker_backend)
                 stats = tracker.get_statistics()
                 print(f"📊 Отслежено сообщений: {stats['total_tracked']}")
                 print(f"✅ Успешно скопировано: {stats['successfully_copied']}")
@@ -0,0 +1,260 @@
+"""
+Модуль для восстановления медиа из исходных сообщений.
+Строит InputMedia напрямую из message.media: по ссылке для документов
+(стикеры, GIF) и по значению для геоточек, опросов, контактов и кубиков,
+а для повторно загруженных файлов - с оригинальными атрибутами документа.
+"""
+
+import copy
+import inspect
+import logging
+import random
+from typing import Optional
+from telethon import utils
+from telethon.tl.types import (
+    Message, MessageMediaPhoto, MessageMediaDocument, MessageMediaGeo, MessageMediaGeoLive,
+    MessageMediaVenue, MessageMediaContact, MessageMediaPoll, MessageMediaDice,
+    InputMediaGeoPoint, InputMediaVenue, InputMediaContact, InputMediaPoll,
+    InputMediaDice, InputMediaDocument, InputGeoPoint, GeoPoint,
+    InputMediaUploadedPhoto, InputMediaUploadedDocument, PhotoSize, PhotoSizeProgressive, PhotoCachedSize,
+    DocumentAttributeSticker, DocumentAttributeAnimated, InputStickerSetEmpty,
+    DocumentAttributeVideo, DocumentAttributeAudio
+)
+
+
+# Атрибуты, при наличии которых документ отображается как медиа, а не как файл
+_MEDIA_DOCUMENT_ATTRIBUTES = (
+    DocumentAttributeVideo, DocumentAttributeAudio,
+    DocumentAttributeAnimated, DocumentAttributeSticker
+)
+
+# В новых слоях API правильные ответы викторины передаются индексами, в старых - байтами option
+_POLL_ANSWERS_AS_INDEXES = 'int' in str(
+    inspect.signature(InputMediaPoll.__init__).parameters['correct_answers'].annotation
+)
+
+
+class MediaBuilder:
+    """Класс для построения InputMedia из исходных медиа без загрузки байтов."""
+
+    def __init__(self, source_entity=None):
+        """
+        Инициализация построителя медиа.
+
+        Args:
+            source_entity: Entity исходной группы/канала (для проверки защиты от копирования)
+        """
+        self.source_entity = source_entity
+        self.logger = logging.getLogger('telegram_copier.media_builder')
+
+    def is_protected(self, message: Message) -> bool:
+        """
+        Проверка, запрещено ли копирование контента из источника.
+
+        Args:
+            message: Исходное сообщение
+
+        Returns:
+            True если сообщение или канал защищены от пересылки
+        """
+        if getattr(message, 'noforwards', False):
+            return True
+        return bool(getattr(self.source_entity, 'noforwards', False))
+
+    def build_reference_media(self, message: Message):
+        """
+        Построение InputMedia для медиа, которому не нужны байты файла.
+
+        Args:
+            message: Исходное сообщение с медиа
+
+        Returns:
+            InputMedia для отправки или None, если медиа нужно скачивать
+        """
+        media = message.media
+        if not media:
+            return None
+
+        try:
+            if isinstance(media, MessageMediaVenue):
+                geo_point = self._build_geo_point(media.geo)
+                if not geo_point:
+                    return None
+                return InputMediaVenue(
+                    geo_point=geo_point,
+                    title=media.title,
+                    address=media.address,
+                    provider=media.provider,
+                    venue_id=media.venue_id,
+                    venue_type=media.venue_type
+                )
+
+            if isinstance(media, (MessageMediaGeo, MessageMediaGeoLive)):
+                # Трансляция геопозиции в истории уже завершена - копируем как точку
+                geo_point = self._build_geo_point(media.geo)
+                return InputMediaGeoPoint(geo_point) if geo_point else None
+
+            if isinstance(media, MessageMediaContact):
+                return InputMediaContact(
+                    phone_number=media.phone_number or '',
+                    first_name=media.first_name or '',
+                    last_name=media.last_name or '',
+                    vcard=media.vcard or ''
+                )
+
+            if isinstance(media, MessageMediaPoll):
+                return self._build_poll(media, message.id)
+
+            if isinstance(media, MessageMediaDice):
+                # Значение кубика выбирает сервер, совпадет только эмодзи
+                return InputMediaDice(media.emoticon)
+
+            if isinstance(media, MessageMediaDocument) and media.document:
+                return self._build_document_reference(media, message)
+
+        except Exception as e:
+            self.logger.warning(f"Не удалось построить медиа по ссылке для сообщения {message.id}: {e}")
+
+        return None
+
+    def _build_geo_point(self, geo) -> Optional[InputGeoPoint]:
+        """Преобразование GeoPoint в InputGeoPoint (None для GeoPointEmpty)."""
+        if not isinstance(geo, GeoPoint):
+            return None
+        return InputGeoPoint(
+            lat=geo.lat,
+            long=geo.long,
+            accuracy_radius=geo.accuracy_radius
+        )
+
+    def _build_poll(self, media: MessageMediaPoll, message_id: int) -> Optional[InputMediaPoll]:
+        """
+        Копирование опроса по значению.
+
+        Для викторины нужны правильные ответы, которые видны только после голосования.
+        """
+        results = media.results
+        correct_answers = None
+
+        if media.poll.quiz:
+            voters = (results.results or []) if results else []
+            correct_options = [answer.option for answer in voters if answer.correct]
+            if _POLL_ANSWERS_AS_INDEXES:
+                correct_answers = [i for i, answer in enumerate(media.poll.answers) if answer.option in correct_options]
+            else:
+                correct_answers = correct_options
+            if not correct_answers:
+                self.logger.warning(f"Викторина в сообщении {message_id}: правильный ответ неизвестен, копирование невозможно")
+                return None
+
+        # Копируем объект целиком, чтобы не зависеть от набора полей Poll в текущем слое API
+        poll = copy.copy(media.poll)
+        poll.id = random.randint(1, 2 ** 62)
+        poll.closed = None
+
+        return InputMediaPoll(
+            poll=poll,
+            correct_answers=correct_answers,
+            solution=results.solution if results and media.poll.quiz else None,
+            solution_entities=results.solution_entities if results and media.poll.quiz else None
+        )
+
+    def _build_document_reference(self, media: MessageMediaDocument, message: Message) -> Optional[InputMediaDocument]:
+        """
+        Отправка документа по ссылке (без скачивания) для стикеров и GIF.
+
+        Стикеры из наборов публичны и доступны всегда, GIF - только если
+        источник не защищен от копирования.
+        """
+        document = media.document
+        attributes = getattr(document, 'attributes', None) or []
+
+        is_sticker = any(
+            isinstance(attr, DocumentAttributeSticker) and
+            not isinstance(attr.stickerset, InputStickerSetEmpty)
+            for attr in attributes
+        )
+        is_gif = any(isinstance(attr, DocumentAttributeAnimated) for attr in attributes)
+
+        if is_sticker or (is_gif and not self.is_protected(message)):
+            return InputMediaDocument(id=utils.get_input_document(document))
+
+        return None
+
+    def has_thumb(self, media) -> bool:
+        """
+        Проверка наличия у документа оригинальной миниатюры.
+
+        Args:
+            media: Медиа объект Telegram
+
+        Returns:
+            True если у документа есть миниатюра, которую стоит перенести
+        """
+        if not isinstance(media, MessageMediaDocument) or not media.document:
+            return False
+        thumbs = getattr(media.document, 'thumbs', None) or []
+        return any(isinstance(thumb, (PhotoSize, PhotoSizeProgressive)) for thumb in thumbs)
+
+    def estimate_size(self, media) -> int:
+        """
+        Оценка размера файла медиа до скачивания.
+
+        Args:
+            media: Медиа объект Telegram
+
+        Returns:
+            Размер в байтах (0, если медиа не скачивается или размер неизвестен)
+        """
+        if isinstance(media, MessageMediaDocument) and media.document:
+            return getattr(media.document, 'size', 0) or 0
+
+        if isinstance(media, MessageMediaPhoto) and media.photo:
+            # Скачивается самый большой размер фото
+            largest = 0
+            for size in getattr(media.photo, 'sizes', None) or []:
+                if isinstance(size, PhotoSize):
+                    largest = max(largest, size.size)
+                elif isinstance(size, PhotoSizeProgressive):
+                    largest = max(largest, max(size.sizes or [0]))
+                elif isinstance(size, PhotoCachedSize):
+                    largest = max(largest, len(size.bytes))
+            return largest
+
+        return 0
+
+    def build_uploaded_media(self, media, input_file, thumb=None):
+        """
+        Построение InputMedia для загруженного файла с оригинальными атрибутами.
+
+        Telethon не нужно угадывать атрибуты по байтам (MIME, длительность и размеры
+        видео, флаги анимации), а Telegram получает документ в исходном виде,
+        включая supports_streaming у видео.
+
+        Args:
+            media: Исходное медиа (MessageMediaPhoto или MessageMediaDocument)
+            input_file: Загруженный файл (InputFile/InputFileBig)
+            thumb: Загруженная оригинальная миниатюра или None
+
+        Returns:
+            InputMediaUploadedPhoto или InputMediaUploadedDocument
+        """
+        spoiler = getattr(media, 'spoiler', None) or None
+
+        if isinstance(media, MessageMediaPhoto):
+            return InputMediaUploadedPhoto(file=input_file, spoiler=spoiler)
+
+        document = media.document
+        attributes = list(getattr(document, 'attributes', None) or [])
+
+        # Документ без медиа-атрибутов был отправлен как файл - сохраняем это
+        force_file = not any(isinstance(attr, _MEDIA_DOCUMENT_ATTRIBUTES) for attr in attributes)
+
+        return InputMediaUploadedDocument(
+            file=input_file,
+            mime_type=getattr(document, 'mime_type', None) or 'application/octet-stream',
+            attributes=attributes,
+            thumb=thumb,
+            force_file=force_file or None,
+            spoiler=spoiler
+        )
@@ -0,0 +1,256 @@
+"""
+Модуль дискового кэша скачанных медиа.
+Хранит байты файлов по ID исходного документа/фото, чтобы повторы отправки,
+перезапуски после ошибок и копирование в дополнительные цели не скачивали файл заново.
+Файлы читаются и пишутся в пуле потоков - цикл событий не ждет диск.
+"""
+
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+from typing import List, Optional
+from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument
+
+
+class MediaCache:
+    """Класс LRU кэша медиа на диске с ограничением по объему."""
+
+    SUFFIX = '.bin'
+
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024):
+        """
+        Инициализация кэша.
+
+        Args:
+            directory: Папка для файлов кэша
+            max_bytes: Максимальный объем кэша в байтах (0 - кэш выключен)
+        """
+        self.directory = directory
+        self.max_bytes = max(0, max_bytes)
+        self.logger = logging.getLogger('telegram_copier.media_cache')
+        # Ключ -> размер, порядок от давно использованных к недавно использованным
+        self.entries: "OrderedDict[str, int]" = OrderedDict()
+        self.total_bytes = 0
+        # Объем файлов, которые сейчас записываются (уже учтен при вытеснении)
+        self.writing_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+        if self.max_bytes:
+            os.makedirs(directory, exist_ok=True)
+            self._scan()
+
+    @property
+    def enabled(self) -> bool:
+        """Включен ли кэш."""
+        return self.max_bytes > 0
+
+    def key_for(self, media) -> Optional[str]:
+        """
+        Ключ кэша для медиа: тип и ID исходного фото/документа.
+
+        Args:
+            media: Медиа объект Telegram
+
+        Returns:
+            Ключ или None, если медиа не кэшируется
+        """
+        if isinstance(media, MessageMediaPhoto) and media.photo:
+            return f"photo_{media.photo.id}"
+        if isinstance(media, MessageMediaDocument) and media.document:
+            return f"doc_{media.document.id}"
+        return None
+
+    def contains(self, media) -> bool:
+        """
+        Проверка наличия медиа в кэше (без обновления порядка LRU).
+
+        Args:
+            media: Медиа объект Telegram
+
+        Returns:
+            True если файл есть в кэше
+        """
+        key = self.key_for(media) if self.enabled else None
+        return key is not None and key in self.entries
+
+    async def get(self, media) -> Optional[bytes]:
+        """
+        Получение байтов медиа из кэша (файл читается в пуле потоков).
+
+        Args:
+            media: Медиа объект Telegram
+
+        Returns:
+            Байты файла или None при промахе
+        """
+        key = self.key_for(media) if self.enabled else None
+        if key is None or key not in self.entries:
+            if key is not None:
+                self.misses += 1
+            return None
+
+        size = self.entries[key]
+        try:
+            data = await asyncio.get_running_loop().run_in_executor(None, self._read, key)
+        except OSError as e:
+            self.logger.warning(f"Не удалось прочитать {key} из кэша: {e}")
+            self._forget(key)
+            self.misses += 1
+            return None
+
+        if len(data) != size:
+            self.logger.warning(f"Файл кэша {key} поврежден - удаляем")
+            self.discard(media)
+            self.misses += 1
+            return None
+
+        if key in self.entries:
+            self.entries.move_to_end(key)
+        self.hits += 1
+        self.logger.debug(f"💾 Медиа {key} взято из кэша ({len(data)} байт)")
+        return data
+
+    async def put(self, media, data: bytes) -> None:
+        """
+        Сохранение байтов медиа в кэш с вытеснением давно неиспользуемых файлов
+        (запись и удаление вытесненных файлов - в пуле потоков).
+
+        Args:
+            media: Медиа объект Telegram
+            data: Байты файла
+        """
+        key = self.key_for(media) if self.enabled else None
+        if key is None or not data or len(data) > self.max_bytes:
+            return
+
+        if key in self.entries:
+            self._forget(key)
+        evicted = self._evict(self.max_bytes - len(data))
+
+        # Объем резервируется до записи - параллельные сохранения не превышают бюджет
+        self.writing_bytes += len(data)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, self._write, key, data, evicted)
+        except OSError as e:
+            self.logger.warning(f"Не удалось сохранить {key} в кэш: {e}")
+            return
+        finally:
+            self.writing_bytes -= len(data)
+
+        self.entries[key] = len(data)
+        self.total_bytes += len(data)
+        # Параллельные сохранения могли вместе превысить бюджет - вытесняем лишнее
+        evicted = self._evict(self.max_bytes)
+        if evicted:
+            await asyncio.get_running_loop().run_in_executor(None, self._remove_files, evicted)
+
+    def discard(self, media) -> None:
+        """
+        Удаление медиа из кэша.
+
+        Args:
+            media: Медиа объект Telegram
+        """
+        key = self.key_for(media) if self.enabled else None
+        if key is None or key not in self.entries:
+            return
+        self._forget(key)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def get_statistics(self) -> dict:
+        """Статистика кэша."""
+        return {
+            'entries': len(self.entries),
+            'total_bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+    def _path(self, key: str) -> str:
+        """Путь к файлу кэша."""
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def _read(self, key: str) -> bytes:
+        """Чтение файла кэша (выполняется в пуле потоков)."""
+        path = self._path(key)
+        with open(path, 'rb') as f:
+            data = f.read()
+        # Время изменения файла хранит порядок LRU между запусками
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def _write(self, key: str, data: bytes, evicted: List[str]) -> None:
+        """Удаление вытесненных файлов и атомарная запись файла кэша (выполняется в пуле потоков)."""
+        self._remove_files(evicted)
+        path = self._path(key)
+        temp_path = f"{path}.{id(data)}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+    def _forget(self, key: str) -> None:
+        """Удаление записи из учета объема."""
+        self.total_bytes -= self.entries.pop(key, 0)
+
+    def _evict(self, target_bytes: int) -> List[str]:
+        """
+        Вытеснение давно неиспользуемых файлов из учета, пока объем (с записываемыми)
+        не станет не больше target_bytes.
+
+        Returns:
+            Ключи вытесненных файлов (файлы удаляет вызывающий)
+        """
+        evicted = []
+        while self.entries and self.total_bytes + self.writing_bytes > target_bytes:
+            key, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            evicted.append(key)
+            self.logger.debug(f"🧹 Медиа {key} вытеснено из кэша ({size} байт)")
+        return evicted
+
+    def _remove_files(self, keys: List[str]) -> None:
+        """Удаление файлов кэша."""
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _scan(self) -> None:
+        """Восстановление учета кэша по файлам на диске (порядок LRU - по времени изменения)."""
+        found = []
+        for file_name in os.listdir(self.directory):
+            path = os.path.join(self.directory, file_name)
+            if file_name.endswith('.tmp'):
+                # Недописанный файл после аварийного завершения
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            if not file_name.endswith(self.SUFFIX):
+                continue
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            found.append((stat.st_mtime, file_name[:-len(self.SUFFIX)], stat.st_size))
+
+        for _, key, size in sorted(found):
+            self.entries[key] = size
+            self.total_bytes += size
+
+        # Бюджет мог уменьшиться между запусками
+        self._remove_files(self._evict(self.max_bytes))
+
+        if self.entries:
+            self.logger.info(f"💾 Кэш медиа: {len(self.entries)} файлов, {self.total_bytes} байт")
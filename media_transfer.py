@@ -0,0 +1,524 @@
+"""
+Модуль для передачи больших медиа файлов.
+Ретранслирует части файла из скачивания прямо в загрузку без накопления в памяти,
+скачивает и загружает большие файлы с возобновлением после перезапуска.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from typing import Optional, Callable, Awaitable, Dict, Any, Set, Tuple
+from telethon import TelegramClient, helpers
+from telethon.errors import FloodWaitError, FileReferenceExpiredError
+from telethon.tl.functions.upload import SaveBigFilePartRequest
+from telethon.tl.types import InputFileBig, MessageMediaDocument
+from utils import handle_media_flood_wait, flood_wait_coordinator
+
+
+# Размер части для upload.saveBigFilePart (должен делиться на 1024, максимум 512 КБ)
+PART_SIZE = 512 * 1024
+
+# Файлы больше 10 МБ Telegram принимает только через saveBigFilePart
+BIG_FILE_THRESHOLD = 10 * 1024 * 1024
+
+
+class ResumableUploader:
+    """Класс для загрузки больших файлов частями с сохранением подтвержденных частей на диске."""
+
+    STATE_FILE = 'uploads.json'
+
+    def __init__(self, client: TelegramClient, directory: str, retention_hours: float = 6,
+                 upload_workers: int = 4, persist_every_parts: int = 8):
+        """
+        Инициализация загрузчика.
+
+        Args:
+            client: Авторизованный Telegram клиент
+            directory: Папка для файла состояния загрузок
+            retention_hours: Сколько часов сервер хранит загруженные части (после - загрузка заново)
+            upload_workers: Количество параллельных загрузчиков частей
+            persist_every_parts: Через сколько подтвержденных частей сохранять состояние
+        """
+        self.client = client
+        self.retention_seconds = max(0, retention_hours) * 3600
+        self.upload_workers = max(1, upload_workers)
+        self.persist_every_parts = max(1, persist_every_parts)
+        self.logger = logging.getLogger('telegram_copier.media_transfer')
+        self.state_path = os.path.join(directory, self.STATE_FILE)
+        self.uploads: Dict[str, Dict[str, Any]] = {}
+        self._acked: Dict[str, Set[int]] = {}
+        self._unsaved_acks = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._load_state()
+
+    def begin(self, key: str, file_size: int, file_name: str) -> Tuple[int, int, Set[int]]:
+        """
+        Начало или продолжение загрузки файла.
+
+        Незавершенная загрузка продолжается, если размер совпадает и окно хранения
+        частей на сервере еще не истекло, иначе начинается новая.
+
+        Args:
+            key: Ключ загрузки (ID исходного документа)
+            file_size: Размер файла в байтах
+            file_name: Имя файла (для логов)
+
+        Returns:
+            Кортеж (file_id, total_parts, подтвержденные части)
+        """
+        total_parts = (file_size + PART_SIZE - 1) // PART_SIZE
+        entry = self.uploads.get(key)
+
+        if entry and entry.get('size') == file_size and time.time() - entry.get('started', 0) < self.retention_seconds:
+            acked = self._acked.setdefault(key, set(entry.get('acked', [])))
+            self.logger.info(f"⏯️ Продолжаем загрузку {file_name}: подтверждено {len(acked)}/{total_parts} частей")
+            return entry['file_id'], total_parts, acked
+
+        if entry:
+            self.logger.info(f"🔄 Незавершенная загрузка {file_name} устарела - загружаем заново")
+
+        file_id = helpers.generate_random_long()
+        self.uploads[key] = {'file_id': file_id, 'size': file_size, 'started': time.time(), 'acked': []}
+        self._acked[key] = set()
+        self._save_state()
+        return file_id, total_parts, self._acked[key]
+
+    def finish(self, key: str) -> None:
+        """
+        Удаление состояния после успешной отправки или для загрузки с нуля.
+
+        Args:
+            key: Ключ загрузки
+        """
+        self._acked.pop(key, None)
+        if self.uploads.pop(key, None) is not None:
+            self._save_state()
+
+    def flush(self) -> None:
+        """Сохранение еще не записанных подтверждений частей."""
+        if self._unsaved_acks:
+            self._save_state()
+
+    async def upload_path(self, key: str, path: str, file_name: str) -> InputFileBig:
+        """
+        Загрузка файла с диска, пропуская уже подтвержденные части.
+
+        Args:
+            key: Ключ загрузки (ID исходного документа)
+            path: Путь к файлу
+            file_name: Имя файла
+
+        Returns:
+            InputFileBig, готовый для InputMediaUploadedDocument
+        """
+        file_size = os.path.getsize(path)
+        file_id, total_parts, acked = self.begin(key, file_size, file_name)
+        missing_parts = [i for i in range(total_parts) if i not in acked]
+        next_part = iter(missing_parts)
+
+        async def upload_parts():
+            with open(path, 'rb') as source:
+                for part_index in next_part:
+                    source.seek(part_index * PART_SIZE)
+                    chunk = source.read(PART_SIZE)
+                    await self.save_part(key, file_id, part_index, total_parts, chunk)
+
+        tasks = [asyncio.create_task(upload_parts()) for _ in range(self.upload_workers)]
+
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            self.flush()
+
+        return InputFileBig(id=file_id, parts=total_parts, name=file_name)
+
+    async def save_part(self, key: str, file_id: int, part_index: int, total_parts: int, chunk: bytes,
+                        max_retries: int = 3) -> None:
+        """
+        Загрузка одной части большого файла с повторами и запоминанием подтверждения.
+
+        Args:
+            key: Ключ загрузки
+            file_id: Идентификатор загружаемого файла
+            part_index: Номер части
+            total_parts: Общее количество частей
+            chunk: Байты части
+            max_retries: Максимум попыток для ошибок, отличных от FloodWait
+        """
+        attempt = 0
+        while True:
+            try:
+                # Пока у аккаунта идет FloodWait загрузки, новые части не отправляем
+                await flood_wait_coordinator.wait('upload')
+                result = await self.client(SaveBigFilePartRequest(file_id, part_index, total_parts, chunk))
+                if not result:
+                    raise RuntimeError(f"Сервер не подтвердил часть {part_index}")
+                break
+            except FloodWaitError as flood_error:
+                flood_wait_coordinator.pause('upload', flood_error.seconds)
+                # Подтвержденные части сохраняем до ожидания - процесс может быть перезапущен
+                self.flush()
+                # Без ID сообщения: состояние возобновления сохраняет вызывающий код
+                self.logger.warning(f"📸 FloodWait при загрузке части {part_index}/{total_parts}")
+                await handle_media_flood_wait(flood_error, self.logger)
+            except Exception as e:
+                attempt += 1
+                if attempt >= max_retries:
+                    raise
+                self.logger.warning(f"⚠️ Ошибка загрузки части {part_index}: {e}, повтор {attempt}/{max_retries}")
+                await asyncio.sleep(attempt)
+
+        acked = self._acked.get(key)
+        if acked is not None:
+            acked.add(part_index)
+            self._unsaved_acks += 1
+            if self._unsaved_acks >= self.persist_every_parts:
+                self._save_state()
+
+    def _load_state(self) -> None:
+        """Загрузка состояния незавершенных загрузок, устаревшие записи отбрасываются."""
+        try:
+            if os.path.exists(self.state_path):
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    self.uploads = json.load(f)
+        except Exception as e:
+            self.logger.warning(f"Не удалось загрузить состояние загрузок: {e}")
+            self.uploads = {}
+
+        cutoff = time.time() - self.retention_seconds
+        expired = [key for key, entry in self.uploads.items() if entry.get('started', 0) < cutoff]
+        for key in expired:
+            del self.uploads[key]
+        if expired:
+            self._save_state()
+
+    def _save_state(self) -> None:
+        """Атомарное сохранение состояния (временный файл + rename)."""
+        for key, acked in self._acked.items():
+            if key in self.uploads:
+                self.uploads[key]['acked'] = sorted(acked)
+        self._unsaved_acks = 0
+
+        temp_path = f"{self.state_path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.uploads, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.state_path)
+        except Exception as e:
+            self.logger.warning(f"Не удалось сохранить состояние загрузок: {e}")
+
+
+class StreamingRelay:
+    """Класс для ретрансляции больших файлов: части скачивания сразу уходят в загрузку."""
+
+    def __init__(self, client: TelegramClient, uploader: ResumableUploader,
+                 threshold_bytes: int = 64 * 1024 * 1024, buffer_parts: int = 8):
+        """
+        Инициализация ретранслятора.
+
+        Args:
+            client: Авторизованный Telegram клиент
+            uploader: Загрузчик частей с сохранением прогресса
+            threshold_bytes: Минимальный размер документа для ретрансляции (0 - выключено)
+            buffer_parts: Емкость кольцевого буфера в частях по 512 КБ
+        """
+        self.client = client
+        self.uploader = uploader
+        self.threshold_bytes = max(threshold_bytes, BIG_FILE_THRESHOLD + 1) if threshold_bytes > 0 else 0
+        self.buffer_parts = max(1, buffer_parts)
+        self.logger = logging.getLogger('telegram_copier.media_transfer')
+
+    @property
+    def buffer_bytes(self) -> int:
+        """Максимум байтов, которые ретрансляция держит в памяти."""
+        return (self.buffer_parts + self.uploader.upload_workers) * PART_SIZE
+
+    def should_relay(self, media) -> bool:
+        """
+        Проверка, нужно ли передавать медиа через ретрансляцию.
+
+        Args:
+            media: Медиа объект Telegram
+
+        Returns:
+            True для документов не меньше порога
+        """
+        if not self.threshold_bytes or not isinstance(media, MessageMediaDocument) or not media.document:
+            return False
+        return getattr(media.document, 'size', 0) >= self.threshold_bytes
+
+    async def relay(self, document, file_name: str) -> InputFileBig:
+        """
+        Передача документа: скачанные части сразу загружаются как части большого файла.
+
+        Память ограничена буфером (buffer_parts + upload_workers) * 512 КБ,
+        а время передачи стремится к max(скачивание, загрузка). Если часть файла
+        уже загружена в прошлый раз, скачивание начинается с первой недостающей части.
+
+        Args:
+            document: Исходный документ (Document)
+            file_name: Имя файла для загрузки
+
+        Returns:
+            InputFileBig, готовый для InputMediaUploadedDocument
+        """
+        key = str(document.id)
+        file_size = document.size
+        file_id, total_parts, acked = self.uploader.begin(key, file_size, file_name)
+        first_missing = next((i for i in range(total_parts) if i not in acked), total_parts)
+        upload_workers = self.uploader.upload_workers
+        buffer: asyncio.Queue = asyncio.Queue(maxsize=self.buffer_parts)
+
+        self.logger.info(f"🔁 Ретрансляция {file_name}: {total_parts - len(acked)}/{total_parts} частей, буфер {self.buffer_parts} частей")
+
+        async def download_parts():
+            part_index = first_missing
+            if part_index < total_parts:
+                await flood_wait_coordinator.wait('download')
+                async for chunk in self.client.iter_download(
+                    document,
+                    offset=part_index * PART_SIZE,
+                    request_size=PART_SIZE,
+                    chunk_size=PART_SIZE,
+                    file_size=file_size
+                ):
+                    if part_index not in acked:
+                        await buffer.put((part_index, bytes(chunk)))
+                    part_index += 1
+            if part_index != total_parts:
+                raise RuntimeError(f"Скачано {part_index} частей из {total_parts} для {file_name}")
+            for _ in range(upload_workers):
+                await buffer.put(None)
+
+        async def upload_parts():
+            while True:
+                item = await buffer.get()
+                if item is None:
+                    return
+                part_index, chunk = item
+                await self.uploader.save_part(key, file_id, part_index, total_parts, chunk)
+
+        tasks = [asyncio.create_task(download_parts())]
+        tasks.extend(asyncio.create_task(upload_parts()) for _ in range(upload_workers))
+
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            self.uploader.flush()
+
+        self.logger.debug(f"✅ Ретрансляция {file_name} завершена")
+        return InputFileBig(id=file_id, parts=total_parts, name=file_name)
+
+
+class ResumableDownloader:
+    """Класс для скачивания больших файлов в .part файлы с возобновлением после перезапуска."""
+
+    INDEX_FILE = 'index.json'
+
+    def __init__(self, client: TelegramClient, directory: str, threshold_bytes: int = 16 * 1024 * 1024,
+                 sync_every_parts: int = 8):
+        """
+        Инициализация загрузчика.
+
+        Args:
+            client: Авторизованный Telegram клиент
+            directory: Папка для .part файлов и индекса
+            threshold_bytes: Минимальный размер документа для скачивания с возобновлением (0 - выключено)
+            sync_every_parts: Через сколько частей фиксировать смещение на диске
+        """
+        self.client = client
+        self.directory = directory
+        self.threshold_bytes = max(0, threshold_bytes)
+        self.sync_every_parts = max(1, sync_every_parts)
+        self.logger = logging.getLogger('telegram_copier.media_transfer')
+        self.index_path = os.path.join(directory, self.INDEX_FILE)
+        self.index: Dict[str, Dict[str, Any]] = {}
+        # Индекс пишется и из пула потоков (фиксация смещения) - запись файла под блокировкой
+        self._index_lock = threading.Lock()
+
+        if self.threshold_bytes:
+            os.makedirs(directory, exist_ok=True)
+            self._load_index()
+
+    def should_resume(self, media) -> bool:
+        """
+        Проверка, нужно ли скачивать медиа с возобновлением.
+
+        Args:
+            media: Медиа объект Telegram
+
+        Returns:
+            True для документов не меньше порога
+        """
+        if not self.threshold_bytes or not isinstance(media, MessageMediaDocument) or not media.document:
+            return False
+        return getattr(media.document, 'size', 0) >= self.threshold_bytes
+
+    def part_path(self, document_id: int) -> str:
+        """Путь к .part файлу документа."""
+        return os.path.join(self.directory, f"{document_id}.part")
+
+    async def download(self, document, file_name: str,
+                       refresh_document: Optional[Callable[[], Awaitable[Any]]] = None) -> str:
+        """
+        Скачивание документа в .part файл, продолжая с последнего подтвержденного смещения.
+
+        Args:
+            document: Исходный документ (Document)
+            file_name: Имя файла (для логов)
+            refresh_document: Корутина, возвращающая документ со свежей file reference
+
+        Returns:
+            Путь к полностью скачанному .part файлу
+        """
+        key = str(document.id)
+        file_size = document.size
+        path = self.part_path(document.id)
+        offset = self._verified_offset(key, path, file_size)
+
+        if offset:
+            self.logger.info(f"⏯️ Продолжаем скачивание {file_name} с {offset}/{file_size} байт")
+
+        reference_refreshed = False
+        with open(path, 'r+b' if os.path.exists(path) else 'wb') as part_file:
+            part_file.truncate(offset)
+            part_file.seek(offset)
+
+            while offset < file_size:
+                try:
+                    parts_since_sync = 0
+                    await flood_wait_coordinator.wait('download')
+                    async for chunk in self.client.iter_download(
+                        document,
+                        offset=offset,
+                        request_size=PART_SIZE,
+                        chunk_size=PART_SIZE,
+                        file_size=file_size
+                    ):
+                        part_file.write(chunk)
+                        offset += len(chunk)
+                        parts_since_sync += 1
+                        if parts_since_sync >= self.sync_every_parts:
+                            await self._commit_offset(key, part_file, offset, file_size)
+                            parts_since_sync = 0
+                    await self._commit_offset(key, part_file, offset, file_size)
+
+                    if offset < file_size:
+                        raise RuntimeError(f"Скачано {offset} из {file_size} байт для {file_name}")
+
+                except FileReferenceExpiredError:
+                    # Уже записанные части остаются, продолжаем со свежей ссылкой
+                    await self._commit_offset(key, part_file, offset, file_size)
+                    if reference_refreshed or refresh_document is None:
+                        raise
+                    reference_refreshed = True
+                    self.logger.warning(f"📅 Файл ссылка истекла при скачивании {file_name} - обновляем")
+                    fresh_document = await refresh_document()
+                    if fresh_document is None:
+                        raise
+                    document = fresh_document
+
+                except BaseException:
+                    # Фиксируем то, что уже записано, чтобы следующий запуск продолжил отсюда
+                    await self._commit_offset(key, part_file, offset, file_size)
+                    raise
+
+        self.logger.debug(f"✅ Скачивание {file_name} завершено ({file_size} байт)")
+        return path
+
+    def discard(self, document_id: int) -> None:
+        """
+        Удаление .part файла и записи индекса после успешной отправки.
+
+        Args:
+            document_id: ID исходного документа
+        """
+        key = str(document_id)
+        path = self.part_path(document_id)
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            self.logger.warning(f"Не удалось удалить {path}: {e}")
+        if self.index.pop(key, None) is not None:
+            self._save_index()
+
+    def cleanup_stale(self, max_age_hours: int = 72) -> None:
+        """
+        Удаление незавершенных скачиваний, к которым давно не возвращались.
+
+        Args:
+            max_age_hours: Максимальный возраст записи в часах
+        """
+        cutoff = time.time() - max_age_hours * 3600
+        stale_keys = [key for key, entry in self.index.items() if entry.get('updated', 0) < cutoff]
+        for key in stale_keys:
+            self.discard(int(key))
+        if stale_keys:
+            self.logger.info(f"🧹 Удалено {len(stale_keys)} устаревших незавершенных скачиваний")
+
+    def _verified_offset(self, key: str, path: str, file_size: int) -> int:
+        """Смещение, с которого можно продолжить: подтверждено индексом, есть на диске и кратно части."""
+        entry = self.index.get(key)
+        if not entry or entry.get('size') != file_size or not os.path.exists(path):
+            return 0
+        offset = min(entry.get('offset', 0), os.path.getsize(path))
+        return offset - offset % PART_SIZE
+
+    async def _commit_offset(self, key: str, part_file, offset: int, file_size: int) -> None:
+        """
+        Сброс данных на диск и запись подтвержденного смещения в индекс.
+        ИСПРАВЛЕНО: fsync части и индекса выполняется в пуле потоков - цикл событий не ждет диск.
+        """
+        self.index[key] = {'offset': offset, 'size': file_size, 'updated': time.time()}
+        await asyncio.get_running_loop().run_in_executor(None, self._sync_offset, part_file, dict(self.index))
+
+    def _sync_offset(self, part_file, index: Dict[str, Dict[str, Any]]) -> None:
+        """Сброс .part файла на диск, затем сохранение индекса (индекс не опережает данные)."""
+        part_file.flush()
+        os.fsync(part_file.fileno())
+        self._save_index(index)
+
+    def _load_index(self) -> None:
+        """Загрузка индекса незавершенных скачиваний."""
+        try:
+            if os.path.exists(self.index_path):
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    self.index = json.load(f)
+        except Exception as e:
+            self.logger.warning(f"Не удалось загрузить индекс скачиваний: {e}")
+            self.index = {}
+
+    def _save_index(self, index: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+        """
+        Атомарное сохранение индекса (временный файл + rename).
+
+        Args:
+            index: Снимок индекса (по умолчанию - текущий)
+        """
+        temp_path = f"{self.index_path}.tmp"
+        try:
+            with self._index_lock:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.index if index is None else index, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self.index_path)
+        except Exception as e:
+            self.logger.warning(f"Не удалось сохранить индекс скачиваний: {e}")
@@ -17,7 +17,7 @@ from telethon.errors import FloodWaitError, MessageDeleteForbiddenError, Message
 from telethon.tl.types import Message
 
 from config import Config
-from utils import setup_logging, RateLimiter, handle_flood_wait
+from utils import setup_logging, RateLimiter, handle_flood_wait, flood_wait_coordinator
 
 
 class MessageDeleter:
@@ -51,10 +51,17 @@ class MessageDeleter:
         # Configurable batch size
         self.batch_size = self.config.deletion_batch_size
         
-        # Rate limiter with configurable settings
+        # Rate limiter with configurable settings: one delete batch is one request
         self.rate_limiter = RateLimiter(
             messages_per_hour=self.config.deletion_messages_per_hour,
-            delay_seconds=self.config.deletion_delay_seconds
+            delay_seconds=self.config.deletion_delay_seconds,
+            class_limits={'delete': self.config.deletion_requests_per_hour},
+            class_delays={'delete': self.config.deletion_delay_seconds},
+            adaptive=self.config.adaptive_rate,
+            account_key=self.config.phone or self.config.session_name,
+            max_factor=self.config.adaptive_rate_max_factor,
+            account_limit=self.config.rate_account_requests_per_hour,
+            ledger_file=self.config.rate_ledger_file or None
         )
         
         # Statistics
@@ -202,6 +209,7 @@ class MessageDeleter:
             # Use delete_messages for batch deletion (more efficient)
             # Use target_entity if available (like in copier), otherwise fall back to target_group_id
             target = self.target_entity if self.target_entity else self.target_group_id
+            await flood_wait_coordinator.wait('delete')
             deleted_messages = await self.client.delete_messages(
                 target, 
                 message_ids
@@ -225,6 +233,7 @@ class MessageDeleter:
             return 0
         except FloodWaitError as e:
             self.logger.warning(f"Rate limited, waiting {e.seconds} seconds...")
+            self.rate_limiter.record_flood_wait('delete', e.seconds)
             await handle_flood_wait(e, self.logger, f"deleting batch {message_ids}")
             # Retry the batch after flood wait
             return await self._delete_message_batch(message_ids)
@@ -268,7 +277,7 @@ class MessageDeleter:
                 self.logger.info(f"Processing batch: {current_id} to {batch_end} ({len(batch_ids)} messages)")
                 
                 # Apply rate limiting (only 1 second delay between batches)
-                await self.rate_limiter.wait_if_needed()
+                await self.rate_limiter.wait_if_needed('delete')
                 
                 # Delete the batch
                 deleted_in_batch = await self._delete_message_batch(batch_ids)
@@ -278,9 +287,8 @@ class MessageDeleter:
                 failed_in_batch = len(batch_ids) - deleted_in_batch
                 self.failed_count += failed_in_batch
                 
-                # Record the batch operation for rate limiting (count as batch_size messages)
-                for _ in range(len(batch_ids)):
-                    self.rate_limiter.record_message_sent()
+                # Record the batch operation for rate limiting (one deleteMessages request)
+                self.rate_limiter.record_message_sent('delete')
                 
                 # Progress update with time estimation
                 processed = batch_end - self.start_id + 1
@@ -310,6 +318,7 @@ class MessageDeleter:
             self.logger.error(f"Fatal error during deletion: {e}")
             return False
         finally:
+            self.rate_limiter.save_state()
             if self.client:
                 await self.client.disconnect()
 
@@ -2,41 +2,198 @@
 """
 Модуль для отслеживания скопированных сообщений.
 Обеспечивает точный учет всех операций копирования.
+
+НОВОЕ: Хранилище подключаемое. JSON - снимок copied_messages.json и журнал
+с групповой фиксацией. SQLite - индексы по source_id, target_id и status и
+счетчики, поэтому запуск и проверки не зависят от объема истории. При первом
+запуске SQLite данные переносятся из copied_messages.json.
+
+НОВОЕ: Все хранилища поддерживают обратный поиск: по ID в целевом канале,
+grouped_id альбома и времени копирования (см. tracker_query.py).
 """
 
+import atexit
+import bisect
 import json
 import logging
+import mmap
 import os
-from typing import Dict, List, Optional, Any
+import sqlite3
+import struct
+import threading
+from array import array
+from collections import defaultdict
+from typing import Dict, List, Optional, Any, Set, Tuple
 from datetime import datetime
 
 
-class MessageTracker:
-    """Класс для отслеживания скопированных сообщений."""
+class TrackerBackend:
+    """
+    НОВОЕ: Базовый класс хранилища трекера с групповой фиксацией.
+    Изменения накапливаются и пишутся пачкой каждые flush_every записей
+    или через flush_interval_ms после первой незаписанной.
+    """
     
-    def __init__(self, tracker_file: str = "copied_messages.json"):
+    def __init__(self, flush_every: int = 50, flush_interval_ms: int = 250, read_only: bool = False):
         """
-        Инициализация трекера сообщений.
+        Инициализация хранилища.
         
         Args:
-            tracker_file: Путь к файлу для хранения информации
+            flush_every: Сколько записей накапливать до записи на диск
+            flush_interval_ms: Максимальная задержка записи накопленных записей (мс)
+            read_only: Только чтение - файлы хранилища не создаются и не изменяются
         """
-        self.tracker_file = tracker_file
+        self.read_only = read_only
+        self.flush_every = max(1, flush_every)
+        self.flush_interval = max(0, flush_interval_ms) / 1000.0
         self.logger = logging.getLogger('telegram_copier.tracker')
+        
+        # Таймер записи работает в другом потоке
+        self._lock = threading.RLock()
+        self._pending: List[Any] = []
+        self._flush_timer: Optional[threading.Timer] = None
+    
+    def _ensure_writable(self) -> None:
+        """ИСПРАВЛЕНО: Изменение хранилища, открытого только для чтения, - ошибка."""
+        if self.read_only:
+            raise RuntimeError("Трекер открыт только для чтения")
+    
+    def _enqueue(self, record: Any) -> None:
+        """Добавление записи в очередь групповой фиксации."""
+        self._ensure_writable()
+        with self._lock:
+            self._pending.append(record)
+            if len(self._pending) >= self.flush_every or not self.flush_interval:
+                self.flush()
+            elif self._flush_timer is None:
+                self._flush_timer = threading.Timer(self.flush_interval, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+    
+    def flush(self) -> None:
+        """Запись накопленных записей на диск."""
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            if not self._pending:
+                return
+            try:
+                self._write(self._pending)
+            except Exception as e:
+                self.logger.error(f"Ошибка записи трекинга: {e}")
+                return
+            self._pending = []
+    
+    def close(self) -> None:
+        """Запись накопленных записей перед завершением."""
+        self.flush()
+    
+    def _write(self, records: List[Any]) -> None:
+        """Запись пачки записей (реализуется хранилищем)."""
+        raise NotImplementedError
+    
+    def set_channels(self, source_channel: str, target_channel: str) -> None:
+        """Сохранение информации о каналах."""
+        raise NotImplementedError
+    
+    def get_entry(self, source_id: str) -> Optional[Dict[str, Any]]:
+        """Запись о сообщении по ID в исходном канале."""
+        raise NotImplementedError
+    
+    def put_entries(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        """Сохранение записей о сообщениях (source_id -> запись)."""
+        raise NotImplementedError
+    
+    def delete_failed(self) -> int:
+        """Удаление записей о неудачных попытках, возвращает их количество."""
+        raise NotImplementedError
+    
+    def statistics(self) -> Dict[str, Any]:
+        """Статистика в формате MessageTracker.get_statistics()."""
+        raise NotImplementedError
+    
+    def last_copied_id(self) -> Optional[int]:
+        """Максимальный ID успешно скопированного сообщения."""
+        raise NotImplementedError
+    
+    def tracked_ids(self, status: Optional[str] = None) -> List[int]:
+        """НОВОЕ: ID отслеживаемых сообщений по возрастанию (status - только с этим статусом)."""
+        raise NotImplementedError
+    
+    def sources_by_target(self, target_id: int) -> List[int]:
+        """НОВОЕ: ID исходных сообщений, скопированных в сообщение target_id (по возрастанию)."""
+        raise NotImplementedError
+    
+    def sources_by_grouped_id(self, grouped_id: int) -> List[int]:
+        """НОВОЕ: ID исходных сообщений альбома grouped_id (по возрастанию)."""
+        raise NotImplementedError
+    
+    def sources_between(self, since: Optional[str], until: Optional[str]) -> List[int]:
+        """НОВОЕ: ID сообщений, отмеченных в интервале [since, until] (время ISO, None - без границы)."""
+        raise NotImplementedError
+
+
+class JsonTrackerBackend(TrackerBackend):
+    """
+    Хранилище трекера в JSON: снимок copied_messages.json и журнал изменений
+    (по строке JSON на операцию), который в фоне переносится в снимок.
+    """
+    
+    def __init__(self, tracker_file: str = "copied_messages.json", flush_every: int = 50,
+                 flush_interval_ms: int = 250, compact_every: int = 20000, read_only: bool = False):
+        """
+        Инициализация хранилища.
+        
+        Args:
+            tracker_file: Путь к файлу снимка
+            flush_every: Сколько записей накапливать до записи журнала на диск
+            flush_interval_ms: Максимальная задержка записи накопленных записей (мс)
+            compact_every: Через сколько записей журнала пересобирать снимок
+            read_only: Только чтение - журнал применяется в памяти, снимок не пересобирается
+        """
+        super().__init__(flush_every, flush_interval_ms, read_only)
+        self.tracker_file = tracker_file
+        self.journal_file = f"{tracker_file}.journal"
+        # Журнал, который в этот момент переносится в снимок
+        self.compacting_file = f"{tracker_file}.journal.compacting"
+        self.compact_every = max(1, compact_every)
+        
+        self._journal_records = 0
+        self._compaction_thread: Optional[threading.Thread] = None
+        # Обратные индексы (поле -> значение -> source_id), строятся при первом поиске
+        self._reverse: Optional[Dict[str, Dict[int, Set[str]]]] = None
+        
         self.data = self._load_data()
     
     def _load_data(self) -> Dict[str, Any]:
-        """Загрузка данных из файла."""
+        """Загрузка снимка и повтор записей журнала, не попавших в снимок."""
+        data = None
         if os.path.exists(self.tracker_file):
             try:
                 with open(self.tracker_file, 'r', encoding='utf-8') as f:
                     data = json.load(f)
-                    self.logger.info(f"Загружена информация о {len(data.get('copied_messages', {}))} скопированных сообщениях")
-                    return data
             except Exception as e:
                 self.logger.error(f"Ошибка загрузки файла трекинга: {e}")
         
-        # Создаем новую структуру данных
+        if data is None:
+            data = self._empty_data()
+        
+        # Журнал после аварийного завершения: сначала прерванная пересборка, затем текущий
+        replayed = self._replay(self.compacting_file, data) + self._replay(self.journal_file, data)
+        if replayed:
+            self.logger.info(f"🔁 Восстановлено {replayed} записей журнала трекинга")
+            # Переносим восстановленное в снимок, чтобы начать с пустого журнала
+            # ИСПРАВЛЕНО: при чтении журнал остается на месте - его допишет и перенесет копировщик
+            if not self.read_only and self._write_snapshot(data) and os.path.exists(self.journal_file):
+                os.remove(self.journal_file)
+        
+        if data.get('copied_messages'):
+            self.logger.info(f"Загружена информация о {len(data['copied_messages'])} скопированных сообщениях")
+        return data
+    
+    def _empty_data(self) -> Dict[str, Any]:
+        """Новая структура данных."""
         return {
             "copied_messages": {},  # source_id -> {target_id, timestamp, status}
             "statistics": {
@@ -48,24 +205,968 @@ class MessageTracker:
             "target_channel": None
         }
     
-    def _save_data(self):
-        """Сохранение данных в файл."""
+    def _replay(self, path: str, data: Dict[str, Any]) -> int:
+        """
+        Применение записей журнала к данным.
+        
+        Записи содержат итоговые значения, поэтому повторное применение безопасно.
+        Недописанная последняя строка (сбой во время записи) отбрасывается.
+        
+        Returns:
+            Количество примененных записей
+        """
+        if not os.path.exists(path):
+            return 0
+        
+        applied = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    self.logger.warning(f"Журнал {path} обрезан после {applied} записей")
+                    break
+                self._apply(data, record)
+                applied += 1
+        return applied
+    
+    def _apply(self, data: Dict[str, Any], record: Dict[str, Any]) -> None:
+        """Применение одной записи журнала."""
+        data["copied_messages"].update(record.get("m", {}))
+        for source_id in record.get("del", []):
+            data["copied_messages"].pop(source_id, None)
+        data["statistics"].update(record.get("s", {}))
+        if "ch" in record:
+            data["source_channel"], data["target_channel"] = record["ch"]
+    
+    def _write(self, records: List[Dict[str, Any]]) -> None:
+        """Запись пачки записей в журнал с fsync."""
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+        
+        self._journal_records += len(records)
+        self.logger.debug(f"Записано {len(records)} записей в журнал {self.journal_file}")
+        
+        if self._journal_records >= self.compact_every:
+            self._start_compaction()
+    
+    def _start_compaction(self):
+        """НОВОЕ: Перенос журнала в снимок в фоновом потоке (вызывается под блокировкой)."""
+        if self._compaction_thread is not None and self._compaction_thread.is_alive():
+            return
+        
         try:
-            # Обновляем статистику
-            self.data["statistics"]["last_updated"] = datetime.now().isoformat()
+            if os.path.exists(self.compacting_file):
+                # Предыдущая пересборка не завершилась - дописываем журнал к ее файлу
+                with open(self.journal_file, 'r', encoding='utf-8') as src, open(self.compacting_file, 'a', encoding='utf-8') as dst:
+                    dst.write(src.read())
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                os.remove(self.journal_file)
+            else:
+                os.replace(self.journal_file, self.compacting_file)
+        except Exception as e:
+            self.logger.error(f"Ошибка подготовки пересборки снимка трекинга: {e}")
+            return
+        self._journal_records = 0
+        
+        # Записи не изменяются после добавления, достаточно копий словарей
+        snapshot = dict(self.data)
+        snapshot["copied_messages"] = dict(self.data["copied_messages"])
+        snapshot["statistics"] = dict(self.data["statistics"])
+        self._compaction_thread = threading.Thread(
+            target=self._write_snapshot, args=(snapshot,), name="tracker-compaction", daemon=True
+        )
+        self._compaction_thread.start()
+    
+    def _write_snapshot(self, data: Dict[str, Any]) -> bool:
+        """
+        НОВОЕ: Атомарная запись снимка и удаление перенесенного в него журнала.
+        
+        Returns:
+            True если снимок записан
+        """
+        temp_file = f"{self.tracker_file}.tmp"
+        try:
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_file, self.tracker_file)
             
-            with open(self.tracker_file, 'w', encoding='utf-8') as f:
-                json.dump(self.data, f, ensure_ascii=False, indent=2)
+            if os.path.exists(self.compacting_file):
+                os.remove(self.compacting_file)
             
-            self.logger.debug(f"Данные трекинга сохранены в {self.tracker_file}")
+            self.logger.debug(f"Снимок трекинга сохранен в {self.tracker_file} ({len(data['copied_messages'])} записей)")
+            return True
         except Exception as e:
             self.logger.error(f"Ошибка сохранения файла трекинга: {e}")
+            return False
     
-    def set_channels(self, source_channel: str, target_channel: str):
-        """Установка информации о каналах."""
+    def close(self) -> None:
+        """Запись накопленных записей и ожидание фоновой пересборки."""
+        self.flush()
+        thread = self._compaction_thread
+        if thread is not None and thread.is_alive():
+            thread.join()
+    
+    def _record(self, record: Dict[str, Any]) -> None:
+        """Добавление записи журнала с итоговой статистикой."""
+        with self._lock:
+            self.data["statistics"]["last_updated"] = datetime.now().isoformat()
+            record["s"] = dict(self.data["statistics"])
+            self._enqueue(record)
+    
+    def set_channels(self, source_channel: str, target_channel: str) -> None:
         self.data["source_channel"] = source_channel
         self.data["target_channel"] = target_channel
-        self._save_data()
+        self._record({"ch": [source_channel, target_channel]})
+    
+    def get_entry(self, source_id: str) -> Optional[Dict[str, Any]]:
+        return self.data["copied_messages"].get(source_id)
+    
+    def _reindex(self, source_id: str, old: Optional[Dict[str, Any]], new: Optional[Dict[str, Any]]) -> None:
+        """Обновление обратных индексов при замене или удалении записи."""
+        if self._reverse is None:
+            return
+        for field, index in self._reverse.items():
+            if old is not None and old.get(field) is not None:
+                index[old[field]].discard(source_id)
+            if new is not None and new.get(field) is not None:
+                index[new[field]].add(source_id)
+    
+    def _lookup(self, field: str, value: int) -> List[int]:
+        """Поиск по обратному индексу поля target_id или grouped_id."""
+        if self._reverse is None:
+            self._reverse = {"target_id": defaultdict(set), "grouped_id": defaultdict(set)}
+            for source_id, entry in self.data["copied_messages"].items():
+                self._reindex(source_id, None, entry)
+        return sorted(int(source_id) for source_id in self._reverse[field].get(value, ()))
+    
+    def put_entries(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        for source_id, entry in entries.items():
+            self._reindex(source_id, self.data["copied_messages"].get(source_id), entry)
+        self.data["copied_messages"].update(entries)
+        for entry in entries.values():
+            if entry["status"] == "copied":
+                self.data["statistics"]["total_copied"] += 1
+            elif entry["status"] == "failed":
+                self.data["statistics"]["total_failed"] += 1
+        self._record({"m": entries})
+    
+    def delete_failed(self) -> int:
+        failed_ids = [
+            source_id for source_id, entry in self.data["copied_messages"].items()
+            if entry["status"] == "failed"
+        ]
+        for source_id in failed_ids:
+            self._reindex(source_id, self.data["copied_messages"].pop(source_id), None)
+        if failed_ids:
+            self._record({"del": failed_ids})
+        return len(failed_ids)
+    
+    def statistics(self) -> Dict[str, Any]:
+        copied_count = len([m for m in self.data["copied_messages"].values() if m["status"] == "copied"])
+        failed_count = len([m for m in self.data["copied_messages"].values() if m["status"] == "failed"])
+        
+        return {
+            "total_tracked": len(self.data["copied_messages"]),
+            "successfully_copied": copied_count,
+            "failed_copies": failed_count,
+            "last_updated": self.data["statistics"].get("last_updated"),
+            "source_channel": self.data.get("source_channel"),
+            "target_channel": self.data.get("target_channel")
+        }
+    
+    def last_copied_id(self) -> Optional[int]:
+        copied_ids = [
+            int(source_id) for source_id, entry in self.data["copied_messages"].items()
+            if entry["status"] == "copied"
+        ]
+        return max(copied_ids) if copied_ids else None
+    
+    def tracked_ids(self, status: Optional[str] = None) -> List[int]:
+        return sorted(
+            int(source_id) for source_id, entry in self.data["copied_messages"].items()
+            if status is None or entry["status"] == status
+        )
+    
+    def sources_by_target(self, target_id: int) -> List[int]:
+        return self._lookup("target_id", target_id)
+    
+    def sources_by_grouped_id(self, grouped_id: int) -> List[int]:
+        return self._lookup("grouped_id", grouped_id)
+    
+    def sources_between(self, since: Optional[str], until: Optional[str]) -> List[int]:
+        # Время ISO одного формата сравнивается как строки
+        return sorted(
+            int(source_id) for source_id, entry in self.data["copied_messages"].items()
+            if entry.get("timestamp") and (not since or entry["timestamp"] >= since)
+            and (not until or entry["timestamp"] <= until)
+        )
+
+
+class SqliteTrackerBackend(TrackerBackend):
+    """
+    НОВОЕ: Хранилище трекера в SQLite (WAL) с индексами и счетчиками.
+    Проверка сообщения - поиск по первичному ключу, последний ID - по индексу
+    (status, source_id), статистика - из счетчиков без обхода таблицы.
+    Обратный поиск - по индексам target_id, grouped_id и timestamp.
+    """
+    
+    SCHEMA_VERSION = 1
+    
+    def __init__(self, db_file: str = "copied_messages.db", legacy_json_file: Optional[str] = "copied_messages.json",
+                 flush_every: int = 50, flush_interval_ms: int = 250, read_only: bool = False):
+        """
+        Инициализация хранилища.
+        
+        Args:
+            db_file: Путь к базе SQLite
+            legacy_json_file: JSON трекер для однократного переноса данных (None - без переноса)
+            flush_every: Сколько записей накапливать в одной транзакции
+            flush_interval_ms: Максимальная задержка фиксации транзакции (мс)
+            read_only: Только чтение - база не изменяется (без базы данные переноса читаются в память)
+        """
+        super().__init__(flush_every, flush_interval_ms, read_only)
+        self.db_file = db_file
+        
+        # ИСПРАВЛЕНО: При чтении существующая база открывается с запретом записи,
+        # отсутствующая не создается - вместо нее база в памяти
+        in_memory = read_only and not os.path.exists(db_file)
+        # Соединение используется и потоком таймера - доступ только под self._lock
+        self.connection = sqlite3.connect(':memory:' if in_memory else db_file, isolation_level=None,
+                                          check_same_thread=False)
+        if read_only and not in_memory:
+            self.connection.execute('PRAGMA query_only=ON')
+            columns = {row[1] for row in self.connection.execute('PRAGMA table_info(messages)')}
+            if 'grouped_id' not in columns:
+                raise ValueError(f"База {db_file} прежней версии - запустите копировщик, чтобы обновить ее")
+        else:
+            self._create_schema()
+        
+        # Записи, еще не зафиксированные в базе (видны проверкам сразу)
+        self._overlay: Dict[int, Dict[str, Any]] = {}
+        self.meta = self._load_meta()
+        
+        if 'schema_version' not in self.meta and not (read_only and not in_memory):
+            if legacy_json_file:
+                self._migrate_json(legacy_json_file)
+            self.meta['schema_version'] = self.SCHEMA_VERSION
+            self._write_meta()
+        
+        if self.meta['tracked']:
+            self.logger.info(f"Загружена информация о {self.meta['tracked']} скопированных сообщениях ({db_file})")
+    
+    def _create_schema(self) -> None:
+        """Создание таблиц и индексов (и обновление базы прежней версии)."""
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS messages ('
+            'source_id INTEGER PRIMARY KEY, target_id INTEGER, status TEXT NOT NULL, '
+            'type TEXT, timestamp TEXT, album_size INTEGER, error TEXT)'
+        )
+        # НОВОЕ: grouped_id альбома для обратного поиска (в базах прежних версий столбца нет)
+        columns = {row[1] for row in self.connection.execute('PRAGMA table_info(messages)')}
+        if 'grouped_id' not in columns:
+            self.connection.execute('ALTER TABLE messages ADD COLUMN grouped_id INTEGER')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS idx_messages_target ON messages (target_id)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS idx_messages_status ON messages (status, source_id)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS idx_messages_grouped ON messages (grouped_id)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS idx_messages_time ON messages (timestamp)')
+        self.connection.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+    
+    def _load_meta(self) -> Dict[str, Any]:
+        """Загрузка счетчиков и информации о каналах."""
+        meta = {
+            'tracked': 0, 'copied': 0, 'failed': 0,
+            'total_copied': 0, 'total_failed': 0,
+            'last_updated': None, 'source_channel': None, 'target_channel': None
+        }
+        for key, value in self.connection.execute('SELECT key, value FROM meta'):
+            meta[key] = json.loads(value)
+        return meta
+    
+    def _write_meta(self) -> None:
+        """Сохранение счетчиков (вызывается внутри транзакции или отдельно)."""
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+            [(key, json.dumps(value, ensure_ascii=False)) for key, value in self.meta.items()]
+        )
+    
+    def _migrate_json(self, json_file: str) -> None:
+        """Однократный перенос данных из JSON трекера (вместе с его журналом)."""
+        legacy = JsonTrackerBackend(json_file, read_only=self.read_only)
+        # При чтении записи журнала не переносятся в снимок - данные есть и без файла снимка
+        if not os.path.exists(json_file) and not legacy.data.get("copied_messages"):
+            return
+        
+        messages = legacy.data.get("copied_messages", {})
+        rows = [self._row(int(source_id), entry) for source_id, entry in messages.items()]
+        self.connection.execute('BEGIN')
+        self.connection.executemany(
+            'INSERT OR REPLACE INTO messages (source_id, target_id, status, type, timestamp, album_size, error, grouped_id) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows
+        )
+        statistics = legacy.data.get("statistics", {})
+        self.meta.update({
+            'tracked': len(rows),
+            'copied': sum(1 for row in rows if row[2] == 'copied'),
+            'failed': sum(1 for row in rows if row[2] == 'failed'),
+            'total_copied': statistics.get("total_copied", 0),
+            'total_failed': statistics.get("total_failed", 0),
+            'last_updated': statistics.get("last_updated"),
+            'source_channel': legacy.data.get("source_channel"),
+            'target_channel': legacy.data.get("target_channel"),
+            'schema_version': self.SCHEMA_VERSION
+        })
+        self._write_meta()
+        self.connection.execute('COMMIT')
+        
+        if self.read_only:
+            # Перенесено только в базу в памяти - JSON остается для копировщика
+            return
+        # JSON оставляем рядом как резервную копию, чтобы не переносить повторно
+        os.replace(json_file, f"{json_file}.migrated")
+        self.logger.info(f"📦 Трекер перенесен из {json_file} в {self.db_file}: {len(rows)} записей")
+    
+    @staticmethod
+    def _row(source_id: int, entry: Dict[str, Any]) -> tuple:
+        """Строка таблицы messages из записи трекера."""
+        return (source_id, entry.get("target_id"), entry["status"], entry.get("type"),
+                entry.get("timestamp"), entry.get("album_size"), entry.get("error"), entry.get("grouped_id"))
+    
+    def _status(self, source_id: int) -> Optional[str]:
+        """Текущий статус сообщения (с учетом незафиксированных записей)."""
+        entry = self._overlay.get(source_id)
+        if entry is not None:
+            return entry["status"]
+        row = self.connection.execute('SELECT status FROM messages WHERE source_id = ?', (source_id,)).fetchone()
+        return row[0] if row else None
+    
+    def _write(self, records: List[Any]) -> None:
+        """Фиксация накопленных записей одной транзакцией."""
+        source_ids = {record for record in records if record is not None}
+        rows = [self._row(source_id, self._overlay[source_id]) for source_id in source_ids if source_id in self._overlay]
+        self.connection.execute('BEGIN')
+        try:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO messages (source_id, target_id, status, type, timestamp, album_size, error, grouped_id) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows
+            )
+            self._write_meta()
+        except Exception:
+            self.connection.execute('ROLLBACK')
+            raise
+        self.connection.execute('COMMIT')
+        for source_id in source_ids:
+            self._overlay.pop(source_id, None)
+    
+    def close(self) -> None:
+        """Фиксация накопленных записей и закрытие базы."""
+        with self._lock:
+            self.flush()
+            try:
+                self.connection.close()
+            except sqlite3.Error:
+                pass
+    
+    def set_channels(self, source_channel: str, target_channel: str) -> None:
+        with self._lock:
+            self.meta['source_channel'] = source_channel
+            self.meta['target_channel'] = target_channel
+            # Запись без сообщений - только счетчики и каналы
+            self._enqueue(None)
+    
+    def get_entry(self, source_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._overlay.get(int(source_id))
+            if entry is not None:
+                return entry
+            row = self.connection.execute(
+                'SELECT target_id, status, type, timestamp, album_size, error, grouped_id FROM messages WHERE source_id = ?',
+                (int(source_id),)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = dict(zip(("target_id", "status", "type", "timestamp", "album_size", "error", "grouped_id"), row))
+        return {key: value for key, value in entry.items() if value is not None or key == "target_id"}
+    
+    def put_entries(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        with self._lock:
+            for source_id, entry in entries.items():
+                source_id = int(source_id)
+                # Счетчики обновляются по разнице со старым статусом
+                previous = self._status(source_id)
+                if previous is None:
+                    self.meta['tracked'] += 1
+                elif previous in ('copied', 'failed'):
+                    self.meta[previous] -= 1
+                if entry["status"] in ('copied', 'failed'):
+                    self.meta[entry["status"]] += 1
+                    self.meta[f"total_{entry['status']}"] += 1
+                self._overlay[source_id] = entry
+            self.meta['last_updated'] = datetime.now().isoformat()
+            for source_id in entries:
+                self._enqueue(int(source_id))
+    
+    def delete_failed(self) -> int:
+        self._ensure_writable()
+        with self._lock:
+            self.flush()
+            self.connection.execute('BEGIN')
+            deleted = self.connection.execute("DELETE FROM messages WHERE status = 'failed'").rowcount
+            self.meta['tracked'] -= deleted
+            self.meta['failed'] = 0
+            self._write_meta()
+            self.connection.execute('COMMIT')
+        return deleted
+    
+    def statistics(self) -> Dict[str, Any]:
+        return {
+            "total_tracked": self.meta['tracked'],
+            "successfully_copied": self.meta['copied'],
+            "failed_copies": self.meta['failed'],
+            "last_updated": self.meta['last_updated'],
+            "source_channel": self.meta['source_channel'],
+            "target_channel": self.meta['target_channel']
+        }
+    
+    def last_copied_id(self) -> Optional[int]:
+        with self._lock:
+            row = self.connection.execute("SELECT MAX(source_id) FROM messages WHERE status = 'copied'").fetchone()
+            candidates = [source_id for source_id, entry in self._overlay.items() if entry["status"] == "copied"]
+        if row and row[0] is not None:
+            candidates.append(row[0])
+        return max(candidates) if candidates else None
+    
+    def _select_sources(self, where: str, params: tuple, matches) -> List[int]:
+        """ID сообщений по условию на индексированном столбце с учетом незафиксированных записей."""
+        with self._lock:
+            found = {row[0] for row in self.connection.execute(f'SELECT source_id FROM messages WHERE {where}', params)}
+            for source_id, entry in self._overlay.items():
+                if matches(entry):
+                    found.add(source_id)
+                else:
+                    found.discard(source_id)
+        return sorted(found)
+    
+    def tracked_ids(self, status: Optional[str] = None) -> List[int]:
+        if status is None:
+            return self._select_sources('1', (), lambda entry: True)
+        return self._select_sources('status = ?', (status,), lambda entry: entry["status"] == status)
+    
+    def sources_by_target(self, target_id: int) -> List[int]:
+        return self._select_sources('target_id = ?', (target_id,), lambda entry: entry.get("target_id") == target_id)
+    
+    def sources_by_grouped_id(self, grouped_id: int) -> List[int]:
+        return self._select_sources('grouped_id = ?', (grouped_id,), lambda entry: entry.get("grouped_id") == grouped_id)
+    
+    def sources_between(self, since: Optional[str], until: Optional[str]) -> List[int]:
+        since = since or ''
+        until = until or '9999'
+        return self._select_sources(
+            'timestamp >= ? AND timestamp <= ?', (since, until),
+            lambda entry: bool(entry.get("timestamp")) and since <= entry["timestamp"] <= until
+        )
+
+
+class ColumnarTrackerBackend(TrackerBackend):
+    """
+    НОВОЕ: Компактное колоночное хранилище трекера.
+    
+    Файл содержит отсортированные массивы ID и столбцы фиксированной ширины
+    (ID в целевом канале, время в секундах эпохи, статус и тип малыми числами)
+    и отображается в память через mmap: запуск не читает файл целиком, поиск -
+    бинарный. Обратные индексы (по ID в целевом канале, альбому и времени)
+    хранятся в том же файле как перестановки строк. Новые записи копятся в
+    небольшом словаре и журнале и периодически вливаются в файл.
+    """
+    
+    MAGIC = b'TGTRACK2'
+    # Заголовок: сигнатура, количество записей, смещение метаданных (JSON)
+    HEADER = struct.Struct('<8sQQ')
+    DATA_OFFSET = 32
+    STATUSES = ('copied', 'failed')
+    # Неизвестный тип сохраняется как single
+    TYPES = ('single', 'album', 'failed')
+    NO_TARGET = -1
+    # Столбцы строки после ID (порядок полей кортежа записи) и их типы
+    FIELDS = (('targets', 'q'), ('times', 'q'), ('grouped', 'q'), ('statuses', 'B'), ('types', 'B'), ('albums', 'B'))
+    STATUS = 3
+    # Обратные индексы: перестановка строк, упорядоченная по столбцу
+    INDEXES = (('by_target', 'targets'), ('by_grouped', 'grouped'), ('by_time', 'times'))
+    
+    def __init__(self, data_file: str = "copied_messages.trk", legacy_files: tuple = (),
+                 flush_every: int = 50, flush_interval_ms: int = 250, merge_every: int = 20000,
+                 read_only: bool = False):
+        """
+        Инициализация хранилища.
+        
+        Args:
+            data_file: Путь к колоночному файлу
+            legacy_files: Базы .db и JSON трекеры для однократного переноса (первый найденный)
+            flush_every: Сколько записей накапливать до записи журнала на диск
+            flush_interval_ms: Максимальная задержка записи накопленных записей (мс)
+            merge_every: Сколько новых записей накапливать до слияния с файлом
+            read_only: Только чтение - файл не создается и не пересобирается, перенос выполняется в памяти
+        """
+        super().__init__(flush_every, flush_interval_ms, read_only)
+        self.data_file = data_file
+        self.journal_file = f"{data_file}.journal"
+        self.merge_every = max(1, merge_every)
+        
+        # Новые и измененные записи: source_id -> (target_id, время, альбом, статус, тип, размер альбома)
+        self._delta: Dict[int, tuple] = {}
+        self._mmap: Optional[mmap.mmap] = None
+        self._views: List[memoryview] = []
+        self.count = 0
+        
+        if os.path.exists(data_file):
+            self._open()
+        else:
+            self.meta = self._empty_meta()
+            if read_only:
+                # ИСПРАВЛЕНО: Без файла - пустые столбцы в памяти, перенесенные записи остаются новыми
+                self._set_columns(self._empty_columns())
+            else:
+                self._write_file(self._empty_columns())
+            self._migrate(legacy_files)
+        
+        replayed = self._replay_journal()
+        if replayed:
+            self.logger.info(f"🔁 Восстановлено {replayed} записей журнала трекинга")
+        if self.meta['tracked']:
+            self.logger.info(f"Загружена информация о {self.meta['tracked']} скопированных сообщениях ({data_file})")
+    
+    @staticmethod
+    def _empty_meta() -> Dict[str, Any]:
+        """Счетчики, каналы и тексты ошибок (ошибки редки и хранятся вне столбцов)."""
+        return {
+            'tracked': 0, 'copied': 0, 'failed': 0,
+            'total_copied': 0, 'total_failed': 0,
+            'last_updated': None, 'source_channel': None, 'target_channel': None,
+            'errors': {}
+        }
+    
+    @classmethod
+    def _empty_columns(cls) -> List[array]:
+        """Пустые столбцы: ID и поля строки."""
+        return [array('q')] + [array(typecode) for _, typecode in cls.FIELDS]
+    
+    @classmethod
+    def _layout(cls) -> List[tuple]:
+        """Порядок блоков в файле: 8-байтовые столбцы и индексы, затем однобайтовые."""
+        wide = [('ids', 'q')] + [field for field in cls.FIELDS if field[1] == 'q']
+        wide += [(name, 'q') for name, _ in cls.INDEXES]
+        return wide + [field for field in cls.FIELDS if field[1] == 'B']
+    
+    def _open(self) -> None:
+        """Отображение файла в память и разметка столбцов."""
+        with open(self.data_file, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, count, meta_offset = self.HEADER.unpack_from(self._mmap, 0)
+        if magic != self.MAGIC:
+            self._mmap.close()
+            self._mmap = None
+            raise ValueError(f"{self.data_file} не является файлом трекера этой версии")
+        
+        self.count = count
+        base = memoryview(self._mmap)
+        self._views = [base]
+        offset = self.DATA_OFFSET
+        for name, typecode in self._layout():
+            size = count * (8 if typecode == 'q' else 1)
+            view = base[offset:offset + size].cast(typecode)
+            setattr(self, f"_{name}", view)
+            self._views.insert(0, view)
+            offset += size
+        self.meta = json.loads(bytes(self._mmap[meta_offset:]).decode('utf-8'))
+    
+    def _close_mmap(self) -> None:
+        """Освобождение отображения (перед заменой файла)."""
+        for view in self._views:
+            view.release()
+        self._views = []
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+    
+    def _index(self, source_id: int) -> int:
+        """Позиция ID в файле (бинарный поиск) или -1."""
+        index = bisect.bisect_left(self._ids, source_id)
+        if index < self.count and self._ids[index] == source_id:
+            return index
+        return -1
+    
+    def _file_row(self, index: int) -> tuple:
+        """Кортеж полей строки файла."""
+        return tuple(getattr(self, f"_{name}")[index] for name, _ in self.FIELDS)
+    
+    def _get_row(self, source_id: int) -> Optional[tuple]:
+        """Запись в виде кортежа полей (с учетом новых записей)."""
+        row = self._delta.get(source_id)
+        if row is not None:
+            return row
+        index = self._index(source_id)
+        return self._file_row(index) if index >= 0 else None
+    
+    def _encode(self, entry: Dict[str, Any]) -> tuple:
+        """Запись трекера -> кортеж полей."""
+        target_id = entry.get("target_id")
+        try:
+            timestamp = int(datetime.fromisoformat(entry["timestamp"]).timestamp())
+        except (KeyError, TypeError, ValueError):
+            timestamp = 0
+        message_type = entry.get("type")
+        return (
+            self.NO_TARGET if target_id is None else target_id,
+            timestamp,
+            entry.get("grouped_id") or 0,
+            self.STATUSES.index(entry["status"]),
+            self.TYPES.index(message_type) if message_type in self.TYPES else 0,
+            min(255, entry.get("album_size") or 0)
+        )
+    
+    def _decode(self, source_id: int, row: tuple) -> Dict[str, Any]:
+        """Кортеж полей -> запись трекера."""
+        target_id, timestamp, grouped_id, status, message_type, album_size = row
+        entry = {
+            "target_id": None if target_id == self.NO_TARGET else target_id,
+            "timestamp": datetime.fromtimestamp(timestamp).isoformat() if timestamp else None,
+            "type": self.TYPES[message_type],
+            "status": self.STATUSES[status]
+        }
+        if album_size:
+            entry["album_size"] = album_size
+        if grouped_id:
+            entry["grouped_id"] = grouped_id
+        error = self.meta['errors'].get(str(source_id))
+        if error is not None:
+            entry["error"] = error
+        return entry
+    
+    def _apply_entries(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        """Применение записей к новым записям и счетчикам."""
+        for source_id, entry in entries.items():
+            key = int(source_id)
+            previous = self._get_row(key)
+            row = self._encode(entry)
+            if previous is None:
+                self.meta['tracked'] += 1
+            else:
+                self.meta[self.STATUSES[previous[self.STATUS]]] -= 1
+            status = self.STATUSES[row[self.STATUS]]
+            self.meta[status] += 1
+            self.meta[f"total_{status}"] += 1
+            if entry.get("error") is not None:
+                self.meta['errors'][str(key)] = entry["error"]
+            else:
+                self.meta['errors'].pop(str(key), None)
+            self._delta[key] = row
+    
+    def _replay_journal(self) -> int:
+        """Повтор записей журнала, не влитых в файл (обрезанная строка отбрасывается)."""
+        if not os.path.exists(self.journal_file):
+            return 0
+        applied = 0
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    self.logger.warning(f"Журнал {self.journal_file} обрезан после {applied} записей")
+                    break
+                self._apply_entries(record.get("m", {}))
+                if "ch" in record:
+                    self.meta['source_channel'], self.meta['target_channel'] = record["ch"]
+                applied += 1
+        return applied
+    
+    def _write(self, records: List[Dict[str, Any]]) -> None:
+        """Запись пачки в журнал с fsync и слияние с файлом при накоплении."""
+        with open(self.journal_file, 'a', encoding='utf-8') as f:
+            f.write(''.join(json.dumps(record, ensure_ascii=False) + "\n" for record in records))
+            f.flush()
+            os.fsync(f.fileno())
+        if len(self._delta) >= self.merge_every:
+            self._merge()
+    
+    def _merge(self, drop_failed: bool = False) -> None:
+        """
+        Слияние новых записей с файлом: изменения на месте, вставки - срезами
+        массивов, затем атомарная замена файла и удаление журнала.
+        
+        Args:
+            drop_failed: Удалить записи о неудачных попытках
+        """
+        columns = self._empty_columns()
+        names = ['ids'] + [name for name, _ in self.FIELDS]
+        if self._views:
+            for column, name in zip(columns, names):
+                column.frombytes(getattr(self, f"_{name}").tobytes())
+        ids = columns[0]
+        
+        inserts = []
+        for source_id in sorted(self._delta):
+            row = self._delta[source_id]
+            index = self._index(source_id) if self._views else -1
+            if index >= 0:
+                for column, value in zip(columns[1:], row):
+                    column[index] = value
+            else:
+                inserts.append((bisect.bisect_left(ids, source_id), source_id, row))
+        
+        if inserts:
+            merged = [array(column.typecode) for column in columns]
+            previous = 0
+            for position, source_id, row in inserts:
+                for target, column in zip(merged, columns):
+                    target.extend(column[previous:position])
+                for target, value in zip(merged, (source_id,) + row):
+                    target.append(value)
+                previous = position
+            for target, column in zip(merged, columns):
+                target.extend(column[previous:])
+            columns = merged
+        
+        if drop_failed:
+            failed = self.STATUSES.index('failed')
+            keep = [i for i, status in enumerate(columns[1 + self.STATUS]) if status != failed]
+            columns = [array(column.typecode, (column[i] for i in keep)) for column in columns]
+            self.meta['errors'] = {}
+        
+        self._write_file(columns)
+        self._delta = {}
+        if os.path.exists(self.journal_file):
+            os.remove(self.journal_file)
+    
+    def _blocks(self, columns: List[array]) -> Dict[str, array]:
+        """Блоки файла по именам: столбцы и построенные по ним индексы."""
+        blocks = dict(zip(['ids'] + [name for name, _ in self.FIELDS], columns))
+        for index_name, field in self.INDEXES:
+            values = blocks[field]
+            blocks[index_name] = array('q', sorted(range(len(columns[0])), key=values.__getitem__))
+        return blocks
+    
+    def _set_columns(self, columns: List[array]) -> None:
+        """Разметка столбцов, хранящихся в памяти, а не в файле (только чтение)."""
+        self.count = len(columns[0])
+        for name, block in self._blocks(columns).items():
+            setattr(self, f"_{name}", block)
+    
+    def _write_file(self, columns: List[array]) -> None:
+        """Атомарная запись колоночного файла с индексами и повторное отображение в память."""
+        count = len(columns[0])
+        blocks = self._blocks(columns)
+        payload = b''.join(blocks[name].tobytes() for name, _ in self._layout())
+        padding = (-(self.DATA_OFFSET + len(payload))) % 8
+        meta_offset = self.DATA_OFFSET + len(payload) + padding
+        
+        temp_file = f"{self.data_file}.tmp"
+        with open(temp_file, 'wb') as f:
+            f.write(self.HEADER.pack(self.MAGIC, count, meta_offset).ljust(self.DATA_OFFSET, b'\0'))
+            f.write(payload)
+            f.write(b'\0' * padding)
+            f.write(json.dumps(self.meta, ensure_ascii=False).encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        
+        self._close_mmap()
+        os.replace(temp_file, self.data_file)
+        self._open()
+        self.logger.debug(f"Файл трекинга {self.data_file} пересобран: {count} записей")
+    
+    def _migrate(self, legacy_files: tuple) -> None:
+        """Однократный перенос данных SQLite или JSON трекера в новый файл."""
+        for legacy_file in legacy_files:
+            if not os.path.exists(legacy_file) and not os.path.exists(f"{legacy_file}.journal"):
+                continue
+            if legacy_file.endswith('.db'):
+                legacy: TrackerBackend = SqliteTrackerBackend(legacy_file, None, read_only=self.read_only)
+                fields = ("target_id", "status", "type", "timestamp", "album_size", "error", "grouped_id")
+                rows = legacy.connection.execute(f"SELECT source_id, {', '.join(fields)} FROM messages")
+                entries = {str(row[0]): dict(zip(fields, row[1:])) for row in rows}
+                meta = legacy.meta
+                channels = (meta['source_channel'], meta['target_channel'])
+                totals = (meta['total_copied'], meta['total_failed'], meta['last_updated'])
+            else:
+                legacy = JsonTrackerBackend(legacy_file, read_only=self.read_only)
+                entries = legacy.data.get("copied_messages", {})
+                statistics = legacy.data.get("statistics", {})
+                channels = (legacy.data.get("source_channel"), legacy.data.get("target_channel"))
+                totals = (statistics.get("total_copied", 0), statistics.get("total_failed", 0), statistics.get("last_updated"))
+            legacy.close()
+            
+            self._apply_entries(entries)
+            self.meta['source_channel'], self.meta['target_channel'] = channels
+            self.meta['total_copied'], self.meta['total_failed'], self.meta['last_updated'] = totals
+            if self.read_only:
+                # Перенесенные записи остаются в памяти, прежний трекер - на месте
+                return
+            self._merge()
+            os.replace(legacy_file, f"{legacy_file}.migrated")
+            self.logger.info(f"📦 Трекер перенесен из {legacy_file} в {self.data_file}: {len(entries)} записей")
+            return
+    
+    def _index_range(self, index_name: str, field: str, low: int, high: int) -> List[int]:
+        """ID записей файла со значением столбца в [low, high] (бинарный поиск по индексу)."""
+        order = getattr(self, f"_{index_name}")
+        values = getattr(self, f"_{field}")
+        start = bisect.bisect_left(order, low, key=values.__getitem__)
+        end = bisect.bisect_right(order, high, key=values.__getitem__)
+        return [self._ids[order[i]] for i in range(start, end)]
+    
+    def _find(self, index_name: str, field: str, low: int, high: int) -> List[int]:
+        """Поиск по обратному индексу с учетом новых записей."""
+        position = [name for name, _ in self.FIELDS].index(field)
+        with self._lock:
+            found = set(self._index_range(index_name, field, low, high))
+            for source_id, row in self._delta.items():
+                if low <= row[position] <= high:
+                    found.add(source_id)
+                else:
+                    found.discard(source_id)
+        return sorted(found)
+    
+    def close(self) -> None:
+        """Запись накопленных записей и слияние их с файлом."""
+        with self._lock:
+            self.flush()
+            if self._delta and self._mmap is not None and not self.read_only:
+                self._merge()
+    
+    def set_channels(self, source_channel: str, target_channel: str) -> None:
+        with self._lock:
+            self.meta['source_channel'] = source_channel
+            self.meta['target_channel'] = target_channel
+            self._enqueue({"ch": [source_channel, target_channel]})
+    
+    def get_entry(self, source_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._get_row(int(source_id))
+            return self._decode(int(source_id), row) if row is not None else None
+    
+    def put_entries(self, entries: Dict[str, Dict[str, Any]]) -> None:
+        with self._lock:
+            self._apply_entries(entries)
+            self.meta['last_updated'] = datetime.now().isoformat()
+            self._enqueue({"m": entries})
+    
+    def delete_failed(self) -> int:
+        self._ensure_writable()
+        with self._lock:
+            self.flush()
+            failed = self.meta['failed']
+            if failed:
+                self.meta['tracked'] -= failed
+                self.meta['failed'] = 0
+                self._merge(drop_failed=True)
+            return failed
+    
+    def statistics(self) -> Dict[str, Any]:
+        return {
+            "total_tracked": self.meta['tracked'],
+            "successfully_copied": self.meta['copied'],
+            "failed_copies": self.meta['failed'],
+            "last_updated": self.meta['last_updated'],
+            "source_channel": self.meta['source_channel'],
+            "target_channel": self.meta['target_channel']
+        }
+    
+    def last_copied_id(self) -> Optional[int]:
+        copied = self.STATUSES.index('copied')
+        with self._lock:
+            candidates = [source_id for source_id, row in self._delta.items() if row[self.STATUS] == copied]
+            # С конца файла: обычно последняя запись и есть ответ
+            for index in range(self.count - 1, -1, -1):
+                source_id = self._ids[index]
+                row = self._delta.get(source_id)
+                if (row[self.STATUS] if row is not None else self._statuses[index]) == copied:
+                    candidates.append(source_id)
+                    break
+        return max(candidates) if candidates else None
+    
+    def tracked_ids(self, status: Optional[str] = None) -> List[int]:
+        code = self.STATUSES.index(status) if status is not None else None
+        with self._lock:
+            found = [
+                self._ids[index] for index in range(self.count)
+                if (code is None or self._statuses[index] == code) and self._ids[index] not in self._delta
+            ]
+            found.extend(
+                source_id for source_id, row in self._delta.items()
+                if code is None or row[self.STATUS] == code
+            )
+        return sorted(found)
+    
+    def sources_by_target(self, target_id: int) -> List[int]:
+        return self._find('by_target', 'targets', target_id, target_id)
+    
+    def sources_by_grouped_id(self, grouped_id: int) -> List[int]:
+        return self._find('by_grouped', 'grouped', grouped_id, grouped_id)
+    
+    def sources_between(self, since: Optional[str], until: Optional[str]) -> List[int]:
+        low = int(datetime.fromisoformat(since).timestamp()) if since else 1
+        high = int(datetime.fromisoformat(until).timestamp()) if until else 2 ** 63 - 1
+        return self._find('by_time', 'times', low, high)
+
+
+class MessageTracker:
+    """Класс для отслеживания скопированных сообщений."""
+    
+    BACKENDS = ('sqlite', 'json', 'columnar')
+    
+    def __init__(self, tracker_file: str = "copied_messages.json", backend: str = "sqlite",
+                 flush_every: int = 50, flush_interval_ms: int = 250, read_only: bool = False):
+        """
+        Инициализация трекера сообщений.
+        
+        Args:
+            tracker_file: Путь к JSON файлу трекинга (для SQLite - база рядом с расширением .db,
+                для колоночного хранилища - файл .trk)
+            backend: Хранилище: sqlite, json или columnar
+            flush_every: Сколько записей накапливать до записи на диск
+            flush_interval_ms: Максимальная задержка записи накопленных записей (мс)
+            read_only: Только чтение - файлы хранилища не создаются, не переносятся и не
+                изменяются (запросы к трекеру во время работы копировщика)
+        """
+        self.tracker_file = tracker_file
+        self.logger = logging.getLogger('telegram_copier.tracker')
+        
+        if backend == 'sqlite':
+            db_file = f"{os.path.splitext(tracker_file)[0]}.db"
+            self.backend: TrackerBackend = SqliteTrackerBackend(
+                db_file, tracker_file, flush_every, flush_interval_ms, read_only=read_only
+            )
+        elif backend == 'json':
+            self.backend = JsonTrackerBackend(tracker_file, flush_every, flush_interval_ms, read_only=read_only)
+        elif backend == 'columnar':
+            base_name = os.path.splitext(tracker_file)[0]
+            self.backend = ColumnarTrackerBackend(
+                f"{base_name}.trk", (f"{base_name}.db", tracker_file), flush_every, flush_interval_ms,
+                read_only=read_only
+            )
+        else:
+            raise ValueError(f"Неизвестное хранилище трекера: {backend} (доступны: {', '.join(self.BACKENDS)})")
+        
+        if not read_only:
+            atexit.register(self.close)
+    
+    def flush(self):
+        """НОВОЕ: Запись накопленных изменений на диск."""
+        self.backend.flush()
+    
+    def close(self):
+        """НОВОЕ: Запись накопленных изменений и освобождение хранилища."""
+        self.backend.close()
+    
+    def set_channels(self, source_channel: str, target_channel: str):
+        """Установка информации о каналах."""
+        self.backend.set_channels(source_channel, target_channel)
     
     def is_message_copied(self, source_id: int) -> bool:
         """
@@ -77,52 +1178,52 @@ class MessageTracker:
         Returns:
             True если сообщение уже скопировано
         """
-        return str(source_id) in self.data["copied_messages"]
+        return self.backend.get_entry(str(source_id)) is not None
     
-    def mark_message_copied(self, source_id: int, target_id: int, message_type: str = "single"):
+    def mark_message_copied(self, source_id: int, target_id: Optional[int], message_type: str = "single"):
         """
         Отметить сообщение как скопированное.
         
         Args:
             source_id: ID сообщения в исходном канале
-            target_id: ID сообщения в целевом канале
+            target_id: ID сообщения в целевом канале (None - отправлено, но ID копии неизвестен)
             message_type: Тип сообщения (single, album)
         """
-        self.data["copied_messages"][str(source_id)] = {
+        entry = {
             "target_id": target_id,
             "timestamp": datetime.now().isoformat(),
             "type": message_type,
             "status": "copied"
         }
-        
-        self.data["statistics"]["total_copied"] += 1
-        self._save_data()
+        self.backend.put_entries({str(source_id): entry})
         
         self.logger.debug(f"Отмечено как скопированное: {source_id} -> {target_id}")
     
-    def mark_album_copied(self, source_ids: List[int], target_ids: List[int]):
+    def mark_album_copied(self, source_ids: List[int], target_ids: List[int], grouped_id: Optional[int] = None):
         """
         Отметить альбом как скопированный.
         
         Args:
             source_ids: Список ID сообщений в исходном канале
             target_ids: Список ID сообщений в целевом канале
+            grouped_id: grouped_id исходного альбома (для обратного поиска)
         """
         timestamp = datetime.now().isoformat()
+        entries = {}
         
         for i, source_id in enumerate(source_ids):
             target_id = target_ids[i] if i < len(target_ids) else target_ids[0]
             
-            self.data["copied_messages"][str(source_id)] = {
+            entries[str(source_id)] = {
                 "target_id": target_id,
                 "timestamp": timestamp,
                 "type": "album",
                 "status": "copied",
                 "album_size": len(source_ids)
             }
-        
-        self.data["statistics"]["total_copied"] += len(source_ids)
-        self._save_data()
+            if grouped_id:
+                entries[str(source_id)]["grouped_id"] = grouped_id
+        self.backend.put_entries(entries)
         
         self.logger.debug(f"Отмечен альбом как скопированный: {len(source_ids)} сообщений")
     
@@ -134,55 +1235,103 @@ class MessageTracker:
             source_id: ID сообщения в исходном канале
             error: Описание ошибки
         """
-        self.data["copied_messages"][str(source_id)] = {
+        entry = {
             "target_id": None,
             "timestamp": datetime.now().isoformat(),
             "type": "failed",
             "status": "failed",
             "error": error
         }
-        
-        self.data["statistics"]["total_failed"] += 1
-        self._save_data()
+        self.backend.put_entries({str(source_id): entry})
         
         self.logger.debug(f"Отмечено как неудачное: {source_id} - {error}")
     
     def get_statistics(self) -> Dict[str, Any]:
         """Получение статистики."""
-        copied_count = len([m for m in self.data["copied_messages"].values() if m["status"] == "copied"])
-        failed_count = len([m for m in self.data["copied_messages"].values() if m["status"] == "failed"])
-        
-        return {
-            "total_tracked": len(self.data["copied_messages"]),
-            "successfully_copied": copied_count,
-            "failed_copies": failed_count,
-            "last_updated": self.data["statistics"].get("last_updated"),
-            "source_channel": self.data.get("source_channel"),
-            "target_channel": self.data.get("target_channel")
-        }
+        return self.backend.statistics()
     
     def get_last_copied_id(self) -> Optional[int]:
         """Получение ID последнего успешно скопированного сообщения."""
-        copied_messages = {
-            int(k): v for k, v in self.data["copied_messages"].items() 
-            if v["status"] == "copied"
-        }
+        return self.backend.last_copied_id()
+    
+    def get_entry(self, source_id: int) -> Optional[Dict[str, Any]]:
+        """
+        НОВОЕ: Запись о сообщении по ID в исходном канале.
         
-        if not copied_messages:
-            return None
+        Args:
+            source_id: ID сообщения в исходном канале
         
-        return max(copied_messages.keys())
+        Returns:
+            Запись (target_id, timestamp, type, status, ...) или None
+        """
+        return self.backend.get_entry(str(source_id))
+    
+    def get_tracked_ids(self, status: Optional[str] = None) -> List[int]:
+        """
+        НОВОЕ: ID отслеживаемых сообщений по возрастанию.
+        
+        Args:
+            status: Только записи с этим статусом (copied, failed); None - все
+        
+        Returns:
+            Отсортированный список ID в исходном канале
+        """
+        return self.backend.tracked_ids(status)
+    
+    def find_entries(self, source_id: Optional[int] = None, target_id: Optional[int] = None,
+                     grouped_id: Optional[int] = None, since: Optional[datetime] = None,
+                     until: Optional[datetime] = None) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        НОВОЕ: Поиск записей по индексам хранилища.
+        
+        Условия объединяются через И. Выборка берется по самому избирательному
+        индексу (source_id, затем target_id, grouped_id, время), остальные
+        условия проверяются по найденным записям.
+        
+        Args:
+            source_id: ID сообщения в исходном канале
+            target_id: ID сообщения в целевом канале
+            grouped_id: grouped_id исходного альбома
+            since: Отмечено не раньше
+            until: Отмечено не позже
+        
+        Returns:
+            Список (source_id, запись) по возрастанию source_id
+        """
+        since_iso = since.isoformat() if since else None
+        until_iso = until.isoformat() if until else None
+        if source_id is not None:
+            candidates = [source_id]
+        elif target_id is not None:
+            candidates = self.backend.sources_by_target(target_id)
+        elif grouped_id is not None:
+            candidates = self.backend.sources_by_grouped_id(grouped_id)
+        elif since or until:
+            candidates = self.backend.sources_between(since_iso, until_iso)
+        else:
+            raise ValueError("Не задано ни одного условия поиска")
+        
+        results = []
+        for candidate in candidates:
+            entry = self.backend.get_entry(str(candidate))
+            if entry is None:
+                continue
+            if target_id is not None and entry.get("target_id") != target_id:
+                continue
+            if grouped_id is not None and entry.get("grouped_id") != grouped_id:
+                continue
+            timestamp = entry.get("timestamp")
+            if (since_iso or until_iso) and not timestamp:
+                continue
+            if since_iso and timestamp < since_iso or until_iso and timestamp > until_iso:
+                continue
+            results.append((candidate, entry))
+        return results
     
     def cleanup_failed_messages(self):
         """Очистка записей о неудачных попытках для повторной попытки."""
-        failed_count = 0
-        for source_id in list(self.data["copied_messages"].keys()):
-            if self.data["copied_messages"][source_id]["status"] == "failed":
-                del self.data["copied_messages"][source_id]
-                failed_count += 1
-        
+        failed_count = self.backend.delete_failed()
         if failed_count > 0:
-            self._save_data()
             self.logger.info(f"Очищено {failed_count} записей о неудачных попытках")
     
     def generate_debug_tag(self, source_id: int, add_tags: bool = False) -> str:
@@ -199,42 +1348,55 @@ class MessageTracker:
         if not add_tags:
             return ""
         
-        return f"\n\n#src_{self.data.get('source_channel', 'unknown')}_{source_id}"
+        return f"\n\n#src_{self.backend.statistics().get('source_channel') or 'unknown'}_{source_id}"
 
 
 def test_message_tracker():
     """Тест функциональности трекера."""
     print("🧪 Тестирование MessageTracker...")
     
-    # Создаем тестовый трекер
-    tracker = MessageTracker("test_tracker.json")
-    tracker.set_channels("source_channel", "target_channel")
-    
-    # Тестируем одиночные сообщения
-    tracker.mark_message_copied(12345, 67890, "single")
-    tracker.mark_message_copied(12346, 67891, "single")
-    
-    # Тестируем альбом
-    tracker.mark_album_copied([12347, 12348, 12349], [67892, 67893, 67894])
-    
-    # Тестируем неудачу
-    tracker.mark_message_failed(12350, "MediaInvalidError")
-    
-    # Проверяем статистику
-    stats = tracker.get_statistics()
-    print(f"📊 Статистика: {stats}")
-    
-    # Проверяем дубликаты
-    print(f"🔍 Сообщение 12345 уже скопировано: {tracker.is_message_copied(12345)}")
-    print(f"🔍 Сообщение 99999 уже скопировано: {tracker.is_message_copied(99999)}")
-    
-    # Получаем последний ID
-    last_id = tracker.get_last_copied_id()
-    print(f"📝 Последний скопированный ID: {last_id}")
-    
-    # Очищаем тестовый файл
-    if os.path.exists("test_tracker.json"):
-        os.remove("test_tracker.json")
+    for backend in MessageTracker.BACKENDS:
+        print(f"💾 Хранилище: {backend}")
+        
+        # Создаем тестовый трекер
+        tracker = MessageTracker("test_tracker.json", backend=backend)
+        tracker.set_channels("source_channel", "target_channel")
+        
+        # Тестируем одиночные сообщения
+        tracker.mark_message_copied(12345, 67890, "single")
+        tracker.mark_message_copied(12346, 67891, "single")
+        
+        # Тестируем альбом
+        tracker.mark_album_copied([12347, 12348, 12349], [67892, 67893, 67894])
+        
+        # Тестируем неудачу
+        tracker.mark_message_failed(12350, "MediaInvalidError")
+        
+        # Проверяем статистику
+        stats = tracker.get_statistics()
+        print(f"📊 Статистика: {stats}")
+        
+        # Проверяем дубликаты
+        print(f"🔍 Сообщение 12345 уже скопировано: {tracker.is_message_copied(12345)}")
+        print(f"🔍 Сообщение 99999 уже скопировано: {tracker.is_message_copied(99999)}")
+        
+        # Получаем последний ID
+        last_id = tracker.get_last_copied_id()
+        print(f"📝 Последний скопированный ID: {last_id}")
+        
+        # Проверяем восстановление после перезапуска
+        tracker.close()
+        restored = MessageTracker("test_tracker.json", backend=backend)
+        print(f"🔁 После перезапуска отслежено: {restored.get_statistics()['total_tracked']}")
+        restored.close()
+        
+        # Очищаем тестовые файлы
+        for suffix in ("", ".journal", ".journal.compacting", ".migrated"):
+            if os.path.exists(f"test_tracker.json{suffix}"):
+                os.remove(f"test_tracker.json{suffix}")
+        for suffix in (".db", ".db-wal", ".db-shm", ".trk", ".trk.journal"):
+            if os.path.exists(f"test_tracker{suffix}"):
+                os.remove(f"test_tracker{suffix}")
     
     print("✅ Тест MessageTracker завершен!")
 
@@ -0,0 +1,200 @@
+"""
+Модуль общего журнала лимитов скорости для процессов одного аккаунта.
+Копирование, очистка группы и служебные скрипты работают от имени одного
+аккаунта в разных процессах - журнал в SQLite дает им общие корзины токенов
+и общие сроки FloodWait.
+
+ИСПРАВЛЕНО: Методы журнала блокирующие - RateLimiter вызывает их в пуле потоков,
+а не в цикле событий. Ожидание блокировки другого процесса короткое: если база
+занята, лимиты на этот вызов считаются только по корзине процесса.
+"""
+
+import logging
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+
+class RateLedger:
+    """Класс журнала корзин токенов и FloodWait аккаунта в SQLite, общего для процессов."""
+
+    def __init__(self, path: str, account_key: str, busy_timeout: float = 0.5):
+        """
+        Инициализация журнала.
+
+        Args:
+            path: Путь к файлу базы SQLite
+            account_key: Ключ аккаунта (записи разных аккаунтов не пересекаются)
+            busy_timeout: Сколько секунд ждать блокировку другого процесса
+                (после этого вызов возвращает значение без учета журнала)
+        """
+        self.path = path
+        self.account_key = account_key
+        self.logger = logging.getLogger('telegram_copier.rate_ledger')
+
+        # Соединение используется из потоков пула - доступ к нему сериализуется блокировкой
+        self._lock = threading.Lock()
+        # Транзакции открываются явно, чтобы чтение и запись корзины были атомарными
+        self.connection = sqlite3.connect(path, timeout=busy_timeout, isolation_level=None, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS buckets ('
+            'account TEXT NOT NULL, op_class TEXT NOT NULL, tokens REAL NOT NULL, updated REAL NOT NULL, '
+            'PRIMARY KEY (account, op_class))'
+        )
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS flood_waits ('
+            'account TEXT NOT NULL, op_class TEXT NOT NULL, deadline REAL NOT NULL, '
+            'PRIMARY KEY (account, op_class))'
+        )
+
+    @contextmanager
+    def _transaction(self):
+        """Транзакция с блокировкой записи - другие процессы ждут ее окончания."""
+        with self._lock:
+            self.connection.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.connection
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+            else:
+                self.connection.execute('COMMIT')
+
+    def _tokens(self, connection, op_class: str, per_hour: float, now: float) -> float:
+        """Токены корзины класса с учетом пополнения за прошедшее время (время - time.time())."""
+        capacity = max(1.0, per_hour)
+        row = connection.execute(
+            'SELECT tokens, updated FROM buckets WHERE account = ? AND op_class = ?',
+            (self.account_key, op_class)
+        ).fetchone()
+        if row is None:
+            return capacity
+        tokens, updated = row
+        return min(capacity, tokens + max(0.0, now - updated) * per_hour / 3600.0)
+
+    def delay_for(self, op_class: str, cost: float, per_hour: float) -> float:
+        """
+        Сколько секунд ждать, пока в общей корзине класса наберется cost токенов.
+
+        Args:
+            op_class: Класс операции
+            cost: Стоимость операции в токенах
+            per_hour: Пополнение корзины в час (0 - без ограничения)
+
+        Returns:
+            Время ожидания в секундах (0 - можно выполнять сразу)
+        """
+        if not per_hour:
+            return 0.0
+        return self.delay_from(self.available(op_class, per_hour), cost, per_hour)
+
+    @staticmethod
+    def delay_from(tokens: float, cost: float, per_hour: float) -> float:
+        """
+        НОВОЕ: Ожидание корзины по уже прочитанному числу токенов (без обращения к базе).
+
+        Args:
+            tokens: Токены общей корзины класса
+            cost: Стоимость операции в токенах
+            per_hour: Пополнение корзины в час (0 - без ограничения)
+
+        Returns:
+            Время ожидания в секундах (0 - можно выполнять сразу)
+        """
+        needed = min(cost, max(1.0, per_hour))
+        if not per_hour or tokens >= needed:
+            return 0.0
+        return (needed - tokens) * 3600.0 / per_hour
+
+    def available(self, op_class: str, per_hour: float) -> float:
+        """
+        Токены общей корзины класса, доступные сейчас.
+
+        Args:
+            op_class: Класс операции
+            per_hour: Пополнение корзины в час (0 - без ограничения)
+
+        Returns:
+            Количество токенов (inf - класс не ограничен)
+        """
+        if not per_hour:
+            return float('inf')
+        try:
+            with self._lock:
+                return self._tokens(self.connection, op_class, per_hour, time.time())
+        except sqlite3.Error as e:
+            self.logger.warning(f"Журнал лимитов недоступен: {e}")
+            return float('inf')
+
+    def consume(self, op_class: str, cost: float, per_hour: float) -> None:
+        """
+        Списание токенов из общей корзины класса (долг не больше емкости корзины).
+
+        Args:
+            op_class: Класс операции
+            cost: Стоимость операции в токенах
+            per_hour: Пополнение корзины в час (0 - без ограничения)
+        """
+        if not per_hour:
+            return
+        now = time.time()
+        try:
+            with self._transaction() as connection:
+                tokens = self._tokens(connection, op_class, per_hour, now)
+                tokens = max(-max(1.0, per_hour), tokens - cost)
+                connection.execute(
+                    'INSERT OR REPLACE INTO buckets (account, op_class, tokens, updated) VALUES (?, ?, ?, ?)',
+                    (self.account_key, op_class, tokens, now)
+                )
+        except sqlite3.Error as e:
+            self.logger.warning(f"Не удалось записать операцию в журнал лимитов: {e}")
+
+    def pause(self, op_class: str, wait_seconds: int) -> None:
+        """
+        Общий для процессов срок FloodWait класса (более поздний срок не сокращается).
+
+        Args:
+            op_class: Класс операции, получившей FloodWait
+            wait_seconds: Время ожидания из FloodWaitError.seconds
+        """
+        deadline = time.time() + max(0, wait_seconds)
+        try:
+            with self._transaction() as connection:
+                connection.execute(
+                    'INSERT INTO flood_waits (account, op_class, deadline) VALUES (?, ?, ?) '
+                    'ON CONFLICT (account, op_class) DO UPDATE SET deadline = MAX(deadline, excluded.deadline)',
+                    (self.account_key, op_class, deadline)
+                )
+        except sqlite3.Error as e:
+            self.logger.warning(f"Не удалось записать FloodWait в журнал лимитов: {e}")
+
+    def flood_wait_remaining(self, op_class: str) -> float:
+        """
+        Оставшееся время FloodWait класса, полученного любым процессом аккаунта.
+
+        Args:
+            op_class: Класс операции
+
+        Returns:
+            Секунды до окончания паузы (0, если паузы нет)
+        """
+        try:
+            with self._lock:
+                row = self.connection.execute(
+                    'SELECT deadline FROM flood_waits WHERE account = ? AND op_class = ?',
+                    (self.account_key, op_class)
+                ).fetchone()
+        except sqlite3.Error as e:
+            self.logger.warning(f"Журнал лимитов недоступен: {e}")
+            return 0.0
+        return max(0.0, row[0] - time.time()) if row else 0.0
+
+    def close(self) -> None:
+        """Закрытие соединения с базой."""
+        try:
+            with self._lock:
+                self.connection.close()
+        except sqlite3.Error:
+            pass
@@ -0,0 +1,174 @@
+"""
+Модуль очереди повторов неудачно скопированных сообщений.
+Неудачи сохраняются на диске вместе с классом ошибки и повторяются после
+основного прохода с экспоненциальной задержкой своего класса. Сообщения,
+исчерпавшие попытки, переносятся в список dead-letter и больше не повторяются.
+"""
+
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Any
+from telethon.errors import FloodWaitError, PeerFloodError, MediaInvalidError, FileReferenceExpiredError
+
+
+EXPIRED_REFERENCE = 'expired_reference'
+MEDIA_INVALID = 'media_invalid'
+FLOOD = 'flood'
+UNKNOWN = 'unknown'
+
+
+def classify_failure(error: Any) -> str:
+    """
+    Класс ошибки копирования для очереди повторов.
+
+    Args:
+        error: Исключение или текст ошибки
+
+    Returns:
+        expired_reference, media_invalid, flood или unknown
+    """
+    text = str(error).lower()
+    if isinstance(error, FileReferenceExpiredError) or 'file reference' in text:
+        return EXPIRED_REFERENCE
+    if isinstance(error, (FloodWaitError, PeerFloodError)) or 'flood' in text:
+        return FLOOD
+    if isinstance(error, MediaInvalidError) or 'self-destructing' in text or 'media invalid' in text:
+        return MEDIA_INVALID
+    return UNKNOWN
+
+
+class RetryQueue:
+    """Класс очереди повторов с задержками по классам ошибок и списком dead-letter."""
+
+    # Класс ошибки -> (базовая задержка в секундах, попыток до dead-letter)
+    BACKOFF = {
+        EXPIRED_REFERENCE: (60, 5),   # свежая ссылка получается при повторном чтении сообщения
+        FLOOD: (600, 8),              # временное ограничение - повторять дольше, но реже
+        MEDIA_INVALID: (1800, 2),     # медиа недоступно - скорее всего навсегда
+        UNKNOWN: (300, 4)
+    }
+    MAX_DELAY = 24 * 3600
+
+    def __init__(self, path: str = 'retry_queue.json'):
+        """
+        Инициализация очереди.
+
+        Args:
+            path: Файл очереди (JSON, относительный путь - в директории данных)
+        """
+        # ИСПРАВЛЕНО: Очередь лежит рядом с остальными файлами состояния, а не в текущей папке
+        data_dir = '/app/data' if os.path.exists('/app/data') else '.'
+        self.path = os.path.join(data_dir, path)
+        self.logger = logging.getLogger('telegram_copier.retry_queue')
+        if not os.path.exists(self.path) and os.path.exists(path) and os.path.abspath(path) != os.path.abspath(self.path):
+            # Очередь прежних версий из текущей папки переносится один раз
+            try:
+                shutil.move(path, self.path)
+            except OSError as e:
+                self.logger.warning(f"Не удалось перенести очередь повторов {path} в {self.path}: {e}")
+        # Ключ (первый ID) -> {ids, kind, attempts, next_attempt, error, first_failed, last_failed}
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.dead_letters: Dict[str, Dict[str, Any]] = {}
+        self._load()
+
+    def _load(self) -> None:
+        """Загрузка очереди с диска."""
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except Exception as e:
+            self.logger.warning(f"Не удалось загрузить очередь повторов {self.path}: {e}")
+            return
+        self.pending = data.get('pending', {})
+        self.dead_letters = data.get('dead_letters', {})
+        if self.pending or self.dead_letters:
+            self.logger.info(f"🔁 Очередь повторов: {len(self.pending)} ожидают, {len(self.dead_letters)} в dead-letter")
+
+    def save(self) -> None:
+        """Атомарное сохранение очереди."""
+        temp_path = f"{self.path}.tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({'pending': self.pending, 'dead_letters': self.dead_letters}, f, ensure_ascii=False, indent=2)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            self.logger.warning(f"Не удалось сохранить очередь повторов {self.path}: {e}")
+
+    def delay_for(self, kind: str, attempts: int) -> float:
+        """Задержка перед следующей попыткой: база класса * 2^(попытки - 1), не больше суток."""
+        base, _ = self.BACKOFF.get(kind, self.BACKOFF[UNKNOWN])
+        return min(self.MAX_DELAY, base * 2 ** max(0, attempts - 1))
+
+    def record_failure(self, source_ids: List[int], kind: str, error: str = '',
+                       entry_ids: Optional[List[int]] = None) -> bool:
+        """
+        Запись неудачи сообщения или альбома.
+
+        Args:
+            source_ids: ID сообщений в исходном канале (альбом - все ID)
+            kind: Класс ошибки (см. classify_failure)
+            error: Текст ошибки
+            entry_ids: ID записи очереди при повторе (часть альбома могли удалить -
+                ключ остается прежним, иначе старая запись повторялась бы вечно)
+
+        Returns:
+            True если сообщение перенесено в dead-letter
+        """
+        key = str(min(entry_ids or source_ids))
+        now = datetime.now().isoformat()
+        entry = self.pending.pop(key, None) or {'ids': sorted(source_ids), 'attempts': 0, 'first_failed': now}
+        entry.update({
+            'kind': kind if kind in self.BACKOFF else UNKNOWN,
+            'attempts': entry['attempts'] + 1,
+            'error': error[:500],
+            'last_failed': now
+        })
+
+        _, max_attempts = self.BACKOFF[entry['kind']]
+        if entry['attempts'] >= max_attempts:
+            entry.pop('next_attempt', None)
+            self.dead_letters[key] = entry
+            self.logger.warning(
+                f"☠️ Сообщения {entry['ids']} перенесены в dead-letter после {entry['attempts']} попыток ({entry['kind']}: {entry['error']})"
+            )
+            return True
+
+        entry['next_attempt'] = time.time() + self.delay_for(entry['kind'], entry['attempts'])
+        self.pending[key] = entry
+        self.logger.info(
+            f"🔁 Сообщения {entry['ids']} в очереди повторов ({entry['kind']}), попытка {entry['attempts']}/{max_attempts} "
+            f"через {int(entry['next_attempt'] - time.time())} сек"
+        )
+        return False
+
+    def record_success(self, source_ids: List[int]) -> None:
+        """Удаление успешно скопированных сообщений из очереди."""
+        self.pending.pop(str(min(source_ids)), None)
+
+    def remove(self, source_ids: List[int]) -> None:
+        """Удаление сообщений, которых больше нет в источнике."""
+        key = str(min(source_ids))
+        self.pending.pop(key, None)
+        self.dead_letters.pop(key, None)
+
+    def due(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        """Записи, чье время повтора наступило, по возрастанию ID."""
+        now = time.time() if now is None else now
+        ready = [entry for entry in self.pending.values() if entry['next_attempt'] <= now]
+        return sorted(ready, key=lambda entry: entry['ids'][0])
+
+    def tracked_ids(self) -> List[int]:
+        """Все ID в очереди и dead-letter по возрастанию (их не нужно искать как пропуски)."""
+        return sorted(
+            source_id for entries in (self.pending, self.dead_letters)
+            for entry in entries.values() for source_id in entry['ids']
+        )
+
+    def __len__(self) -> int:
+        return len(self.pending)
@@ -0,0 +1,176 @@
+"""
+Модуль журнала намерений отправки.
+Если процесс завершится между отправкой сообщения и записью трекера или
+точки возобновления, следующий запуск скачает, загрузит и опубликует это
+медиа повторно. Перед каждой отправкой в хранилище состояния записывается
+намерение с отпечатком единицы (текст, типы и размеры медиа). При запуске
+незавершенные намерения сверяются с последними сообщениями целевого канала:
+совпавшие считаются отправленными - восстановление стоит одного запроса
+истории вместо повторной загрузки.
+"""
+
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from telethon.tl.types import MessageMediaDocument, MessageMediaPhoto, MessageMediaWebPage
+
+from state_store import StateStore
+
+
+def _media_kind(media: Any) -> str:
+    """Тип медиа для отпечатка (превью ссылки не копируется - считается текстом)."""
+    if media is None or isinstance(media, MessageMediaWebPage):
+        return 'text'
+    if isinstance(media, MessageMediaPhoto):
+        return 'photo'
+    if isinstance(media, MessageMediaDocument):
+        return 'document'
+    return type(media).__name__
+
+
+def _media_size(media: Any) -> Optional[int]:
+    """Размер документа (фото сжимаются сервером заново - размер не сравнивается)."""
+    document = getattr(media, 'document', None) if isinstance(media, MessageMediaDocument) else None
+    return getattr(document, 'size', None)
+
+
+def unit_fingerprint(messages: List[Any]) -> Dict[str, Any]:
+    """
+    Отпечаток единицы отправки - одинаков у исходной единицы и ее копии.
+
+    Args:
+        messages: Сообщения единицы (одиночное или альбом) по возрастанию ID
+
+    Returns:
+        {'text': текст единицы, 'media': типы медиа, 'sizes': размеры документов}
+    """
+    text = next((message.message for message in messages if message.message and message.message.strip()), '')
+    return {
+        'text': text.strip(),
+        'media': [_media_kind(message.media) for message in messages],
+        'sizes': [_media_size(message.media) for message in messages]
+    }
+
+
+def unit_key(messages: List[Any]) -> Tuple[int, int]:
+    """
+    ИСПРАВЛЕНО: Ключ намерения единицы - (чат, первый ID).
+    Комментарии из группы обсуждения (режим антивложенности) имеют ID другого чата
+    и ключуются ее ID, посты канала-источника - нулем.
+
+    Args:
+        messages: Сообщения единицы
+
+    Returns:
+        (ID группы обсуждения или 0, первый ID единицы)
+    """
+    first = messages[0]
+    peer = (getattr(first, 'chat_id', None) or 0) if getattr(first, '_is_from_discussion_group', False) else 0
+    return peer, min(message.id for message in messages)
+
+
+class SendIntentJournal:
+    """Класс журнала намерений отправки поверх хранилища состояния."""
+
+    # Допуск расхождения часов при сравнении даты сообщения с временем намерения
+    CLOCK_SKEW = 120
+
+    def __init__(self, store: StateStore, tail_limit: int = 50):
+        """
+        Инициализация журнала.
+
+        Args:
+            store: Хранилище состояния
+            tail_limit: Сколько последних сообщений цели проверять при запуске (не больше 100 - один запрос)
+        """
+        self.store = store
+        self.tail_limit = max(1, min(100, tail_limit))
+        self.logger = logging.getLogger('telegram_copier.send_journal')
+        # Отправленные единицы, чьи намерения удаляются после записи трекера и точки возобновления
+        self._settled: List[Tuple[int, int]] = []
+
+    async def record(self, units: List[List[Any]]) -> None:
+        """
+        Запись намерений перед отправкой единиц.
+        Все намерения фиксируются одной транзакцией в пуле потоков - запись на диск
+        не останавливает цикл событий, а отправка ждет ее окончания.
+
+        Args:
+            units: Единицы отправки (сообщения одиночного сообщения или альбома)
+        """
+        intents = [
+            (*unit_key(messages), {
+                'ids': sorted(message.id for message in messages),
+                'grouped_id': getattr(messages[0], 'grouped_id', None),
+                'fingerprint': unit_fingerprint(sorted(messages, key=lambda message: message.id))
+            })
+            for messages in units
+        ]
+        if intents:
+            await asyncio.get_running_loop().run_in_executor(None, self.store.add_intents, intents)
+
+    async def resolve(self, units: List[List[Any]], sent: bool) -> None:
+        """
+        Исход отправки единиц.
+
+        Args:
+            units: Единицы отправки
+            sent: True - отправлены (намерения удаляются позже, когда исход записан),
+                  False - не отправлены (намерения удаляются сразу, в пуле потоков)
+        """
+        keys = [unit_key(messages) for messages in units]
+        if sent:
+            self._settled.extend(keys)
+        elif keys:
+            await asyncio.get_running_loop().run_in_executor(None, self.store.remove_intents, keys)
+
+    def clear_settled(self) -> None:
+        """Удаление намерений отправленных единиц (трекер и точка возобновления уже записаны)."""
+        if self._settled:
+            self.store.remove_intents(self._settled)
+            self._settled = []
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """Незавершенные намерения по возрастанию ID."""
+        return self.store.intents()
+
+    def remove(self, intents: List[Dict[str, Any]]) -> None:
+        """Удаление проверенных намерений."""
+        self.store.remove_intents((intent['peer'], intent['source_id']) for intent in intents)
+
+    def match(self, intents: List[Dict[str, Any]], target_messages: List[Any]) -> Dict[Tuple[int, int], List[int]]:
+        """
+        Сопоставление намерений с последними сообщениями цели.
+
+        Args:
+            intents: Незавершенные намерения по возрастанию ID
+            target_messages: Последние сообщения целевого канала (в любом порядке)
+
+        Returns:
+            (чат единицы, первый ID единицы) -> ID ее копии в цели
+        """
+        # Сообщения цели по единицам (альбом - сообщения с общим grouped_id) от старых к новым
+        units: List[List[Any]] = []
+        for message in sorted((message for message in target_messages if message), key=lambda message: message.id):
+            grouped_id = getattr(message, 'grouped_id', None)
+            if grouped_id and units and getattr(units[-1][0], 'grouped_id', None) == grouped_id:
+                units[-1].append(message)
+            else:
+                units.append([message])
+
+        matches: Dict[Tuple[int, int], List[int]] = {}
+        used = set()
+        for intent in intents:
+            for index, unit in enumerate(units):
+                if index in used:
+                    continue
+                # Копия не может быть старше намерения
+                sent_at = unit[0].date.timestamp() if getattr(unit[0], 'date', None) else None
+                if sent_at is not None and sent_at < intent['created'] - self.CLOCK_SKEW:
+                    continue
+                if unit_fingerprint(unit) == intent['fingerprint']:
+                    matches[(intent['peer'], intent['source_id'])] = [message.id for message in unit]
+                    used.add(index)
+                    break
+        return matches
@@ -0,0 +1,329 @@
+"""
+Модуль единого хранилища состояния копирования.
+Точка возобновления, состояние FloodWait и хеши дедупликации раньше жили в
+отдельных файлах (last_message_id.txt, flood_wait_state.json,
+processed_messages.json) со своими способами записи и после сбоя могли
+противоречить друг другу. Хранилище держит их в одной базе SQLite с областью
+на пару источник/цель и меняет несколько ключей одной транзакцией.
+Там же хранится журнал намерений отправки (см. send_journal.py).
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from utils import normalize_flood_wait_state
+
+
+class StateStore:
+    """Класс хранилища состояния копирования пары источник/цель в SQLite."""
+
+    def __init__(self, filename: str = 'copier_state.db', scope: str = '', busy_timeout: float = 30.0):
+        """
+        Инициализация хранилища.
+
+        Args:
+            filename: Имя файла базы в директории данных
+            scope: Область состояния - пара источник/цель (записи разных пар не пересекаются)
+            busy_timeout: Сколько секунд ждать блокировку другого процесса
+        """
+        # Директория данных - та же, что у файла прогресса
+        self.data_dir = '/app/data' if os.path.exists('/app/data') else '.'
+        os.makedirs(self.data_dir, exist_ok=True)
+        self.path = os.path.join(self.data_dir, filename)
+        self.scope = scope
+        self.logger = logging.getLogger('telegram_copier.state_store')
+
+        # Соединение используется и пулом потоков (запись точки возобновления) - доступ под self._lock
+        self._lock = threading.Lock()
+        self.connection = sqlite3.connect(self.path, timeout=busy_timeout, isolation_level=None,
+                                          check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS state ('
+            'scope TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, updated REAL NOT NULL, '
+            'PRIMARY KEY (scope, key))'
+        )
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS dedup ('
+            'scope TEXT NOT NULL, hash TEXT NOT NULL, added REAL NOT NULL, '
+            'PRIMARY KEY (scope, hash))'
+        )
+        # НОВОЕ: Журнал намерений отправки (ключ - чат единицы и ее первый ID)
+        # ИСПРАВЛЕНО: peer - ID группы обсуждения для комментариев (0 - канал-источник),
+        # иначе в режиме антивложенности комментарий затирал намерение поста с тем же ID
+        columns = [row[1] for row in self.connection.execute('PRAGMA table_info(intents)')]
+        if columns and 'peer' not in columns:
+            with self._transaction() as connection:
+                connection.execute('ALTER TABLE intents RENAME TO intents_legacy')
+                self._create_intents_table(connection)
+                connection.execute(
+                    'INSERT INTO intents (scope, peer, source_id, payload, created) '
+                    'SELECT scope, 0, source_id, payload, created FROM intents_legacy'
+                )
+                connection.execute('DROP TABLE intents_legacy')
+        else:
+            self._create_intents_table(self.connection)
+
+    @staticmethod
+    def _create_intents_table(connection) -> None:
+        """Таблица намерений отправки."""
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS intents ('
+            'scope TEXT NOT NULL, peer INTEGER NOT NULL DEFAULT 0, source_id INTEGER NOT NULL, '
+            'payload TEXT NOT NULL, created REAL NOT NULL, '
+            'PRIMARY KEY (scope, peer, source_id))'
+        )
+
+    @contextmanager
+    def _transaction(self, write: bool = True):
+        """Транзакция (запись - с блокировкой, другие процессы ждут ее окончания)."""
+        with self._lock:
+            self.connection.execute('BEGIN IMMEDIATE' if write else 'BEGIN')
+            try:
+                yield self.connection
+            except Exception:
+                self.connection.execute('ROLLBACK')
+                raise
+            else:
+                self.connection.execute('COMMIT')
+
+    def _get(self, connection, key: str, default: Any = None) -> Any:
+        """Значение ключа внутри открытой транзакции."""
+        row = connection.execute(
+            'SELECT value FROM state WHERE scope = ? AND key = ?', (self.scope, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _set(self, connection, key: str, value: Any, now: float) -> None:
+        """Запись ключа внутри открытой транзакции."""
+        connection.execute(
+            'INSERT OR REPLACE INTO state (scope, key, value, updated) VALUES (?, ?, ?, ?)',
+            (self.scope, key, json.dumps(value, ensure_ascii=False), now)
+        )
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Значение ключа (JSON) или default."""
+        with self._transaction(write=False) as connection:
+            return self._get(connection, key, default)
+
+    def commit(self, values: Optional[Dict[str, Any]] = None, delete: Iterable[str] = (),
+               hashes: Iterable[str] = ()) -> None:
+        """
+        Атомарная запись нескольких ключей одной транзакцией.
+
+        Args:
+            values: Ключи и новые значения (JSON)
+            delete: Удаляемые ключи
+            hashes: Хеши дедупликации (повторный хеш получает новое время добавления)
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            for key, value in (values or {}).items():
+                self._set(connection, key, value, now)
+            for key in delete:
+                connection.execute('DELETE FROM state WHERE scope = ? AND key = ?', (self.scope, key))
+            connection.executemany(
+                'INSERT OR REPLACE INTO dedup (scope, hash, added) VALUES (?, ?, ?)',
+                ((self.scope, message_hash, now) for message_hash in hashes)
+            )
+
+    def advance_checkpoint(self, message_id: int) -> bool:
+        """
+        Перенос точки возобновления вперед (более старый ID не записывается).
+        Состояние FloodWait, относящееся к сообщениям не новее точки, и намерения
+        отправки между прежней и новой точкой удаляются той же транзакцией -
+        после сбоя они не противоречат друг другу.
+
+        Args:
+            message_id: ID последнего обработанного сообщения
+
+        Returns:
+            True если точка перенесена
+        """
+        with self._transaction() as connection:
+            checkpoint = self._get(connection, 'checkpoint')
+            if checkpoint is not None and message_id <= checkpoint:
+                return False
+            self._set(connection, 'checkpoint', message_id, time.time())
+            flood_state = self._get(connection, 'flood_wait')
+            if flood_state and max(flood_state.get('message_ids') or [0]) <= message_id:
+                connection.execute('DELETE FROM state WHERE scope = ? AND key = ?', (self.scope, 'flood_wait'))
+            # Намерения ниже прежней точки (пропуски, повторы) сюда не входят - их исход еще не записан.
+            # Точка - ID канала-источника, намерения комментариев она не покрывает
+            connection.execute(
+                'DELETE FROM intents WHERE scope = ? AND peer = 0 AND source_id > ? AND source_id <= ?',
+                (self.scope, checkpoint or 0, message_id)
+            )
+            return True
+
+    def load_resume_state(self) -> Dict[str, Any]:
+        """
+        Согласованное чтение состояния для возобновления одной транзакцией.
+
+        Returns:
+            {'checkpoint': ID или None, 'flood_wait': состояние FloodWait или None}
+        """
+        with self._transaction(write=False) as connection:
+            return {
+                'checkpoint': self._get(connection, 'checkpoint'),
+                'flood_wait': self._get(connection, 'flood_wait')
+            }
+
+    def iter_dedup_hashes(self, batch_size: int = 10000) -> Iterator[Tuple[str, float]]:
+        """
+        Хеши дедупликации области с временем добавления - пакетами, без загрузки всех в память.
+
+        ИСПРАВЛЕНО: Каждый пакет читается отдельной короткой транзакцией (по ключу после
+        последнего хеша), а выдается уже без блокировки - запись точки возобновления из
+        пула потоков не ждет, пока вызывающий код обработает все хеши.
+
+        Yields:
+            (хеш, время добавления)
+        """
+        last_hash = ''
+        while True:
+            with self._transaction(write=False) as connection:
+                rows = connection.execute(
+                    'SELECT hash, added FROM dedup WHERE scope = ? AND hash > ? ORDER BY hash LIMIT ?',
+                    (self.scope, last_hash, batch_size)
+                ).fetchall()
+            if not rows:
+                break
+            yield from rows
+            last_hash = rows[-1][0]
+
+    def has_hash(self, message_hash: str) -> bool:
+        """Точная проверка хеша дедупликации (поиск по первичному ключу)."""
+        with self._transaction(write=False) as connection:
+            return connection.execute(
+                'SELECT 1 FROM dedup WHERE scope = ? AND hash = ?', (self.scope, message_hash)
+            ).fetchone() is not None
+
+    def prune_hashes(self, added_before: float) -> int:
+        """
+        Удаление хешей дедупликации, добавленных раньше added_before.
+
+        Args:
+            added_before: Граница времени (time.time())
+
+        Returns:
+            Количество удаленных хешей
+        """
+        with self._transaction() as connection:
+            return connection.execute(
+                'DELETE FROM dedup WHERE scope = ? AND added < ?', (self.scope, added_before)
+            ).rowcount
+
+    def add_intents(self, intents: Iterable[Tuple[int, int, Dict[str, Any]]]) -> None:
+        """
+        Запись намерений отправки одной транзакцией (до отправки, с фиксацией на диске).
+
+        Args:
+            intents: Тройки (чат единицы - 0 для канала-источника, первый ID единицы, данные намерения JSON)
+        """
+        now = time.time()
+        with self._transaction() as connection:
+            connection.executemany(
+                'INSERT OR REPLACE INTO intents (scope, peer, source_id, payload, created) VALUES (?, ?, ?, ?, ?)',
+                ((self.scope, peer, source_id, json.dumps(payload, ensure_ascii=False), now)
+                 for peer, source_id, payload in intents)
+            )
+
+    def remove_intents(self, keys: Iterable[Tuple[int, int]]) -> None:
+        """Удаление намерений отправки по парам (чат единицы, первый ID) одной транзакцией."""
+        with self._transaction() as connection:
+            connection.executemany(
+                'DELETE FROM intents WHERE scope = ? AND peer = ? AND source_id = ?',
+                ((self.scope, peer, source_id) for peer, source_id in keys)
+            )
+
+    def intents(self) -> List[Dict[str, Any]]:
+        """Незавершенные намерения отправки по возрастанию ID: payload + peer, source_id и created."""
+        with self._transaction(write=False) as connection:
+            rows = connection.execute(
+                'SELECT peer, source_id, payload, created FROM intents WHERE scope = ? ORDER BY source_id, peer',
+                (self.scope,)
+            ).fetchall()
+        return [dict(json.loads(payload), peer=peer, source_id=source_id, created=created)
+                for peer, source_id, payload, created in rows]
+
+    def import_legacy(self, resume_file: str = 'last_message_id.txt', flood_state_file: str = 'flood_wait_state.json',
+                      dedup_file: Optional[str] = 'processed_messages.json') -> None:
+        """
+        Однократный перенос прежних файлов состояния в хранилище.
+        Все найденные значения записываются одной транзакцией, после чего файлы
+        переименовываются в *.migrated.
+
+        Args:
+            resume_file: Файл прогресса (в директории данных)
+            flood_state_file: Файл состояния FloodWait (в директории данных)
+            dedup_file: Файл хешей дедупликации (None - без переноса)
+        """
+        if self.get('legacy_imported'):
+            return
+
+        values: Dict[str, Any] = {'legacy_imported': True}
+        hashes: Set[str] = set()
+        sources = []
+
+        resume_path = os.path.join(self.data_dir, resume_file)
+        try:
+            with open(resume_path, 'r', encoding='utf-8') as f:
+                content = f.read().strip()
+            sources.append(resume_path)
+            if content.isdigit() and int(content) > 0:
+                values['checkpoint'] = int(content)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.logger.warning(f"Не удалось прочитать {resume_path}: {e}")
+
+        flood_path = os.path.join(self.data_dir, flood_state_file)
+        try:
+            with open(flood_path, 'r', encoding='utf-8') as f:
+                flood_state = normalize_flood_wait_state(json.load(f))
+            sources.append(flood_path)
+            if flood_state:
+                values['flood_wait'] = flood_state
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Не удалось прочитать {flood_path}: {e}")
+
+        if dedup_file:
+            try:
+                with open(dedup_file, 'r', encoding='utf-8') as f:
+                    hashes.update(json.load(f).get('hashes', []))
+                sources.append(dedup_file)
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as e:
+                self.logger.warning(f"Не удалось прочитать {dedup_file}: {e}")
+
+        # Значение прежних файлов не заменяет уже записанную точку возобновления
+        current = self.load_resume_state()
+        if current['checkpoint'] is not None:
+            values.pop('checkpoint', None)
+        self.commit(values, hashes=hashes)
+
+        for path in sources:
+            try:
+                os.replace(path, f"{path}.migrated")
+            except OSError as e:
+                self.logger.warning(f"Не удалось переименовать {path}: {e}")
+        if sources:
+            self.logger.info(
+                f"📦 Состояние перенесено в {self.path}: точка возобновления {values.get('checkpoint', '-')}, "
+                f"FloodWait {'есть' if 'flood_wait' in values else 'нет'}, хешей {len(hashes)}"
+            )
+
+    def close(self) -> None:
+        """Закрытие соединения."""
+        with self._lock:
+            self.connection.close()
@@ -0,0 +1,45 @@
+"""Тесты множества интервалов для поиска пропусков."""
+
+from gap_detector import IntervalSet
+
+
+def test_from_sorted_ids_merges_runs():
+    ids = IntervalSet.from_sorted_ids([1, 2, 3, 3, 5, 7, 8])
+    assert ids.intervals() == [(1, 3), (5, 5), (7, 8)]
+
+
+def test_difference_cuts_holes():
+    manifest = IntervalSet([(1, 10), (20, 30)])
+    copied = IntervalSet([(1, 3), (5, 5), (9, 22), (30, 40)])
+    assert manifest.difference(copied).intervals() == [(4, 4), (6, 8), (23, 29)]
+
+
+def test_difference_with_empty_sets():
+    manifest = IntervalSet([(5, 8)])
+    assert manifest.difference(IntervalSet()).intervals() == [(5, 8)]
+    assert IntervalSet().difference(manifest).intervals() == []
+    assert manifest.difference(IntervalSet([(1, 100)])).intervals() == []
+
+
+def test_difference_does_not_modify_operands():
+    manifest = IntervalSet([(1, 10)])
+    copied = IntervalSet([(4, 6)])
+    manifest.difference(copied)
+    assert manifest.intervals() == [(1, 10)]
+    assert copied.intervals() == [(4, 6)]
+
+
+def test_discard_splits_interval():
+    ids = IntervalSet([(1, 5)])
+    ids.discard(3)
+    assert ids.intervals() == [(1, 2), (4, 5)]
+
+
+def test_discard_interval_edges_and_missing_values():
+    ids = IntervalSet([(1, 3), (7, 7)])
+    ids.discard(1)
+    ids.discard(3)
+    ids.discard(7)
+    ids.discard(5)
+    ids.discard(100)
+    assert ids.intervals() == [(2, 2)]
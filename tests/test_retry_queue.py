@@ -0,0 +1,82 @@
+"""Тесты очереди повторов: задержки по классам ошибок и перенос в dead-letter."""
+
+import time
+
+import pytest
+
+from retry_queue import EXPIRED_REFERENCE, FLOOD, MEDIA_INVALID, UNKNOWN, RetryQueue, classify_failure
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return RetryQueue('retry_queue.json')
+
+
+def test_delay_doubles_per_attempt_up_to_a_day(queue):
+    assert queue.delay_for(EXPIRED_REFERENCE, 1) == 60
+    assert queue.delay_for(EXPIRED_REFERENCE, 2) == 120
+    assert queue.delay_for(FLOOD, 3) == 2400
+    assert queue.delay_for(FLOOD, 20) == RetryQueue.MAX_DELAY
+
+
+def test_unknown_kind_uses_unknown_backoff(queue):
+    assert queue.delay_for('something_else', 1) == RetryQueue.BACKOFF[UNKNOWN][0]
+    queue.record_failure([5], 'something_else')
+    assert queue.pending['5']['kind'] == UNKNOWN
+
+
+def test_failure_is_scheduled_with_class_delay(queue):
+    before = time.time()
+    assert queue.record_failure([12, 10, 11], EXPIRED_REFERENCE, 'file reference expired') is False
+    entry = queue.pending['10']
+    assert entry['ids'] == [10, 11, 12]
+    assert entry['attempts'] == 1
+    assert entry['next_attempt'] >= before + 60
+    assert queue.due(now=before) == []
+    assert queue.due(now=entry['next_attempt']) == [entry]
+
+
+def test_moves_to_dead_letter_after_max_attempts(queue):
+    _, max_attempts = RetryQueue.BACKOFF[MEDIA_INVALID]
+    results = [queue.record_failure([7], MEDIA_INVALID) for _ in range(max_attempts)]
+    assert results == [False] * (max_attempts - 1) + [True]
+    assert '7' not in queue.pending
+    assert queue.dead_letters['7']['attempts'] == max_attempts
+    assert 'next_attempt' not in queue.dead_letters['7']
+    assert queue.tracked_ids() == [7]
+
+
+def test_retry_keeps_entry_key_when_album_shrinks(queue):
+    queue.record_failure([3, 4, 5], FLOOD)
+    # Первое сообщение альбома удалено в источнике - повтор остается той же записью
+    queue.record_failure([4, 5], FLOOD, entry_ids=[3, 4, 5])
+    assert list(queue.pending) == ['3']
+    assert queue.pending['3']['attempts'] == 2
+
+
+def test_success_and_remove(queue):
+    queue.record_failure([1], UNKNOWN)
+    queue.record_success([1])
+    assert len(queue) == 0
+
+    _, max_attempts = RetryQueue.BACKOFF[MEDIA_INVALID]
+    for _ in range(max_attempts):
+        queue.record_failure([2], MEDIA_INVALID)
+    queue.remove([2])
+    assert queue.tracked_ids() == []
+
+
+def test_saved_queue_is_loaded_again(queue, tmp_path):
+    queue.record_failure([9], FLOOD, 'flood')
+    queue.save()
+    reloaded = RetryQueue('retry_queue.json')
+    assert reloaded.pending == queue.pending
+    assert (tmp_path / 'retry_queue.json').exists()
+
+
+def test_classify_failure_by_text():
+    assert classify_failure('The file reference has expired') == EXPIRED_REFERENCE
+    assert classify_failure('A wait of 30 seconds is required (caused by flood)') == FLOOD
+    assert classify_failure('Media invalid') == MEDIA_INVALID
+    assert classify_failure('Connection reset') == UNKNOWN
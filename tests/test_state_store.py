@@ -0,0 +1,105 @@
+"""Тесты хранилища состояния: точка возобновления, FloodWait и намерения отправки."""
+
+import sqlite3
+import threading
+
+import pytest
+
+from state_store import StateStore
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    store = StateStore('copier_state.db', 'source:target')
+    yield store
+    store.close()
+
+
+def _intent_keys(store):
+    return [(intent['peer'], intent['source_id']) for intent in store.intents()]
+
+
+def test_advance_checkpoint_is_monotonic(store):
+    assert store.advance_checkpoint(10) is True
+    assert store.advance_checkpoint(5) is False
+    assert store.advance_checkpoint(10) is False
+    assert store.load_resume_state()['checkpoint'] == 10
+
+
+def test_advance_checkpoint_drops_covered_flood_state_and_intents(store):
+    store.advance_checkpoint(10)
+    store.commit({'flood_wait': {'message_ids': [12, 13], 'resume_id': 11}})
+    store.add_intents([
+        (0, 8, {'ids': [8]}),        # ниже прежней точки - исход еще не записан
+        (0, 12, {'ids': [12, 13]}),
+        (0, 20, {'ids': [20]}),
+        (-100500, 12, {'ids': [12]})  # комментарий из группы обсуждения
+    ])
+
+    # Точка не покрывает весь альбом - состояние FloodWait остается
+    store.advance_checkpoint(12)
+    assert store.load_resume_state()['flood_wait'] is not None
+    assert _intent_keys(store) == [(0, 8), (-100500, 12), (0, 20)]
+
+    store.advance_checkpoint(15)
+    state = store.load_resume_state()
+    assert state == {'checkpoint': 15, 'flood_wait': None}
+    assert _intent_keys(store) == [(0, 8), (-100500, 12), (0, 20)]
+
+
+def test_advance_checkpoint_is_one_transaction(store, monkeypatch):
+    store.commit({'flood_wait': {'message_ids': [3], 'resume_id': 2}})
+    store.add_intents([(0, 3, {'ids': [3]})])
+
+    original_set = store._set
+
+    def failing_set(connection, key, value, now):
+        original_set(connection, key, value, now)
+        raise sqlite3.OperationalError('disk I/O error')
+
+    monkeypatch.setattr(store, '_set', failing_set)
+    with pytest.raises(sqlite3.OperationalError):
+        store.advance_checkpoint(5)
+
+    # Откат: ни точка, ни удаление состояния и намерений не записаны
+    assert store.load_resume_state()['checkpoint'] is None
+    assert store.load_resume_state()['flood_wait'] is not None
+    assert _intent_keys(store) == [(0, 3)]
+
+
+def test_intents_of_post_and_comment_do_not_overwrite_each_other(store):
+    store.add_intents([(0, 7, {'ids': [7]}), (-100500, 7, {'ids': [7]})])
+    store.remove_intents([(-100500, 7)])
+    assert _intent_keys(store) == [(0, 7)]
+
+
+def test_legacy_intents_table_is_migrated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    connection = sqlite3.connect('copier_state.db')
+    connection.execute(
+        'CREATE TABLE intents (scope TEXT NOT NULL, source_id INTEGER NOT NULL, payload TEXT NOT NULL, '
+        'created REAL NOT NULL, PRIMARY KEY (scope, source_id))'
+    )
+    connection.execute("INSERT INTO intents VALUES ('source:target', 4, '{\"ids\": [4]}', 1.0)")
+    connection.commit()
+    connection.close()
+
+    store = StateStore('copier_state.db', 'source:target')
+    assert store.intents() == [{'ids': [4], 'peer': 0, 'source_id': 4, 'created': 1.0}]
+    store.close()
+
+
+def test_iter_dedup_hashes_does_not_hold_the_lock(store):
+    store.commit(hashes=[f'hash{i:03d}' for i in range(25)])
+    hashes = []
+    for message_hash, _ in store.iter_dedup_hashes(batch_size=10):
+        if not hashes:
+            # Запись из другого потока (как CheckpointWriter) не ждет окончания чтения
+            writer = threading.Thread(target=store.advance_checkpoint, args=(1,))
+            writer.start()
+            writer.join(timeout=5)
+            assert not writer.is_alive()
+        hashes.append(message_hash)
+    assert hashes == sorted(f'hash{i:03d}' for i in range(25))
+    assert store.load_resume_state()['checkpoint'] == 1
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Поиск по трекеру скопированных сообщений.
+Отвечает на вопросы аудита по индексам хранилища, не перебирая всю историю:
+какой исходный пост стал сообщением N в целевом канале, во что скопирован
+альбом, что копировалось за период.
+
+Примеры:
+    python tracker_query.py --target 81234
+    python tracker_query.py --source 512
+    python tracker_query.py --grouped 13579246801357924
+    python tracker_query.py --since 2026-10-01 --until 2026-10-07
+"""
+
+import argparse
+import json
+import sys
+import time
+from datetime import datetime, time as day_time
+from typing import Optional
+
+from config import Config
+from message_tracker import MessageTracker
+
+
+def parse_date(value: str, end_of_day: bool = False) -> datetime:
+    """
+    Разбор даты или времени ISO (2026-10-01 или 2026-10-01T12:30).
+
+    Args:
+        value: Строка даты
+        end_of_day: Для даты без времени вернуть конец дня (граница --until)
+
+    Returns:
+        Время
+    """
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"некорректная дата: {value}")
+    if end_of_day and len(value) == 10:
+        parsed = datetime.combine(parsed.date(), day_time.max)
+    return parsed
+
+
+def format_entry(source_id: int, entry: dict) -> str:
+    """Строка таблицы результатов."""
+    target_id = entry.get("target_id")
+    album = ""
+    if entry.get("grouped_id"):
+        album = f" альбом {entry['grouped_id']}"
+        if entry.get("album_size"):
+            album += f" ({entry['album_size']} шт.)"
+    error = f" ошибка: {entry['error']}" if entry.get("error") else ""
+    return (f"{source_id:>10} -> {target_id if target_id is not None else '-':>10}  "
+            f"{entry.get('status', '?'):<7} {entry.get('type', '?'):<7} {entry.get('timestamp') or '-'}{album}{error}")
+
+
+def main(argv: Optional[list] = None) -> int:
+    """Разбор аргументов и вывод результатов поиска."""
+    parser = argparse.ArgumentParser(description='Поиск по трекеру скопированных сообщений')
+    parser.add_argument('--source', type=int, help='ID сообщения в исходном канале')
+    parser.add_argument('--target', type=int, help='ID сообщения в целевом канале')
+    parser.add_argument('--grouped', type=int, help='grouped_id исходного альбома')
+    parser.add_argument('--since', type=parse_date, help='Скопировано не раньше (дата или время ISO)')
+    parser.add_argument('--until', type=lambda value: parse_date(value, end_of_day=True),
+                        help='Скопировано не позже (дата или время ISO)')
+    parser.add_argument('--limit', type=int, default=100, help='Максимум строк вывода (0 - без ограничения)')
+    parser.add_argument('--json', action='store_true', help='Вывод в формате JSON')
+    parser.add_argument('--tracker-file', help='Файл трекера (по умолчанию TRACKER_FILE из .env)')
+    parser.add_argument('--backend', choices=MessageTracker.BACKENDS,
+                        help='Хранилище трекера (по умолчанию TRACKER_BACKEND из .env)')
+    args = parser.parse_args(argv)
+
+    if args.source is None and args.target is None and args.grouped is None and not args.since and not args.until:
+        parser.error("укажите хотя бы одно условие: --source, --target, --grouped, --since или --until")
+
+    config = Config()
+    # Только чтение: запрос не мешает работающему копировщику
+    tracker = MessageTracker(args.tracker_file or config.tracker_file,
+                             backend=args.backend or config.tracker_backend, read_only=True)
+
+    started = time.perf_counter()
+    results = tracker.find_entries(source_id=args.source, target_id=args.target, grouped_id=args.grouped,
+                                   since=args.since, until=args.until)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    shown = results[:args.limit] if args.limit else results
+
+    if args.json:
+        print(json.dumps([{"source_id": source_id, **entry} for source_id, entry in shown], ensure_ascii=False, indent=2))
+        return 0 if results else 1
+
+    for source_id, entry in shown:
+        print(format_entry(source_id, entry))
+    if len(shown) < len(results):
+        print(f"... еще {len(results) - len(shown)} (увеличьте --limit)")
+    print(f"🔍 Найдено: {len(results)} за {elapsed_ms:.1f} мс")
+    return 0 if results else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
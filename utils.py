@@ -10,8 +10,13 @@ import os
 import fcntl
 import json
 import hashlib
-from typing import Optional, Union, Set, Dict, Any
+import math
+import functools
+import threading
+from collections import deque
+from typing import Optional, Union, Set, Dict, Any, Callable, List
 from telethon.errors import FloodWaitError, PeerFloodError
+from rate_ledger import RateLedger
 
 
 def setup_logging(log_level: str = 'INFO') -> logging.Logger:
@@ -131,50 +136,575 @@ def truncate_text(text: str, max_length: int) -> str:
     return text[:max_length-3] + "..."
 
 
+class TokenBucket:
+    """НОВОЕ: Корзина токенов - емкость и равномерное пополнение, проверка за O(1)."""
+    
+    def __init__(self, per_hour: float, capacity: Optional[float] = None):
+        """
+        Инициализация корзины.
+        
+        Args:
+            per_hour: Пополнение токенов в час (0 - без ограничения)
+            capacity: Максимум накопленных токенов (по умолчанию - часовой бюджет)
+        """
+        self.per_hour = max(0.0, per_hour)
+        self.rate = self.per_hour / 3600.0
+        self.capacity = capacity if capacity is not None else max(1.0, self.per_hour)
+        # Емкость при изменении скорости не растет выше начальной - запас не превышает настроенный
+        self.max_capacity = self.capacity
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+    
+    def _refill(self, now: float) -> None:
+        """Пополнение токенов за прошедшее время."""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def delay_for(self, cost: float = 1.0) -> float:
+        """
+        Сколько секунд ждать, пока в корзине наберется cost токенов.
+        
+        Args:
+            cost: Стоимость операции в токенах
+        
+        Returns:
+            Время ожидания в секундах (0 - можно выполнять сразу)
+        """
+        if not self.rate:
+            return 0.0
+        self._refill(time.monotonic())
+        # Операция дороже всей корзины ждет полную корзину, а не бесконечно
+        needed = min(cost, self.capacity)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+    
+    def set_rate(self, per_hour: float) -> None:
+        """
+        НОВОЕ: Изменение скорости пополнения.
+        ИСПРАВЛЕНО: Текущий уровень токенов сохраняется (только ограничивается емкостью),
+        емкость не больше начальной и не больше часового бюджета - рост скорости
+        не дает дополнительного запаса токенов.
+        
+        Args:
+            per_hour: Новое пополнение токенов в час
+        """
+        self._refill(time.monotonic())
+        self.per_hour = max(0.0, per_hour)
+        self.rate = self.per_hour / 3600.0
+        self.capacity = min(self.max_capacity, max(1.0, self.per_hour))
+        self.tokens = min(self.tokens, self.capacity)
+    
+    def consume(self, cost: float = 1.0) -> None:
+        """
+        Списание токенов за выполненную операцию (долг не больше емкости корзины).
+        
+        Args:
+            cost: Стоимость операции в токенах
+        """
+        if not self.rate:
+            return
+        self._refill(time.monotonic())
+        self.tokens = max(-self.capacity, self.tokens - cost)
+
+
+class FloodWaitCoordinator:
+    """
+    НОВОЕ: Общие для аккаунта паузы FloodWait по классам запросов.
+    
+    FloodWait выдается аккаунту, а не корутине: после него все запросы того же
+    класса ждут окончания паузы, а запросы других классов продолжаются.
+    """
+    
+    def __init__(self):
+        """Инициализация координатора."""
+        # Класс запроса -> время окончания паузы (time.monotonic)
+        self.deadlines: Dict[str, float] = {}
+        self.logger = logging.getLogger('telegram_copier.flood_wait')
+    
+    def remaining(self, op_class: str) -> float:
+        """
+        Оставшееся время паузы класса.
+        
+        Args:
+            op_class: Класс запроса
+        
+        Returns:
+            Секунды до окончания паузы (0, если паузы нет)
+        """
+        deadline = self.deadlines.get(op_class)
+        if deadline is None:
+            return 0.0
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            del self.deadlines[op_class]
+            return 0.0
+        return remaining
+    
+    def pause(self, op_class: str, wait_seconds: int) -> None:
+        """
+        Пауза класса запросов после FloodWait (более поздний срок не сокращается).
+        
+        Args:
+            op_class: Класс запроса, получившего FloodWait
+            wait_seconds: Время ожидания из FloodWaitError.seconds
+        """
+        deadline = time.monotonic() + max(0, wait_seconds)
+        if deadline > self.deadlines.get(op_class, 0.0):
+            self.deadlines[op_class] = deadline
+            self.logger.debug(f"⏸️ Запросы '{op_class}' приостановлены на {wait_seconds}с")
+    
+    async def wait(self, op_class: str) -> None:
+        """
+        Ожидание окончания паузы класса перед запросом.
+        
+        Args:
+            op_class: Класс запроса
+        """
+        remaining = self.remaining(op_class)
+        while remaining > 0:
+            await asyncio.sleep(remaining)
+            # Пока ждали, другой запрос мог продлить паузу
+            remaining = self.remaining(op_class)
+
+
+# НОВОЕ: Один координатор на процесс - процесс работает от имени одного аккаунта
+flood_wait_coordinator = FloodWaitCoordinator()
+
+
 class RateLimiter:
-    """Класс для управления ограничениями скорости отправки сообщений."""
+    """
+    Класс для управления ограничениями скорости запросов к Telegram.
+    НОВОЕ: Отдельные корзины токенов для классов операций (текст, медиа, история,
+    скачивание, удаление) со стоимостью операции вместо подсчета "сообщений".
+    """
     
-    def __init__(self, messages_per_hour: int = 30, delay_seconds: int = 3):
+    # Классы операций, которые Telegram ограничивает независимо
+    OPERATION_CLASSES = ('text', 'media', 'history', 'download', 'upload', 'delete')
+    
+    # НОВОЕ: Классы, которые считаются в общем бюджете запросов аккаунта (скачивание - в мегабайтах)
+    ACCOUNT_REQUEST_CLASSES = ('text', 'media', 'history', 'delete')
+    
+    # НОВОЕ: Параметры AIMD - прибавка (доля базового бюджета) за каждое окно без FloodWait
+    # с успешными операциями, длительность окна в секундах, множитель при FloodWait
+    # и нижняя граница (доля базового бюджета)
+    ADAPTIVE_INCREASE = 0.1
+    ADAPTIVE_WINDOW = 600
+    ADAPTIVE_DECREASE = 0.5
+    ADAPTIVE_MIN_FACTOR = 0.1
+    
+    def __init__(self, messages_per_hour: int = 30, delay_seconds: int = 3,
+                 class_limits: Optional[Dict[str, float]] = None,
+                 class_delays: Optional[Dict[str, float]] = None,
+                 adaptive: bool = False, account_key: Optional[str] = None,
+                 max_factor: float = 3.0, state_file: str = 'rate_state.json',
+                 account_limit: float = 0, ledger_file: Optional[str] = None):
         """
         Инициализация ограничителя скорости.
         
         Args:
-            messages_per_hour: Максимальное количество сообщений в час
+            messages_per_hour: Максимальное количество сообщений в час (бюджет текста и медиа по умолчанию)
             delay_seconds: Минимальная задержка между сообщениями в секундах
+            class_limits: Бюджеты классов операций в токенах в час (0 - без ограничения)
+            class_delays: Минимальные паузы между операциями класса в секундах
+            adaptive: Подстраивать бюджеты по FloodWait (AIMD)
+            account_key: Ключ аккаунта для сохранения выученных бюджетов (хранится хешем)
+            max_factor: Во сколько раз выученный бюджет может превысить настроенный
+            state_file: Файл с выученными бюджетами (в папке данных)
+            account_limit: Общий бюджет запросов аккаунта в час (0 - без ограничения)
+            ledger_file: Файл SQLite, общий для процессов аккаунта (None - бюджеты только в памяти)
         """
         self.messages_per_hour = messages_per_hour
         self.delay_seconds = delay_seconds
-        self.message_times = []
         self.logger = logging.getLogger('telegram_copier.rate_limiter')
+        
+        limits = {'text': messages_per_hour, 'media': messages_per_hour}
+        limits.update(class_limits or {})
+        limits['account'] = account_limit
+        self.buckets: Dict[str, TokenBucket] = {
+            op_class: TokenBucket(limit) for op_class, limit in limits.items() if limit
+        }
+        self.base_limits: Dict[str, float] = {op_class: bucket.per_hour for op_class, bucket in self.buckets.items()}
+        
+        # НОВОЕ: Адаптивная скорость, сохраняемая по аккаунту и классу операций
+        self.adaptive = adaptive
+        self.account_key = hashlib.sha256(account_key.encode()).hexdigest()[:16] if account_key else None
+        self.max_factor = max(1.0, max_factor)
+        data_dir = '/app/data' if os.path.exists('/app/data') else '.'
+        self.state_path = os.path.join(data_dir, state_file)
+        # Класс -> начало текущего окна без FloodWait (прибавка - не чаще раза за окно)
+        self._window_started: Dict[str, float] = {}
+        if self.adaptive and self.account_key:
+            self._load_adaptive_state()
+        
+        # НОВОЕ: Журнал корзин и FloodWait, общий для всех процессов аккаунта
+        self.ledger: Optional[RateLedger] = None
+        # ИСПРАВЛЕНО: Последние прочитанные токены общих корзин - available_tokens
+        # не обращается к базе из цикла событий
+        self._shared_tokens: Dict[str, float] = {}
+        if ledger_file and self.account_key:
+            try:
+                self.ledger = RateLedger(os.path.join(data_dir, ledger_file), self.account_key)
+            except Exception as e:
+                self.logger.warning(f"Общий журнал лимитов недоступен, бюджеты только для этого процесса: {e}")
+        
+        self.min_intervals: Dict[str, float] = {'text': delay_seconds, 'media': delay_seconds}
+        self.min_intervals.update(class_delays or {})
+        
+        # Текст и медиа - это отправка сообщений, пауза между ними общая
+        self.interval_keys = {'media': 'text'}
+        self.last_times: Dict[str, float] = {}
+        
+        # Операции за последний час по классам (для статистики): (время, стоимость)
+        self.recent: Dict[str, deque] = {op_class: deque() for op_class in self.OPERATION_CLASSES}
     
-    async def wait_if_needed(self) -> None:
-        """Ожидание при необходимости для соблюдения лимитов."""
-        current_time = time.time()
+    async def wait_if_needed(self, op_class: str = 'text', cost: float = 1.0) -> None:
+        """
+        Ожидание при необходимости для соблюдения лимитов.
+        
+        Args:
+            op_class: Класс операции (text, media, history, download, upload, delete)
+            cost: Стоимость операции в токенах
+        """
+        # НОВОЕ: Сначала дожидаемся окончания FloodWait этого класса у всего аккаунта
+        await flood_wait_coordinator.wait(op_class)
+        if self.ledger:
+            # ИСПРАВЛЕНО: Запросы к SQLite выполняются в пуле потоков, как в CheckpointWriter
+            shared_wait = await asyncio.get_running_loop().run_in_executor(
+                None, self.ledger.flood_wait_remaining, op_class
+            )
+            if shared_wait > 0:
+                self.logger.info(f"⏸️ FloodWait '{op_class}' получен другим процессом аккаунта. Ожидание {shared_wait:.0f} секунд")
+                flood_wait_coordinator.pause(op_class, shared_wait)
+                await flood_wait_coordinator.wait(op_class)
         
-        # Удаляем сообщения старше часа
-        self.message_times = [t for t in self.message_times if current_time - t < 3600]
+        bucket_wait = max([await self._bucket_delay(key, cost) for key in self._bucket_keys(op_class)], default=0.0)
         
-        # Проверяем лимит сообщений в час
-        if len(self.message_times) >= self.messages_per_hour:
-            wait_time = 3600 - (current_time - self.message_times[0])
-            if wait_time > 0:
-                self.logger.info(f"Достигнут лимит сообщений в час. Ожидание {wait_time:.1f} секунд")
-                await asyncio.sleep(wait_time)
-                self.message_times = []
+        interval_wait = 0.0
+        min_interval = self.min_intervals.get(op_class, 0)
+        last_time = self.last_times.get(self.interval_keys.get(op_class, op_class))
+        if min_interval and last_time is not None:
+            interval_wait = min_interval - (time.monotonic() - last_time)
         
-        # Минимальная задержка между сообщениями
-        if self.message_times and current_time - self.message_times[-1] < self.delay_seconds:
-            wait_time = self.delay_seconds - (current_time - self.message_times[-1])
-            await asyncio.sleep(wait_time)
+        wait_time = max(bucket_wait, interval_wait)
+        if wait_time <= 0:
+            return
+        
+        if bucket_wait > interval_wait and bucket_wait >= 60:
+            self.logger.info(f"Достигнут лимит операций '{op_class}' в час. Ожидание {wait_time:.1f} секунд")
+        await asyncio.sleep(wait_time)
     
-    def record_message_sent(self) -> None:
+    def record_message_sent(self, op_class: str = 'text', cost: float = 1.0) -> None:
         """
-        НОВЫЙ МЕТОД: Записывает время отправки сообщения.
+        НОВЫЙ МЕТОД: Записывает выполненную операцию.
         Должен вызываться ПОСЛЕ успешной отправки сообщения.
+        
+        Args:
+            op_class: Класс операции
+            cost: Стоимость операции в токенах
+        """
+        now = time.monotonic()
+        for key in self._bucket_keys(op_class):
+            key_bucket = self.buckets.get(key)
+            if key_bucket:
+                key_bucket.consume(cost)
+                if self.ledger:
+                    if key in self._shared_tokens:
+                        self._shared_tokens[key] -= cost
+                    self._ledger_call(self.ledger.consume, key, cost, key_bucket.per_hour)
+        bucket = self.buckets.get(op_class)
+        self.last_times[self.interval_keys.get(op_class, op_class)] = now
+        
+        recent = self.recent.setdefault(op_class, deque())
+        recent.append((now, cost))
+        while recent and now - recent[0][0] >= 3600:
+            recent.popleft()
+        
+        if self.adaptive and bucket:
+            # ИСПРАВЛЕНО: Аддитивное увеличение раз в окно без FloodWait, а не за каждую операцию
+            window_started = self._window_started.setdefault(op_class, now)
+            if now - window_started >= self.ADAPTIVE_WINDOW:
+                self._window_started[op_class] = now
+                base = self.base_limits[op_class]
+                new_rate = min(base * self.max_factor, bucket.per_hour + base * self.ADAPTIVE_INCREASE)
+                if new_rate > bucket.per_hour:
+                    bucket.set_rate(new_rate)
+                    self.logger.debug(f"📈 Бюджет '{op_class}': {new_rate:.0f} в час")
+                    self.save_state()
+    
+    def record_flood_wait(self, op_class: str, wait_seconds: int) -> None:
+        """
+        НОВОЕ: Пауза класса для всего аккаунта и мультипликативное уменьшение
+        бюджета класса после FloodWait.
+        
+        Args:
+            op_class: Класс операции, получившей FloodWait
+            wait_seconds: Время ожидания из FloodWaitError.seconds
+        """
+        flood_wait_coordinator.pause(op_class, wait_seconds)
+        if self.ledger:
+            self._ledger_call(self.ledger.pause, op_class, wait_seconds)
+        
+        bucket = self.buckets.get(op_class)
+        if not self.adaptive or not bucket:
+            return
+        
+        base = self.base_limits[op_class]
+        old_rate = bucket.per_hour
+        bucket.set_rate(max(base * self.ADAPTIVE_MIN_FACTOR, old_rate * self.ADAPTIVE_DECREASE))
+        # Окно без FloodWait начинается заново
+        self._window_started[op_class] = time.monotonic()
+        # Сервер уже попросил подождать - накопленный запас не используем
+        bucket.tokens = min(bucket.tokens, 0.0)
+        self.logger.warning(f"📉 FloodWait {wait_seconds}с для '{op_class}': бюджет {old_rate:.0f} -> {bucket.per_hour:.0f} в час")
+        self.save_state()
+    
+    def available_tokens(self, op_class: str) -> float:
+        """
+        НОВОЕ: Сколько операций класса можно выполнить сейчас без ожидания.
+        
+        Args:
+            op_class: Класс операции
+        
+        Returns:
+            Доступные токены (inf - класс не ограничен)
+        """
+        available = float('inf')
+        for key in self._bucket_keys(op_class):
+            bucket = self.buckets.get(key)
+            if not bucket:
+                continue
+            bucket._refill(time.monotonic())
+            available = min(available, bucket.tokens)
+            if key in self._shared_tokens:
+                available = min(available, self._shared_tokens[key])
+        return max(0.0, available)
+    
+    def _bucket_keys(self, op_class: str) -> List[str]:
+        """НОВОЕ: Корзины, из которых списывается операция класса."""
+        if op_class in self.ACCOUNT_REQUEST_CLASSES:
+            return [op_class, 'account']
+        return [op_class]
+    
+    async def _bucket_delay(self, key: str, cost: float) -> float:
+        """НОВОЕ: Ожидание корзины с учетом операций других процессов аккаунта."""
+        bucket = self.buckets.get(key)
+        if not bucket:
+            return 0.0
+        delay = bucket.delay_for(cost)
+        if self.ledger and bucket.per_hour:
+            tokens = await asyncio.get_running_loop().run_in_executor(
+                None, self.ledger.available, key, bucket.per_hour
+            )
+            self._shared_tokens[key] = tokens
+            delay = max(delay, RateLedger.delay_from(tokens, cost, bucket.per_hour))
+        return delay
+    
+    def _ledger_call(self, method: Callable, *args) -> None:
+        """
+        ИСПРАВЛЕНО: Запись в общий журнал в пуле потоков без ожидания результата.
+        Вне цикла событий (служебные скрипты) запись выполняется сразу.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            method(*args)
+            return
+        loop.run_in_executor(None, method, *args)
+    
+    def save_state(self) -> None:
+        """НОВОЕ: Сохранение выученных бюджетов аккаунта (временный файл + rename)."""
+        if not self.adaptive or not self.account_key:
+            return
+        try:
+            state = {}
+            if os.path.exists(self.state_path):
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+            state[self.account_key] = {
+                op_class: {'per_hour': round(bucket.per_hour, 2), 'updated': time.time()}
+                for op_class, bucket in self.buckets.items()
+            }
+            temp_path = f"{self.state_path}.tmp"
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.state_path)
+        except Exception as e:
+            self.logger.warning(f"Не удалось сохранить состояние адаптивной скорости: {e}")
+    
+    def _load_adaptive_state(self) -> None:
+        """НОВОЕ: Загрузка выученных бюджетов аккаунта с прошлого запуска."""
+        try:
+            if not os.path.exists(self.state_path):
+                return
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                account_state = json.load(f).get(self.account_key, {})
+            for op_class, entry in account_state.items():
+                bucket = self.buckets.get(op_class)
+                if not bucket:
+                    continue
+                base = self.base_limits[op_class]
+                per_hour = min(base * self.max_factor, max(base * self.ADAPTIVE_MIN_FACTOR, entry.get('per_hour', base)))
+                bucket.set_rate(per_hour)
+                self.logger.info(f"📈 Бюджет '{op_class}' с прошлого запуска: {per_hour:.0f} в час")
+        except Exception as e:
+            self.logger.warning(f"Не удалось загрузить состояние адаптивной скорости: {e}")
+    
+    def get_statistics(self) -> Dict[str, Dict[str, float]]:
+        """
+        НОВОЕ: Статистика по классам операций за последний час.
+        
+        Returns:
+            Словарь класс -> операции, стоимость и доступные токены
+        """
+        now = time.monotonic()
+        stats = {}
+        for op_class, recent in self.recent.items():
+            while recent and now - recent[0][0] >= 3600:
+                recent.popleft()
+            bucket = self.buckets.get(op_class)
+            if bucket:
+                bucket._refill(now)
+            stats[op_class] = {
+                'operations_last_hour': len(recent),
+                'cost_last_hour': sum(cost for _, cost in recent),
+                'tokens_available': round(bucket.tokens, 2) if bucket else float('inf'),
+                'per_hour': round(bucket.per_hour, 2) if bucket else 0
+            }
+        return stats
+
+
+class MemoryBudget:
+    """
+    НОВОЕ: Общий на процесс бюджет байтов медиа, одновременно находящихся в памяти.
+    Скачивание резервирует байты заранее и ждет, пока бюджет не освободится.
+    """
+    
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024):
         """
-        self.message_times.append(time.time())
+        Инициализация бюджета.
+        
+        Args:
+            max_bytes: Максимум байтов медиа в памяти (0 - без ограничения)
+        """
+        self.max_bytes = max(0, max_bytes)
+        self.reserved_bytes = 0
+        self.peak_bytes = 0
+        self._condition = asyncio.Condition()
+        self.logger = logging.getLogger('telegram_copier.memory_budget')
+    
+    async def acquire(self, size: int) -> int:
+        """
+        Резервирование байтов с ожиданием свободного бюджета.
+        
+        Запрос больше всего бюджета выполняется, когда ничего больше не зарезервировано,
+        чтобы один большой файл не блокировал копирование навсегда.
+        
+        Args:
+            size: Количество байтов
+        
+        Returns:
+            Зарезервированное количество байтов (передается в release)
+        """
+        size = max(0, size)
+        if not self.max_bytes or not size:
+            return 0
+        
+        async with self._condition:
+            if not self._fits(size):
+                self.logger.debug(f"⏳ Бюджет памяти занят ({self.reserved_bytes}/{self.max_bytes} байт), ждем {size} байт")
+            await self._condition.wait_for(lambda: self._fits(size))
+            self.reserved_bytes += size
+            self.peak_bytes = max(self.peak_bytes, self.reserved_bytes)
+        return size
+    
+    def try_acquire(self, size: int) -> Optional[int]:
+        """
+        Резервирование байтов без ожидания.
+        
+        Args:
+            size: Количество байтов
+        
+        Returns:
+            Зарезервированное количество байтов или None, если бюджета не хватает
+        """
+        size = max(0, size)
+        if not self.max_bytes or not size:
+            return 0
+        if not self._fits(size):
+            return None
+        self.reserved_bytes += size
+        self.peak_bytes = max(self.peak_bytes, self.reserved_bytes)
+        return size
+    
+    def release(self, size: int) -> None:
+        """
+        Освобождение ранее зарезервированных байтов.
+        
+        Args:
+            size: Значение, которое вернул acquire/try_acquire
+        """
+        if not size:
+            return
+        self.reserved_bytes = max(0, self.reserved_bytes - size)
+        asyncio.ensure_future(self._notify())
+    
+    def _fits(self, size: int) -> bool:
+        """Помещается ли запрос в бюджет."""
+        return self.reserved_bytes + size <= self.max_bytes or self.reserved_bytes == 0
+    
+    async def _notify(self) -> None:
+        """Пробуждение ожидающих резервирования."""
+        async with self._condition:
+            self._condition.notify_all()
+
+
+# НОВОЕ: Подписчики на начало и конец ожидания FloodWait: listener(started, wait_seconds)
+# Планировщик копирования использует паузу, чтобы заранее скачивать следующие медиа
+_flood_wait_listeners: List[Callable[[bool, int], None]] = []
 
 
+def add_flood_wait_listener(listener: Callable[[bool, int], None]) -> None:
+    """
+    НОВОЕ: Подписка на начало и конец ожидания FloodWait.
+    
+    Args:
+        listener: Функция listener(started, wait_seconds), вызывается в начале (True) и в конце (False) ожидания
+    """
+    if listener not in _flood_wait_listeners:
+        _flood_wait_listeners.append(listener)
+
+
+def remove_flood_wait_listener(listener: Callable[[bool, int], None]) -> None:
+    """НОВОЕ: Отписка от событий FloodWait."""
+    if listener in _flood_wait_listeners:
+        _flood_wait_listeners.remove(listener)
+
+
+def _notify_flood_wait_listeners(handler):
+    """НОВОЕ: Декоратор обработчиков FloodWait, сообщающий подписчикам о начале и конце ожидания."""
+    @functools.wraps(handler)
+    async def wrapper(error: FloodWaitError, logger: logging.Logger, *args, **kwargs):
+        wait_time = getattr(error, 'seconds', 0)
+        for listener in list(_flood_wait_listeners):
+            try:
+                listener(True, wait_time)
+            except Exception as e:
+                logger.debug(f"Ошибка подписчика FloodWait: {e}")
+        try:
+            return await handler(error, logger, *args, **kwargs)
+        finally:
+            for listener in list(_flood_wait_listeners):
+                try:
+                    listener(False, wait_time)
+                except Exception as e:
+                    logger.debug(f"Ошибка подписчика FloodWait: {e}")
+    return wrapper
+
+
+@_notify_flood_wait_listeners
 async def handle_flood_wait(error: FloodWaitError, logger: logging.Logger, context: str = "") -> bool:
     """
     ИСПРАВЛЕНО: Правильная обработка ошибки FloodWaitError с обязательным ожиданием.
@@ -242,7 +772,8 @@ async def handle_flood_wait(error: FloodWaitError, logger: logging.Logger, conte
         logger.info(f"✅ FloodWait ({context}) завершен, продолжаем работу")
         return True
 
-async def handle_media_flood_wait(error: FloodWaitError, logger: logging.Logger, message_id: Union[int, str] = None) -> bool:
+@_notify_flood_wait_listeners
+async def handle_media_flood_wait(error: FloodWaitError, logger: logging.Logger, message_id: Union[int, List[int]] = None) -> bool:
     """
     ИСПРАВЛЕНО: Правильная обработка FloodWaitError для медиа операций.
     КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: Теперь ВСЕГДА ждет окончания FloodWait, никогда не пропускает сообщения.
@@ -250,13 +781,18 @@ async def handle_media_flood_wait(error: FloodWaitError, logger: logging.Logger,
     Args:
         error: Ошибка FloodWaitError от Telegram API  
         logger: Logger для записи информации
-        message_id: ID сообщения (int) или описание альбома (str) для контекста
+        message_id: ID сообщения (int) или ID всех сообщений альбома (list)
         
     Returns:
         True - всегда, так как мы всегда ждем окончания FloodWait
     """
     wait_time = error.seconds
-    context = f"Media Upload (msg {message_id})" if message_id else "Media Upload"
+    # ИСПРАВЛЕНО: альбом передается списком ID, а не строкой "Album 12111-12112"
+    if isinstance(message_id, (list, tuple)):
+        message_label = f"{message_id[0]}-{message_id[-1]}" if message_id else None
+    else:
+        message_label = message_id
+    context = f"Media Upload (msg {message_label})" if message_label else "Media Upload"
     
     # КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: Убираем логику пропуска сообщений
     # FloodWait действует на весь аккаунт, поэтому пропуск не решает проблему
@@ -311,8 +847,8 @@ async def handle_media_flood_wait(error: FloodWaitError, logger: logging.Logger,
         
         # Дополнительная пауза для безопасности
         await asyncio.sleep(5)
-        if isinstance(message_id, str) and message_id.startswith('Album'):
-            logger.info(f"✅ Media FloodWait завершен, продолжаем с альбома {message_id}")
+        if isinstance(message_id, (list, tuple)):
+            logger.info(f"✅ Media FloodWait завершен, продолжаем с альбома {message_label}")
         else:
             logger.info(f"✅ Media FloodWait завершен, продолжаем с сообщения {message_id}")
     
@@ -320,76 +856,261 @@ async def handle_media_flood_wait(error: FloodWaitError, logger: logging.Logger,
     return True
 
 
-def save_last_message_id(message_id: int, filename: str = 'last_message_id.txt') -> None:
+def _write_message_id(full_path: str, message_id: int) -> bool:
     """
-    ИСПРАВЛЕНО: Атомарное сохранение ID последнего обработанного сообщения в правильной директории.
+    НОВОЕ: Атомарная запись ID в файл (write + fsync + rename).
     
-    Args:
-        message_id: ID сообщения для сохранения
-        filename: Имя файла для сохранения
+    Returns:
+        True если файл записан
     """
+    temp_filename = f"{full_path}.tmp"
     try:
-        # ИСПРАВЛЕНО: Используем директорию данных
-        data_dir = '/app/data' if os.path.exists('/app/data') else '.'
-        os.makedirs(data_dir, exist_ok=True)
-        
-        # Полный путь к файлу в директории данных
-        full_path = os.path.join(data_dir, filename)
-        temp_filename = f"{full_path}.tmp"
-        
         with open(temp_filename, 'w', encoding='utf-8') as f:
             f.write(str(message_id))
             f.flush()  # Принудительная запись на диск
             os.fsync(f.fileno())  # Синхронизация с диском
         
         # Атомарное переименование
-        if os.path.exists(full_path):
-            os.replace(temp_filename, full_path)
-        else:
-            os.rename(temp_filename, full_path)
+        os.replace(temp_filename, full_path)
+        return True
             
     except Exception as e:
         logging.getLogger('telegram_copier').error(f"Ошибка сохранения ID сообщения: {e}")
         # Очищаем временный файл в случае ошибки
         try:
-            if os.path.exists(f"{full_path}.tmp"):
-                os.remove(f"{full_path}.tmp")
+            if os.path.exists(temp_filename):
+                os.remove(temp_filename)
         except:
             pass
+        return False
+
+
+def save_last_message_id(message_id: int, filename: str = 'last_message_id.txt') -> None:
+    """
+    ИСПРАВЛЕНО: Атомарное сохранение ID последнего обработанного сообщения в правильной директории.
+    НОВОЕ: Копировщик пишет прогресс пакетами через CheckpointWriter.
+    
+    Args:
+        message_id: ID сообщения для сохранения
+        filename: Имя файла для сохранения
+    """
+    # ИСПРАВЛЕНО: Используем директорию данных
+    data_dir = '/app/data' if os.path.exists('/app/data') else '.'
+    os.makedirs(data_dir, exist_ok=True)
+    
+    # Полный путь к файлу в директории данных
+    _write_message_id(os.path.join(data_dir, filename), message_id)
+
+
+class CheckpointWriter:
+    """
+    НОВОЕ: Пакетная запись точки возобновления вне цикла событий.
+    
+    Файл пишется не после каждого сообщения, а раз в every_messages сообщений,
+    через every_seconds после первого незаписанного или при завершении (close) -
+    что наступит раньше. Запись с fsync выполняется в пуле потоков.
+    
+    Окно повтора: после аварийного завершения (kill -9, сбой питания) файл
+    отстает не более чем на every_messages сообщений и every_seconds секунд.
+    При включенном трекере копировщик возобновляет работу с более поздней из
+    точек файла и трекера, без трекера эти сообщения будут отправлены повторно.
+    
+    НОВОЕ: С хранилищем состояния (StateStore) точка пишется в него, а не в файл.
+    """
+    
+    def __init__(self, filename: str = 'last_message_id.txt', every_messages: int = 20, every_seconds: float = 5.0,
+                 store=None):
+        """
+        Инициализация записи точки возобновления.
+        
+        Args:
+            filename: Имя файла в директории данных
+            every_messages: Записывать не реже чем раз в столько сообщений (1 - после каждого)
+            every_seconds: Максимальная задержка записи незаписанного ID (0 - сразу)
+            store: Хранилище состояния StateStore (None - запись в файл)
+        """
+        self.store = store
+        # Директория данных определяется один раз, а не при каждой записи
+        data_dir = '/app/data' if os.path.exists('/app/data') else '.'
+        os.makedirs(data_dir, exist_ok=True)
+        self.path = os.path.join(data_dir, filename)
+        self.every_messages = max(1, every_messages)
+        self.every_seconds = max(0.0, every_seconds)
+        self.logger = logging.getLogger('telegram_copier.checkpoint')
+        
+        self._pending: Optional[int] = None
+        self._unsaved = 0
+        self._written: Optional[int] = None
+        # Записи из пула потоков и финальная запись при завершении не пересекаются
+        self._write_lock = threading.Lock()
+        self._timer: Optional[asyncio.TimerHandle] = None
+    
+    def update(self, message_id: int) -> None:
+        """
+        Новая точка возобновления (запись на диск - по правилам пакета).
+        
+        Args:
+            message_id: ID последнего обработанного сообщения
+        """
+        self._pending = message_id
+        self._unsaved += 1
+        if self._unsaved >= self.every_messages or not self.every_seconds:
+            self._start_write()
+        elif self._timer is None:
+            try:
+                self._timer = asyncio.get_running_loop().call_later(self.every_seconds, self._start_write)
+            except RuntimeError:
+                self._start_write()
+    
+    def _start_write(self) -> None:
+        """Запуск записи накопленного ID в пуле потоков."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending is None:
+            return
+        message_id, self._pending, self._unsaved = self._pending, None, 0
+        try:
+            asyncio.get_running_loop().run_in_executor(None, self._write, message_id)
+        except RuntimeError:
+            self._write(message_id)
+    
+    def _write(self, message_id: int) -> None:
+        """Запись ID (более старый ID поверх нового не пишется - записи из пула могут прийти не по порядку)."""
+        with self._write_lock:
+            if self._written is not None and message_id <= self._written:
+                return
+            if self.store is not None:
+                try:
+                    self.store.advance_checkpoint(message_id)
+                except Exception as e:
+                    self.logger.error(f"Ошибка сохранения точки возобновления: {e}")
+                    return
+                self._written = message_id
+            elif _write_message_id(self.path, message_id):
+                self._written = message_id
+                self.logger.debug(f"💾 Точка возобновления {message_id} записана")
+    
+    def close(self) -> None:
+        """Синхронная запись незаписанного ID при завершении."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if self._pending is not None:
+            message_id, self._pending, self._unsaved = self._pending, None, 0
+            self._write(message_id)
+
+
+# НОВОЕ: Хранилище состояния (StateStore) копировщика - состояние FloodWait пишется в него,
+# а не в flood_wait_state.json (handle_media_flood_wait не знает о копировщике)
+_state_store = None
+
+
+def set_state_store(store) -> None:
+    """
+    НОВОЕ: Подключение хранилища состояния для записи состояния FloodWait.
+    
+    Args:
+        store: StateStore или None (запись в flood_wait_state.json)
+    """
+    global _state_store
+    _state_store = store
+
 
-def save_flood_wait_state(message_id: Union[int, str], wait_time: int, reason: str) -> None:
+def save_flood_wait_state(message_id: Union[int, List[int]], wait_time: int, reason: str) -> None:
     """
     ИСПРАВЛЕНО: Сохранение состояния при критическом FloodWait для последующего возобновления.
-    Поддерживает как одиночные сообщения (int), так и альбомы (str).
+    Поддерживает как одиночные сообщения (int), так и альбомы (список ID).
     
     Args:
-        message_id: ID сообщения (int) или описание альбома (str), на котором произошел FloodWait
+        message_id: ID сообщения (int) или ID всех сообщений альбома (list), на котором произошел FloodWait
         wait_time: Время ожидания в секундах
         reason: Причина FloodWait
     """
     try:
-        data_dir = '/app/data' if os.path.exists('/app/data') else '.'
-        os.makedirs(data_dir, exist_ok=True)
-        
+        message_ids = sorted(message_id) if isinstance(message_id, (list, tuple)) else [int(message_id)]
         flood_state = {
-            'message_id': message_id,
+            'message_ids': message_ids,
+            # Возобновление с сообщения перед прерванным - оно будет прочитано заново
+            'resume_id': message_ids[0] - 1,
             'wait_time': wait_time,
             'reason': reason,
             'timestamp': time.time(),
             'resume_after': time.time() + wait_time
         }
         
-        state_file = os.path.join(data_dir, 'flood_wait_state.json')
-        with open(state_file, 'w', encoding='utf-8') as f:
-            json.dump(flood_state, f, indent=2)
+        if _state_store is not None:
+            _state_store.commit({'flood_wait': flood_state})
+        else:
+            data_dir = '/app/data' if os.path.exists('/app/data') else '.'
+            os.makedirs(data_dir, exist_ok=True)
+            
+            state_file = os.path.join(data_dir, 'flood_wait_state.json')
+            with open(state_file, 'w', encoding='utf-8') as f:
+                json.dump(flood_state, f, indent=2)
             
         logging.getLogger('telegram_copier').warning(
-            f"💾 Сохранено состояние FloodWait: ID:{message_id}, ожидание:{wait_time}с, возобновить после: {time.strftime('%H:%M:%S', time.localtime(flood_state['resume_after']))}"
+            f"💾 Сохранено состояние FloodWait: ID:{message_ids}, ожидание:{wait_time}с, возобновить после: {time.strftime('%H:%M:%S', time.localtime(flood_state['resume_after']))}"
         )
             
     except Exception as e:
         logging.getLogger('telegram_copier').error(f"Ошибка сохранения состояния FloodWait: {e}")
 
+
+def normalize_flood_wait_state(state: dict) -> Optional[dict]:
+    """
+    НОВОЕ: Приведение состояния FloodWait прежних версий к виду с message_ids и resume_id.
+    Прежние версии хранили ID числом или строкой альбома "Album 12111-12112".
+    
+    Args:
+        state: Состояние FloodWait
+    
+    Returns:
+        Состояние с message_ids и resume_id или None, если ID не разобрать
+    """
+    if 'resume_id' in state:
+        return state
+    message_id = state.get('message_id')
+    try:
+        if isinstance(message_id, str) and message_id.startswith('Album '):
+            message_ids = [int(part) for part in message_id[len('Album '):].split('-')]
+        else:
+            message_ids = [int(message_id)]
+    except (TypeError, ValueError):
+        logging.getLogger('telegram_copier').error(f"❌ Некорректный ID в состоянии FloodWait: '{message_id}'")
+        return None
+    return dict(state, message_ids=message_ids, resume_id=min(message_ids) - 1)
+
+
+def flood_wait_resume_state(state: Optional[dict]) -> Optional[dict]:
+    """
+    НОВОЕ: Проверка срока сохраненного состояния FloodWait.
+    
+    Args:
+        state: Состояние FloodWait (из файла или хранилища) или None
+    
+    Returns:
+        Состояние, если ожидание истекло и можно возобновлять, иначе None
+    """
+    if not state:
+        return None
+    current_time = time.time()
+    if current_time >= state.get('resume_after', 0):
+        # Время ожидания истекло, можно возобновлять
+        state = normalize_flood_wait_state(state)
+        if state:
+            logging.getLogger('telegram_copier').info(
+                f"✅ FloodWait истек, можно возобновить после сообщения ID:{state['resume_id']}"
+            )
+        return state
+    # Все еще нужно ждать
+    remaining = int(state.get('resume_after', 0) - current_time)
+    logging.getLogger('telegram_copier').warning(
+        f"⏳ FloodWait активен, осталось ждать: {remaining}с ({remaining//60}м{remaining%60}с)"
+    )
+    return None
+
+
 def load_flood_wait_state() -> Optional[dict]:
     """
     Загрузка состояния FloodWait для проверки возможности возобновления.
@@ -408,21 +1129,9 @@ def load_flood_wait_state() -> Optional[dict]:
             state = json.load(f)
             
         # Проверяем, не истекло ли время ожидания
-        current_time = time.time()
-        if current_time >= state.get('resume_after', 0):
-            # Время ожидания истекло, можно возобновлять
+        if time.time() >= state.get('resume_after', 0):
             os.remove(state_file)  # Удаляем файл состояния
-            logging.getLogger('telegram_copier').info(
-                f"✅ FloodWait истек, можно возобновить с сообщения ID:{state.get('message_id')}"
-            )
-            return state
-        else:
-            # Все еще нужно ждать
-            remaining = int(state.get('resume_after', 0) - current_time)
-            logging.getLogger('telegram_copier').warning(
-                f"⏳ FloodWait активен, осталось ждать: {remaining}с ({remaining//60}м{remaining%60}с)"
-            )
-            return None
+        return flood_wait_resume_state(state)
             
     except Exception as e:
         logging.getLogger('telegram_copier').error(f"Ошибка загрузки состояния FloodWait: {e}")
@@ -617,19 +1326,75 @@ class ProgressTracker:
         }
 
 
+class BloomFilter:
+    """
+    НОВОЕ: Вероятностный фильтр фиксированного размера.
+    Ответ "нет" точен, ответ "возможно" требует проверки в точном хранилище.
+    """
+    
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.01):
+        """
+        Инициализация фильтра.
+        
+        Args:
+            capacity: Ожидаемое число элементов
+            error_rate: Допустимая доля ложных ответов "возможно" при capacity элементах
+        """
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+    
+    def _positions(self, digest: bytes):
+        """Позиции битов из готового хеша (двойное хеширование - без дополнительных вычислений хеша)."""
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:16], 'little') | 1
+        return ((first + i * step) % self.size for i in range(self.hash_count))
+    
+    def add(self, digest: bytes) -> None:
+        """Добавление элемента по его хешу (не короче 16 байт)."""
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+    
+    def __contains__(self, digest: bytes) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+
 class MessageDeduplicator:
-    """Класс для предотвращения дублирования сообщений при повторных запусках."""
+    """
+    Класс для предотвращения дублирования сообщений при повторных запусках.
+    
+    НОВОЕ: Хеши хранятся в хранилище состояния (SQLite), в памяти - только два
+    фильтра Блума фиксированного размера (текущее и предыдущее поколение).
+    Проверка сообщения - один md5; в хранилище идут только ответы "возможно".
+    Поколение длится половину срока хранения: при смене поколения предыдущий
+    фильтр и его хеши удаляются, поэтому хеш живет от половины до полного срока
+    (повторная отметка продлевает его).
+    """
     
-    def __init__(self, db_file: str = 'processed_messages.json'):
+    def __init__(self, store, db_file: str = 'processed_messages.json', capacity: int = 1_000_000,
+                 max_age_days: float = 30, save_every: int = 10):
         """
         Инициализация дедупликатора.
         
         Args:
-            db_file: Файл для хранения хешей обработанных сообщений
+            store: Хранилище состояния StateStore (точное хранилище хешей)
+            db_file: Файл хешей прежних версий (переносится в хранилище один раз)
+            capacity: Ожидаемое число хешей за поколение (размер фильтров)
+            max_age_days: Срок хранения хешей в днях
+            save_every: Сколько новых хешей накапливать перед записью в хранилище
         """
         self.db_file = db_file
-        self.processed_hashes: Set[str] = set()
+        self.store = store
+        self.capacity = max(1, capacity)
+        self.generation_seconds = max(1.0, max_age_days * 24 * 3600 / 2)
+        self.save_every = max(1, save_every)
         self.logger = logging.getLogger('telegram_copier.deduplicator')
+        
+        self._generation = int(time.time() // self.generation_seconds)
+        self._current = BloomFilter(self.capacity)
+        self._previous = BloomFilter(self.capacity)
+        # Хеши, еще не записанные в хранилище
+        self._unsaved_hashes: Set[str] = set()
         self.load_processed_messages()
     
     def _generate_message_hash(self, message_data: Dict[str, Any]) -> str:
@@ -646,6 +1411,32 @@ class MessageDeduplicator:
         hash_string = f"{message_data.get('text', '')}{message_data.get('media_type', '')}{message_data.get('media_size', 0)}{message_data.get('date', '')}"
         return hashlib.md5(hash_string.encode('utf-8')).hexdigest()
     
+    def _message_hash(self, message) -> str:
+        """Хеш сообщения Telethon."""
+        message_data = {
+            'text': message.message or '',
+            'date': str(message.date) if message.date else '',
+            'media_type': type(message.media).__name__ if message.media else '',
+            'media_size': getattr(message.media.document, 'size', 0) if hasattr(message.media, 'document') else 0
+        }
+        return self._generate_message_hash(message_data)
+    
+    def _rotate(self) -> None:
+        """НОВОЕ: Смена поколения - предыдущий фильтр и его хеши удаляются."""
+        generation = int(time.time() // self.generation_seconds)
+        if generation == self._generation:
+            return
+        if generation == self._generation + 1:
+            self._previous = self._current
+        else:
+            self._previous = BloomFilter(self.capacity)
+        self._current = BloomFilter(self.capacity)
+        self._generation = generation
+        # Незаписанные хеши будут записаны уже с временем нового поколения
+        for message_hash in self._unsaved_hashes:
+            self._current.add(bytes.fromhex(message_hash))
+        self.cleanup_old_hashes()
+    
     def is_message_processed(self, message) -> bool:
         """
         Проверка, было ли сообщение уже обработано.
@@ -657,16 +1448,13 @@ class MessageDeduplicator:
             True если сообщение уже обработано, False иначе
         """
         try:
-            # Подготавливаем данные для хеширования
-            message_data = {
-                'text': message.message or '',
-                'date': str(message.date) if message.date else '',
-                'media_type': type(message.media).__name__ if message.media else '',
-                'media_size': getattr(message.media.document, 'size', 0) if hasattr(message.media, 'document') else 0
-            }
-            
-            message_hash = self._generate_message_hash(message_data)
-            return message_hash in self.processed_hashes
+            self._rotate()
+            message_hash = self._message_hash(message)
+            digest = bytes.fromhex(message_hash)
+            if digest not in self._current and digest not in self._previous:
+                return False
+            # Фильтр ответил "возможно" - проверяем точно
+            return message_hash in self._unsaved_hashes or self.store.has_hash(message_hash)
             
         except Exception as e:
             self.logger.warning(f"Ошибка проверки дедупликации: {e}")
@@ -680,79 +1468,63 @@ class MessageDeduplicator:
             message: Объект сообщения Telethon
         """
         try:
-            message_data = {
-                'text': message.message or '',
-                'date': str(message.date) if message.date else '',
-                'media_type': type(message.media).__name__ if message.media else '',
-                'media_size': getattr(message.media.document, 'size', 0) if hasattr(message.media, 'document') else 0
-            }
-            
-            message_hash = self._generate_message_hash(message_data)
-            self.processed_hashes.add(message_hash)
+            self._rotate()
+            message_hash = self._message_hash(message)
+            self._current.add(bytes.fromhex(message_hash))
+            self._unsaved_hashes.add(message_hash)
             
-            # Сохраняем каждые 10 новых сообщений для производительности
-            if len(self.processed_hashes) % 10 == 0:
+            # Сохраняем каждые save_every новых сообщений для производительности
+            if len(self._unsaved_hashes) >= self.save_every:
                 self.save_processed_messages()
                 
         except Exception as e:
             self.logger.error(f"Ошибка сохранения хеша сообщения: {e}")
     
     def load_processed_messages(self) -> None:
-        """Загрузка списка обработанных сообщений из файла."""
+        """Заполнение фильтров из хранилища (и однократный перенос файла прежних версий)."""
         try:
-            if os.path.exists(self.db_file):
+            if self.db_file and os.path.exists(self.db_file):
                 with open(self.db_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    self.processed_hashes = set(data.get('hashes', []))
-                    self.logger.info(f"Загружено {len(self.processed_hashes)} хешей обработанных сообщений")
-            else:
-                self.logger.info("Файл дедупликации не найден, создаем новый")
+                    legacy_hashes = json.load(f).get('hashes', [])
+                self.store.commit(hashes=legacy_hashes)
+                os.replace(self.db_file, f"{self.db_file}.migrated")
+                self.logger.info(f"Перенесено {len(legacy_hashes)} хешей из {self.db_file}")
+            
+            # Хеши старше предыдущего поколения устарели
+            self.cleanup_old_hashes()
+            boundary = self._generation * self.generation_seconds
+            loaded = 0
+            for message_hash, added in self.store.iter_dedup_hashes():
+                (self._current if added >= boundary else self._previous).add(bytes.fromhex(message_hash))
+                loaded += 1
+            self.logger.info(f"Загружено {loaded} хешей обработанных сообщений")
+            if loaded > self.capacity:
+                self.logger.warning(f"⚠️ Хешей больше емкости фильтра ({self.capacity}) - больше ложных проверок в хранилище")
                 
         except Exception as e:
             self.logger.error(f"Ошибка загрузки данных дедупликации: {e}")
-            self.processed_hashes = set()
     
     def save_processed_messages(self) -> None:
-        """Сохранение списка обработанных сообщений в файл."""
+        """Запись новых хешей в хранилище одной транзакцией."""
+        if not self._unsaved_hashes:
+            return
         try:
-            data = {
-                'hashes': list(self.processed_hashes),
-                'last_updated': time.time()
-            }
-            
-            # Атомарная запись
-            temp_file = f"{self.db_file}.tmp"
-            with open(temp_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-                f.flush()
-                os.fsync(f.fileno())
-            
-            os.replace(temp_file, self.db_file)
-            self.logger.debug(f"Сохранено {len(self.processed_hashes)} хешей")
+            self.store.commit(hashes=self._unsaved_hashes)
+            self.logger.debug(f"Сохранено {len(self._unsaved_hashes)} хешей")
+            self._unsaved_hashes = set()
             
         except Exception as e:
             self.logger.error(f"Ошибка сохранения данных дедупликации: {e}")
     
-    def cleanup_old_hashes(self, max_age_days: int = 30) -> None:
+    def cleanup_old_hashes(self) -> None:
         """
-        Очистка старых хешей для предотвращения бесконечного роста файла.
-        
-        Args:
-            max_age_days: Максимальный возраст хешей в днях
+        НОВОЕ: Удаление из хранилища хешей старше предыдущего поколения.
+        Раньше при устаревании файла удалялись сразу все хеши.
         """
         try:
-            if os.path.exists(self.db_file):
-                with open(self.db_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                last_updated = data.get('last_updated', 0)
-                current_time = time.time()
-                
-                # Если файл старше указанного периода, очищаем его
-                if current_time - last_updated > max_age_days * 24 * 3600:
-                    self.logger.info(f"Очистка старых хешей (старше {max_age_days} дней)")
-                    self.processed_hashes = set()
-                    self.save_processed_messages()
+            removed = self.store.prune_hashes((self._generation - 1) * self.generation_seconds)
+            if removed:
+                self.logger.info(f"Очистка старых хешей: удалено {removed}")
                     
         except Exception as e:
             self.logger.error(f"Ошибка очистки старых хешей: {e}")